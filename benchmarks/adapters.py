@@ -0,0 +1,64 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Micro-benchmarks of the Bedrock model adapters: building a request body from a precompiled template,
+against serializing the whole body for every request, and parsing responses, per model family.
+
+Usage: python -m benchmarks.adapters
+"""
+
+import json
+import timeit
+
+from benchmarks import harness
+from llmops import models
+
+MODEL_IDS = ["anthropic.claude-3-haiku-20240307-v1:0", "meta.llama2-13b-chat-v1", "meta.llama3-8b-instruct-v1:0", "amazon.titan-text-express-v1"]
+NUMBER = 20000
+RESPONSES = {
+    "anthropic": {"content": [{"type": "text", "text": "Answer"}], "stop_reason": "end_turn"},
+    "llama2": {"generation": "Answer", "stop_reason": "stop"},
+    "llama3": {"generation": "Answer", "stop_reason": "stop"},
+    "titan": {"results": [{"outputText": "Answer", "completionReason": "FINISH"}]}
+}
+
+
+def per_request_body(template, prompt):
+    # What each request did before: build, and serialize, the whole body
+    adapter = models.ADAPTERS[template["family"]]
+    body = json.loads(json.dumps(template["params"]))
+    body[adapter["prompt_field"]] = adapter["format_prompt"](template["system"], prompt)
+    return json.dumps(body)
+
+
+if __name__ == "__main__":
+    question = harness.load_questions()[0]["question"]
+    rows = []
+    for model_id in MODEL_IDS:
+        template = models.compile_template(model_id, system=models.DEFAULT_SYSTEM_PROMPT)
+        assert json.loads(models.build_body(template, question)) == json.loads(per_request_body(template, question))
+        response = json.dumps(RESPONSES[template["family"]]).encode("utf-8")
+        rows.append({
+            "family": template["family"],
+            "compile_us": timeit.timeit(lambda: models.compile_template(model_id, system=models.DEFAULT_SYSTEM_PROMPT), number=NUMBER) / NUMBER * 1e6,
+            "per_request_body_us": timeit.timeit(lambda: per_request_body(template, question), number=NUMBER) / NUMBER * 1e6,
+            "template_body_us": timeit.timeit(lambda: models.build_body(template, question), number=NUMBER) / NUMBER * 1e6,
+            "parse_us": timeit.timeit(lambda: template["parse_response"](json.loads(response)), number=NUMBER) / NUMBER * 1e6
+        })
+    harness.print_table(rows, ["family", "compile_us", "per_request_body_us", "template_body_us", "parse_us"])
@@ -0,0 +1,82 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Sweeps the adaptive cut-off of the retrieved candidate passages. Answerable questions measure the
+recall, and context size, of each cut-off, and off-topic questions measure how often the request
+short-circuits to the prompt without context (no passages pass the cut-off).
+
+The defaults (`retrieval.MIN_SIMILARITY`, `RELATIVE_SIMILARITY`, and `ELBOW_GAP`) are calibrated on
+this sweep. Re-run it to re-calibrate them for another embedding model, or corpus.
+
+Usage: python -m benchmarks.adaptive_k
+"""
+
+import json
+
+from benchmarks import harness
+from llmops import ingest, retrieval
+
+OFF_TOPIC_PATH = str(harness.REPO_PATH.joinpath("benchmarks", "data", "off_topic.jsonl"))
+CUTOFFS = [
+    {"min_similarity": 0.0, "relative_similarity": 0.0, "elbow_gap": 0.0},
+    {"min_similarity": 0.2, "relative_similarity": 0.0, "elbow_gap": 0.0},
+    {"min_similarity": 0.3, "relative_similarity": 0.0, "elbow_gap": 0.0},
+    {"min_similarity": 0.32, "relative_similarity": 0.0, "elbow_gap": 0.0},
+    {"min_similarity": 0.35, "relative_similarity": 0.0, "elbow_gap": 0.0},
+    {"min_similarity": 0.0, "relative_similarity": 0.7, "elbow_gap": 0.0},
+    {"min_similarity": 0.0, "relative_similarity": 0.8, "elbow_gap": 0.0},
+    {"min_similarity": 0.0, "relative_similarity": 0.0, "elbow_gap": 0.05},
+    {"min_similarity": 0.0, "relative_similarity": 0.0, "elbow_gap": 0.1},
+    {"min_similarity": 0.2, "relative_similarity": 0.7, "elbow_gap": 0.1},
+    {"min_similarity": 0.32, "relative_similarity": 0.7, "elbow_gap": 0.1},
+    {"min_similarity": 0.35, "relative_similarity": 0.7, "elbow_gap": 0.1}
+]
+
+
+if __name__ == "__main__":
+    questions = harness.load_questions()
+    off_topic = harness.load_questions(OFF_TOPIC_PATH)
+    chunks, parents = ingest.create_chunks(harness.CORPUS_PATH, chunk_size=ingest.CHUNK_SIZE, chunk_overlap=0)
+    index = harness.LocalIndex(harness.FakeEmbedder())
+    index.add(chunks)
+    parent_store = {parent["parent_id"]: parent for parent in parents}
+
+    rows = []
+    for cutoff in CUTOFFS:
+        chosen_k = []
+
+        def retrieve(question):
+            hits = retrieval.cut_hits(index.search(question, retrieval.CANDIDATE_K), **cutoff)
+            chosen_k.append(len(hits))
+            return [context["passage"] for context in retrieval.expand_to_parents(hits, parent_store, retrieval.CONTEXT_TOKEN_BUDGET)]
+
+        result = harness.evaluate(questions, retrieve)
+        answerable_k = list(chosen_k)
+        off_topic_k = [len(retrieval.cut_hits(index.search(question["question"], retrieval.CANDIDATE_K), **cutoff)) for question in off_topic]
+        rows.append({
+            "cutoff": json.dumps(list(cutoff.values())),
+            "recall": result["recall"],
+            "mrr": result["mrr"],
+            "context_tokens": result["context_tokens"],
+            "avg_k": sum(answerable_k) / len(answerable_k),
+            "no_context_answerable": sum(1 for k in answerable_k if not k) / len(answerable_k),
+            "no_context_off_topic": sum(1 for k in off_topic_k if not k) / len(off_topic_k)
+        })
+    print("cutoff: [min_similarity, relative_similarity, elbow_gap]")
+    harness.print_table(rows, ["cutoff", "recall", "mrr", "context_tokens", "avg_k", "no_context_answerable", "no_context_off_topic"])
@@ -0,0 +1,97 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Chunking parameter sweep. Builds a local index of the corpus for every combination of chunk size,
+overlap and parent window size, and reports retrieval quality against a labelled question set,
+together with the index size, embedding call count, and query latency. Runs fully offline, using the
+deterministic fake embedder, so results are reproducible in CI.
+
+Usage: python -m benchmarks.chunking_sweep --chunk-sizes 256,512,1024 --overlaps 0,64 --output sweep.json
+"""
+
+import json
+import argparse
+import itertools
+
+from benchmarks import harness
+from llmops import ingest, retrieval
+
+COLUMNS = [
+    "chunk_size", "overlap", "parent_chunk_size", "passages", "recall", "mrr", "context_tokens",
+    "index_bytes", "embedding_calls", "latency_p50_ms", "latency_p99_ms"
+]
+
+
+def int_list(value: str):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def run_config(corpus: str, questions, chunk_size: int, overlap: int, parent_chunk_size: int, k: int, token_budget: int):
+    embedder = harness.FakeEmbedder()
+    chunks, parents = ingest.create_chunks(
+        corpus,
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        parent_chunk_size=parent_chunk_size
+    )
+    index = harness.LocalIndex(embedder)
+    index.add(chunks)
+    parent_store = {parent["parent_id"]: parent for parent in parents}
+
+    def retrieve(question):
+        hits = index.search(question, k)
+        if not parent_chunk_size:
+            return [hit["_source"]["passage"] for hit in hits]
+        return [context["passage"] for context in retrieval.expand_to_parents(hits, parent_store, token_budget)]
+
+    ingest_calls = embedder.calls
+    result = harness.evaluate(questions, retrieve)
+    return {
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "parent_chunk_size": parent_chunk_size,
+        "passages": len(chunks),
+        "index_bytes": index.index_bytes + sum(len(parent["passage"].encode("utf-8")) for parent in parents),
+        "embedding_calls": ingest_calls,
+        **result
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=harness.CORPUS_PATH)
+    parser.add_argument("--questions", type=str, default=harness.QUESTIONS_PATH)
+    parser.add_argument("--chunk-sizes", type=int_list, default=[256, 512, 1024, 2048])
+    parser.add_argument("--overlaps", type=int_list, default=[0, 64])
+    parser.add_argument("--parent-chunk-sizes", type=int_list, default=[0], help="0 disables parent windows")
+    parser.add_argument("--k", type=int, default=5, help="No. of passages retrieved per question")
+    parser.add_argument("--token-budget", type=int, default=retrieval.CONTEXT_TOKEN_BUDGET, help="Context budget when parent windows are used")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    questions = harness.load_questions(args.questions)
+    rows = []
+    for chunk_size, overlap, parent_chunk_size in itertools.product(args.chunk_sizes, args.overlaps, args.parent_chunk_sizes):
+        if overlap >= chunk_size or (parent_chunk_size and parent_chunk_size <= chunk_size):
+            continue
+        rows.append(run_config(args.corpus, questions, chunk_size, overlap, parent_chunk_size, args.k, args.token_budget))
+    harness.print_table(rows, COLUMNS)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,64 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Compares retrieval restricted to the document a question is about, with the filter applied inside the
+k-NN search, against post-filtering the unrestricted top k, and against not filtering at all.
+
+Usage: python -m benchmarks.filtered_search
+"""
+
+from benchmarks import harness
+from llmops import ingest, retrieval
+
+K = retrieval.CANDIDATE_K
+OVERSAMPLE = 3 # Post-filtering is commonly compensated by retrieving more candidates
+
+
+def run(questions, parent_store, config, search):
+    # `search` maps a question, and the filters restricting it to its document, to the k-NN hits
+    scopes = {question["question"]: {"file_name": question["file_name"]} for question in questions}
+
+    def retrieve(question):
+        hits = search(question, scopes[question])
+        return [context["passage"] for context in retrieval.expand_to_parents(hits, parent_store, retrieval.CONTEXT_TOKEN_BUDGET)]
+
+    hits = [len(search(question, filters)) for question, filters in scopes.items()]
+    return {"config": config, "avg_hits": sum(hits) / len(hits), **harness.evaluate(questions, retrieve)}
+
+
+if __name__ == "__main__":
+    questions = harness.load_questions()
+    embedder = harness.FakeEmbedder()
+    chunks, parents = ingest.create_chunks(harness.CORPUS_PATH, chunk_size=ingest.CHUNK_SIZE, chunk_overlap=0)
+    index = harness.LocalIndex(embedder)
+    index.add(chunks)
+    parent_store = {parent["parent_id"]: parent for parent in parents}
+
+    def post_filter(k):
+        return lambda question, filters: [hit for hit in index.search(question, k) if harness.matches(hit["_source"], filters)][:K]
+
+    rows = [
+        run(questions, parent_store, f"unfiltered, k={K}", lambda question, filters: index.search(question, K)),
+        run(questions, parent_store, f"post-filter, k={K}", post_filter(K)),
+        run(questions, parent_store, f"post-filter, k={K * OVERSAMPLE}", post_filter(K * OVERSAMPLE)),
+        run(questions, parent_store, f"filter in k-NN, k={K}", lambda question, filters: index.search(question, K, filters=filters))
+    ]
+    for scope in sorted({question["file_name"] for question in questions}):
+        print(f"{scope}: {sum(1 for chunk in chunks if chunk['file_name'] == scope)} of {len(chunks)} passages")
+    harness.print_table(rows, ["config", "recall", "mrr", "avg_hits", "context_tokens", "latency_p50_ms", "latency_p99_ms"])
@@ -0,0 +1,166 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Offline retrieval benchmark harness. A deterministic fake embedder, and a brute-force local index,
+stand in for Bedrock and OpenSearch so that retrieval quality can be compared without AWS access.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import pathlib
+import numpy as np
+
+from typing import Dict, List
+
+REPO_PATH = pathlib.Path(__file__).resolve().parent.parent
+CORPUS_PATH = str(REPO_PATH.joinpath("rag-data"))
+QUESTIONS_PATH = str(REPO_PATH.joinpath("benchmarks", "data", "questions.jsonl"))
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(REPO_PATH.joinpath("components", "shared", "runtime", "python")))
+logging.getLogger("llmops").setLevel(logging.WARNING)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "for", "from", "had", "has", "he", "his",
+    "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "to", "was", "what", "when", "where",
+    "which", "who", "with", "you"
+}
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.replace("’", "'").replace("‘", "'").replace("`", "'")).lower()
+
+
+class FakeEmbedder:
+
+    def __init__(self, dimension: int=512) -> None:
+        self.dimension = dimension
+        self.calls = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        # Hashed bag of words: each (non stop-) word adds a signed, log-scaled weight to one dimension
+        self.calls += 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        counts = {}
+        for word in re.findall(r"\w+", normalize(text)):
+            if word not in STOPWORDS:
+                counts[word] = counts.get(word, 0) + 1
+        for word, count in counts.items():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            sign = 1.0 if digest[0] & 1 else -1.0
+            vector[int.from_bytes(digest[1:], "big") % self.dimension] += sign * (1 + np.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class LocalIndex:
+
+    def __init__(self, embedder: FakeEmbedder) -> None:
+        self.embedder = embedder
+        self.sources = []
+        self.vectors = np.zeros((0, embedder.dimension), dtype=np.float32)
+        self.masks = {} # Rows matching each filter, like the filter cache of OpenSearch
+
+    def add(self, chunks: List[Dict]) -> None:
+        self.vectors = np.vstack([self.vectors] + [self.embedder.embed(chunk["passage"])[None, :] for chunk in chunks])
+        self.sources.extend(chunks)
+        self.masks = {}
+
+    @property
+    def index_bytes(self) -> int:
+        # Vector storage, plus the stored source document of every passage
+        return self.vectors.nbytes + sum(len(json.dumps(source).encode("utf-8")) for source in self.sources)
+
+    def search(self, query: str, k: int, filters: Dict=None) -> List[Dict]:
+        # Cosine similarity (vectors are normalized), returned in the shape of OpenSearch hits. Filters
+        # are applied before the top k are selected, like a filter inside the OpenSearch k-NN query.
+        scores = self.vectors @ self.embedder.embed(query)
+        if filters:
+            key = json.dumps(filters, sort_keys=True)
+            if key not in self.masks:
+                self.masks[key] = np.array([matches(source, filters) for source in self.sources])
+            scores = np.where(self.masks[key], scores, -np.inf)
+        top = [i for i in np.argsort(-scores)[:k] if np.isfinite(scores[i])]
+        return [{"_id": str(i), "_score": opensearch_score(float(scores[i])), "_source": self.sources[i]} for i in top]
+
+
+def opensearch_score(dot: float) -> float:
+    # Score of an inner product (faiss) k-NN search in OpenSearch
+    return 1 + dot if dot >= 0 else 1 / (1 - dot)
+
+
+def matches(source: Dict, filters: Dict) -> bool:
+    # Local equivalent of `retrieval.build_filter`: a value, any of a list of values, or a range
+    for field, value in filters.items():
+        if isinstance(value, dict):
+            bounds = {"gt": lambda x, y: x > y, "gte": lambda x, y: x >= y, "lt": lambda x, y: x < y, "lte": lambda x, y: x <= y}
+            if not all(bounds[operator](source.get(field), bound) for operator, bound in value.items()):
+                return False
+        elif str(source.get(field)) not in ([str(item) for item in value] if isinstance(value, list) else [str(value)]):
+            return False
+    return True
+
+
+def load_questions(path: str=QUESTIONS_PATH) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def answer_rank(passages: List[str], answer: str) -> int:
+    # 1-based rank of the first passage containing the labelled answer, 0 when it was not retrieved
+    for rank, passage in enumerate(passages, start=1):
+        if normalize(answer) in normalize(passage):
+            return rank
+    return 0
+
+
+def evaluate(questions: List[Dict], retrieve) -> Dict:
+    # `retrieve` maps a question to the list of context passages that would be sent to the model
+    ranks = []
+    context_tokens = []
+    latencies = []
+    for question in questions:
+        start_time = time.perf_counter()
+        passages = retrieve(question["question"])
+        latencies.append(time.perf_counter() - start_time)
+        ranks.append(answer_rank(passages, question["answer"]))
+        context_tokens.append(sum(len(passage) for passage in passages) / 4)
+    return {
+        "recall": sum(1 for rank in ranks if rank) / len(ranks),
+        "mrr": sum(1 / rank for rank in ranks if rank) / len(ranks),
+        "context_tokens": float(np.mean(context_tokens)),
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000)
+    }
+
+
+def print_table(rows: List[Dict], columns: List[str]) -> None:
+    widths = {column: max(len(column), *(len(format_value(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(format_value(row[column]).ljust(widths[column]) for column in columns))
+
+
+def format_value(value) -> str:
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
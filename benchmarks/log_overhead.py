@@ -0,0 +1,127 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Measures the per-invocation cost of the handlers' logging, before and after `llmops.logs`, on API
+Gateway events of growing size. Each invocation logs the event (at DEBUG), the retrieved passages, and
+the answer, like the RAG API. Records are written to memory, so the table shows the formatting cost,
+and the bytes that CloudWatch Logs would ingest, without any I/O.
+
+Usage: python -m benchmarks.log_overhead [--invocations <n>] [--level INFO|DEBUG]
+"""
+
+import io
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+
+from benchmarks import harness
+from llmops import logs
+
+BODY_SIZES_KB = [1, 64, 1024, 5120] # API Gateway allows payloads up to 10 MB
+PASSAGES = 5
+PASSAGE_CHARS = 2000
+ANSWER_CHARS = 1500
+
+
+def api_event(body_kb: int, rng: random.Random) -> dict:
+    # A proxy integration event, the body carries e.g. an uploaded, base64 encoded, image
+    return {
+        "resource": "/",
+        "path": "/",
+        "httpMethod": "POST",
+        "headers": {"Content-Type": "application/json", "User-Agent": "benchmark"},
+        "requestContext": {"requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef", "stage": "prod"},
+        "body": json.dumps({
+            "question": "Who is Long John Silver?",
+            "image": base64.b64encode(rng.randbytes(body_kb * 768)).decode("utf-8")
+        })
+    }
+
+
+def logger_for(formatter: logging.Formatter, level: str, filters=()) -> tuple:
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter)
+    for log_filter in filters:
+        handler.addFilter(log_filter)
+    logger = logging.getLogger(f"benchmark.{id(stream)}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger, stream
+
+
+def before(logger: logging.Logger, event: dict, passages: list, answer: str) -> None:
+    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
+    logger.info("The following documents were returned from OpenSearch:")
+    for passage in passages:
+        logger.info(f"Score: {passage['score']} | Document: {passage['file_name']} | Passage: {passage['passage']}\n")
+    logger.info(f"Bedrock returned the following answer: {answer}")
+
+
+def after(logger: logging.Logger, event: dict, passages: list, answer: str) -> None:
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    logger.info(
+        "The following documents were returned from OpenSearch: %s",
+        logs.Lazy(lambda: "\n".join(f"Score: {passage['score']} | Document: {passage['file_name']} | Passage: {passage['passage']}" for passage in passages)),
+        extra=logs.VERBOSE
+    )
+    logger.info("Bedrock returned the following answer: %s", answer, extra=logs.VERBOSE)
+
+
+def measure(log, logger: logging.Logger, stream: io.StringIO, events: list, passages: list, answer: str) -> dict:
+    durations, written = [], 0
+    for event in events:
+        start = time.perf_counter()
+        log(logger, event, passages, answer)
+        durations.append(time.perf_counter() - start)
+        written += len(stream.getvalue())
+        stream.seek(0)
+        stream.truncate()
+    return {"ms": 1000 * sum(durations) / len(durations), "log_kb": written / len(events) / 1024}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--level", type=str, default="INFO", choices=["INFO", "DEBUG"])
+    parser.add_argument("--seed", type=int, default=7)
+    args, _ = parser.parse_known_args()
+
+    rng = random.Random(args.seed)
+    passages = [{"score": 0.8, "file_name": "treasure-island.txt", "passage": "x" * PASSAGE_CHARS} for _ in range(PASSAGES)]
+    answer = "y" * ANSWER_CHARS
+    rows = []
+    for body_kb in BODY_SIZES_KB:
+        events = [api_event(body_kb, rng) for _ in range(args.invocations)]
+        old = measure(before, *logger_for(logging.Formatter("%(levelname)s %(message)s"), args.level), events, passages, answer)
+        new = measure(after, *logger_for(logs.JsonFormatter(), args.level, [logs.SampleFilter(random=random.Random(args.seed).random)]), events, passages, answer)
+        rows.append({
+            "body_kb": body_kb,
+            "before_ms": old["ms"],
+            "after_ms": new["ms"],
+            "saved_ms": old["ms"] - new["ms"],
+            "before_log_kb": old["log_kb"],
+            "after_log_kb": new["log_kb"]
+        })
+    print(f"Logging cost per invocation, at {args.level} level, mean of {args.invocations} invocations")
+    harness.print_table(rows, ["body_kb", "before_ms", "after_ms", "saved_ms", "before_log_kb", "after_log_kb"])
@@ -0,0 +1,120 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Simulates the latency-aware model router against static model choices. Each request's latency is
+replayed from a latency distribution per model: recorded samples (seconds), when given as a JSON file
+of `{"<model id>": [<seconds>, ...]}`, e.g. exported from the `ModelLatency` metric, or otherwise
+illustrative log-normal profiles. Halfway through, the fast model degrades for a while, to show how
+the EWMAs route around it, and probe it until it recovers.
+
+Usage: python -m benchmarks.router_simulation [--latencies <path>] [--requests <n>]
+"""
+
+import json
+import random
+import argparse
+import numpy as np
+
+from benchmarks import harness
+from llmops import budget, router
+
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+INSTANT = "anthropic.claude-instant-v1"
+SONNET = "anthropic.claude-3-sonnet-20240229-v1:0"
+# Illustrative (median seconds, log-normal sigma) of a standard length answer, not measurements
+PROFILES = {
+    HAIKU: (1.2, 0.35),
+    INSTANT: (1.8, 0.4),
+    SONNET: (4.0, 0.45)
+}
+LENGTH_FACTORS = {"short": 0.5, "standard": 1.0, "long": 1.8}
+CANNOT_ANSWER_RATE = 0.1 # Share of answers that a tier 1 model cannot give, and escalates
+DEGRADATION = (0.5, 0.7, 4.0) # The fast model is this much slower, between these fractions of the requests
+COMPLEX_QUESTIONS = [
+    "Why did the captain fear the black spot, and what does it tell us about him?",
+    "Compare the characters of Long John Silver and Captain Smollett.",
+    "Explain the reasoning behind the squire's choice of crew, and its implications.",
+    "Evaluate the trade-offs the doctor made when he left the stockade."
+]
+
+
+def sampler(latencies_path, rng):
+    recorded = json.load(open(latencies_path)) if latencies_path else {}
+    def sample(model_id, response_length, degraded):
+        if model_id in recorded:
+            seconds = rng.choice(recorded[model_id])
+        else:
+            median, sigma = PROFILES[model_id]
+            seconds = median * LENGTH_FACTORS[response_length] * rng.lognormvariate(0, sigma)
+        return seconds * (DEGRADATION[2] if degraded and model_id == HAIKU else 1)
+    return sample
+
+
+def simulate(policy, requests, sample, rng):
+    latencies, escalations, strong, degraded_requests, recovered = [], 0, 0, 0, 0
+    for i, question in enumerate(requests):
+        degraded = DEGRADATION[0] * len(requests) <= i < DEGRADATION[1] * len(requests)
+        response_length = budget.classify(question)
+        route = policy.route(question, response_length) if isinstance(policy, router.LatencyRouter) else [policy]
+        total = 0.0
+        for model_id in route:
+            seconds = sample(model_id, response_length, degraded)
+            total += seconds
+            if isinstance(policy, router.LatencyRouter):
+                policy.record(model_id, seconds)
+            degraded_requests += int(degraded and model_id == HAIKU)
+            if router.model_info(model_id)["tier"] > 1 or rng.random() >= CANNOT_ANSWER_RATE:
+                break
+        recovered += int(i >= DEGRADATION[1] * len(requests) and route[0] == HAIKU)
+        escalations += int(model_id != route[0])
+        strong += int(router.model_info(model_id)["tier"] > 1)
+        latencies.append(total)
+    return {
+        "p50_s": float(np.percentile(latencies, 50)),
+        "p90_s": float(np.percentile(latencies, 90)),
+        "p99_s": float(np.percentile(latencies, 99)),
+        "strong_share": strong / len(requests),
+        "escalations": escalations,
+        "degraded_calls": degraded_requests,
+        "fast_share_after": recovered / (len(requests) - int(DEGRADATION[1] * len(requests)))  # Back on the fast model
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencies", type=str, default=None)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    args, _ = parser.parse_known_args()
+
+    questions = [row["question"] for row in harness.load_questions()]
+    questions += [row["question"] for row in harness.load_questions(str(harness.REPO_PATH.joinpath("benchmarks", "data", "off_topic.jsonl")))]
+    questions += COMPLEX_QUESTIONS
+    requests = random.Random(args.seed).choices(questions, k=args.requests)
+    policies = {
+        f"static {SONNET}": SONNET,
+        f"static {INSTANT}": INSTANT,
+        "router (no EWMA)": router.LatencyRouter([INSTANT, HAIKU, SONNET], alpha=0.0, rng=random.Random(args.seed)),
+        "router (EWMA)": router.LatencyRouter([INSTANT, HAIKU, SONNET], rng=random.Random(args.seed))
+    }
+    rows = []
+    for name, policy in policies.items():
+        rng = random.Random(args.seed)
+        rows.append({"policy": name, **simulate(policy, requests, sampler(args.latencies, rng), rng)})
+    harness.print_table(rows, ["policy", "p50_s", "p90_s", "p99_s", "strong_share", "escalations", "degraded_calls", "fast_share_after"])
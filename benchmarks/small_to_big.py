@@ -0,0 +1,71 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Compares the flat 1024 character chunks, previously stored by the ingest script, with small-to-big
+retrieval (small embedded passages, expanded to parent windows under a token budget).
+
+Usage: python -m benchmarks.small_to_big
+"""
+
+from benchmarks import harness
+from llmops import ingest, retrieval
+
+FLAT_K = 5 # Top-k previously used by the RAG API
+CHILD_K = retrieval.CANDIDATE_K
+
+
+def flat(chunk_size: int, questions):
+    embedder = harness.FakeEmbedder()
+    chunks, _ = ingest.create_chunks(harness.CORPUS_PATH, chunk_size=chunk_size, chunk_overlap=0, parent_chunk_size=0)
+    index = harness.LocalIndex(embedder)
+    index.add(chunks)
+    result = harness.evaluate(questions, lambda question: [hit["_source"]["passage"] for hit in index.search(question, FLAT_K)])
+    return {"config": f"flat {chunk_size}, k={FLAT_K}", "embedding_calls": embedder.calls, "index_bytes": index.index_bytes, **result}
+
+
+def small_to_big(chunk_size: int, parent_chunk_size: int, token_budget: int, questions):
+    embedder = harness.FakeEmbedder()
+    chunks, parents = ingest.create_chunks(harness.CORPUS_PATH, chunk_size=chunk_size, chunk_overlap=0, parent_chunk_size=parent_chunk_size)
+    index = harness.LocalIndex(embedder)
+    index.add(chunks)
+    parent_store = {parent["parent_id"]: parent for parent in parents}
+
+    def retrieve(question):
+        hits = index.search(question, CHILD_K)
+        return [context["passage"] for context in retrieval.expand_to_parents(hits, parent_store, token_budget)]
+
+    result = harness.evaluate(questions, retrieve)
+    return {
+        "config": f"small-to-big {chunk_size}/{parent_chunk_size}, k={CHILD_K}, budget={token_budget}",
+        "embedding_calls": embedder.calls,
+        "index_bytes": index.index_bytes + sum(len(parent["passage"].encode("utf-8")) for parent in parents),
+        **result
+    }
+
+
+if __name__ == "__main__":
+    questions = harness.load_questions()
+    rows = [
+        flat(1024, questions),
+        small_to_big(256, 1024, 500, questions),
+        small_to_big(256, 1024, 750, questions),
+        small_to_big(256, 1024, 1000, questions),
+        small_to_big(512, 2048, 1000, questions)
+    ]
+    harness.print_table(rows, ["config", "recall", "mrr", "context_tokens", "embedding_calls", "index_bytes", "latency_p50_ms"])
@@ -0,0 +1,60 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_dynamodb as _dynamodb,
+    aws_lambda as _lambda
+)
+from constructs import Construct
+
+class AdmissionControl(Construct):
+
+    def __init__(self, scope: Construct, id: str) -> None:
+        super().__init__(scope, id)
+
+        # Token buckets of each limited model, shared by all function instances
+        self.table = _dynamodb.Table(
+            self,
+            "TokenBucketTable",
+            partition_key=_dynamodb.Attribute(
+                name="bucket",
+                type=_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=cdk.RemovalPolicy.DESTROY
+        )
+
+    @staticmethod
+    def attach(function: _lambda.Function) -> None:
+        # Limit the function's Bedrock calls to the model quotas, if any are configured, using the
+        # stack-wide token bucket table, created the first time a function is attached
+        limits = function.node.try_get_context("toolchain-context").get("bedrock-model-limits") or {}
+        if not limits:
+            return
+        stack = cdk.Stack.of(function)
+        admission_control = stack.node.try_find_child("AdmissionControl")
+        if admission_control is None:
+            admission_control = AdmissionControl(stack, "AdmissionControl")
+        function.add_environment("ADMISSION_LIMITS", json.dumps(limits))
+        function.add_environment("ADMISSION_TABLE", admission_control.table.table_name)
+        admission_control.table.grant_read_write_data(function)
@@ -0,0 +1,91 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import constants
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_cloudwatch as _cloudwatch
+)
+from typing import List
+from constructs import Construct
+
+# Latency percentiles charted for each stage
+PERCENTILES = ["p50", "p90", "p99"]
+
+class Dashboard(Construct):
+
+    def __init__(self, scope: Construct, id: str, apis: List[str]) -> None:
+        super().__init__(scope, id)
+
+        # Chart the stages (e.g. embedding, search, and generation) of each API, from the metrics its Lambda
+        # Functions emit in CloudWatch Embedded Metric Format, under the `<workload>/<api>` namespace
+        self.dashboard = _cloudwatch.Dashboard(
+            self,
+            "StageDashboard",
+            dashboard_name=f"{cdk.Stack.of(self).stack_name}-Stages",
+            default_interval=cdk.Duration.hours(3)
+        )
+        for api in apis:
+            self.dashboard.add_widgets(
+                *[
+                    Dashboard.search_widget(
+                        title=f"{api} latency {percentile} per stage (ms)",
+                        query=Dashboard.query(api, ["Stage"], "Latency"),
+                        statistic=percentile
+                    ) for percentile in PERCENTILES
+                ]
+            )
+            self.dashboard.add_widgets(
+                Dashboard.search_widget(
+                    title=f"{api} latency p90 per stage, cold and warm starts (ms)",
+                    query=Dashboard.query(api, ["ColdStart", "Stage"], "Latency"),
+                    statistic="p90"
+                ),
+                Dashboard.search_widget(
+                    title=f"{api} cache hit rate per stage",
+                    query=Dashboard.query(api, ["Stage"], "CacheHit"),
+                    statistic="Average"
+                ),
+                Dashboard.search_widget(
+                    title=f"{api} output tokens per model",
+                    query=Dashboard.query(api, ["ModelId", "Stage"], "OutputTokens"),
+                    statistic="Sum"
+                )
+            )
+
+    @staticmethod
+    def query(api: str, dimensions: List[str], metric_name: str) -> str:
+        # Matches every stage, so that new stages are charted without changing the dashboard
+        return f'{{"{constants.WORKLOAD_NAME}/{api}",{",".join(dimensions)}}} MetricName="{metric_name}"'
+
+    @staticmethod
+    def search_widget(title: str, query: str, statistic: str) -> _cloudwatch.GraphWidget:
+        return _cloudwatch.GraphWidget(
+            title=title,
+            left=[
+                _cloudwatch.MathExpression(
+                    expression=f"SEARCH('{query}', '{statistic}', 300)",
+                    using_metrics={},
+                    label="",
+                    period=cdk.Duration.minutes(5)
+                )
+            ],
+            width=8
+        )
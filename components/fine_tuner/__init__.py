@@ -24,6 +24,7 @@ from aws_cdk import (
     aws_lambda as _lambda
 )
 from constructs import Construct
+from components.shared import SharedLayer
 
 class FineTuner(Construct):
 
@@ -104,6 +105,7 @@ class FineTuner(Construct):
             ),
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             role=tuning_handler_role,
             memory_size=512,
             timeout=cdk.Duration.seconds(60)
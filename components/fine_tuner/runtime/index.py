@@ -18,24 +18,22 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import os
-import json
 import boto3
-import logging
 
 from typing import Dict, Any
 from botocore.exceptions import ClientError
 from botocore.config import Config
+from llmops import logs
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 bedrock_role = os.environ["BEDROCK_ROLE"]
 sm_client = boto3.client("sagemaker")
 bedrock_client = boto3.client("bedrock")
 runtime_client = boto3.client("bedrock-runtime")
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event, indent=2)}")
+    logger.info("Received event: %s", logs.lazy_json(event))
     if ("status" in event):
         status = event["status"]
     else:
@@ -114,7 +112,7 @@ def finalize(event: Dict) -> Dict:
     try:
         # Get tuning job data
         bedrock_response = bedrock_client.get_model_customization_job(jobIdentifier=event.get("jobName"))
-        logger.info(f"Tuning job details: {bedrock_response}")
+        logger.info("Tuning job details: %s", logs.lazy_json(bedrock_response))
         
         if event["status"] == "Completed":
             # Update callback status to the SageMaker Pipeline
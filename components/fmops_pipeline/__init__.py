@@ -34,6 +34,7 @@ from aws_cdk import (
 from components.fmops_pipeline.pipeline import get_sagemaker_pipeline
 from botocore.exceptions import ClientError
 from constructs import Construct
+from components.shared import SharedLayer
 
 class Pipeline(Construct):
 
@@ -102,6 +103,7 @@ class Pipeline(Construct):
             runtime=_lambda.Runtime.PYTHON_3_12,
             code=_lambda.Code.from_asset(str(pathlib.Path(__file__).parent.joinpath("start_pipeline_lambda").resolve())),
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             timeout=cdk.Duration.seconds(60),
             environment={
                 "PIPELINE_NAME": fmops_workflow.ref
@@ -143,6 +145,7 @@ class Pipeline(Construct):
                 )
             ),
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             timeout=cdk.Duration.seconds(60)
         )
         self.deploy_model_function.add_to_role_policy(
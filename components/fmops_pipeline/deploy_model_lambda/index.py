@@ -19,18 +19,16 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
 import boto3
-import json
-import logging
 
 from typing import Any
 from botocore.exceptions import ClientError
+from llmops import logs
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event, indent=2)}")
+    logger.info("Received event: %s", logs.lazy_json(event))
     """
     NOTE: The following code is specific to the workshop where there is no enforcing 
     the workshop attendee to puschase, and configure provisioned throughput.
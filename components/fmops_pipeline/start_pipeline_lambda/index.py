@@ -19,19 +19,17 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
 import boto3
-import json
 import time
-import logging
 
 from botocore.exceptions import ClientError
+from llmops import logs
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 sm_client = boto3.client("sagemaker")
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
+    logger.debug("Received event: %s", logs.lazy_json(event))
     logger.info("Starting SageMaker Pipeline Execution ...")
     try:
         response = sm_client.start_pipeline_execution(
@@ -24,9 +24,17 @@ import aws_cdk as cdk
 from aws_cdk import (
     aws_iam as _iam,
     aws_lambda as _lambda,
-    aws_apigateway as _apigw
+    aws_lambda_event_sources as _event_sources,
+    aws_apigateway as _apigw,
+    aws_dynamodb as _dynamodb,
+    aws_s3 as _s3,
+    aws_sqs as _sqs
 )
 from constructs import Construct
+from components.admission_control import AdmissionControl
+from components.image_cache import ImageCache
+from components.response_cache import ResponseCache
+from components.shared import SharedLayer
 
 class ImageApi(Construct):
 
@@ -58,7 +66,8 @@ class ImageApi(Construct):
                         ],
                         effect=_iam.Effect.ALLOW,
                         resources=[
-                            f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{context.get('bedrock-image-model-id')}"
+                            # Any region, as calls are spread across the configured regions
+                            f"arn:aws:bedrock:*::foundation-model/{context.get('bedrock-image-model-id')}"
                         ]
                     )
                 ]
@@ -66,25 +75,132 @@ class ImageApi(Construct):
         )
 
         # Create Lambda Functions for the text2text API
+        code = _lambda.Code.from_asset(
+            path=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
+            bundling=cdk.BundlingOptions(
+                image=_lambda.Runtime.PYTHON_3_12.bundling_image,
+                command=[
+                    "bash", "-c", "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                ]
+            )
+        )
         self.image_handler = _lambda.Function(
             self,
             "ImageHandler",
-            code=_lambda.Code.from_asset(
-                path=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
-                bundling=cdk.BundlingOptions(
-                    image=_lambda.Runtime.PYTHON_3_12.bundling_image,
-                    command=[
-                        "bash", "-c", "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
-                    ]
-                )
-            ),
+            code=code,
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             role=role,
             memory_size=512,
-            timeout=cdk.Duration.seconds(300)
+            timeout=cdk.Duration.seconds(300),
+            environment={
+                # Regions to spread Bedrock calls across, besides the stack's region
+                "BEDROCK_REGIONS": context.get("bedrock-regions"),
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/Image-API"
+            }
         )
 
+        # Create a worker Lambda Function for asynchronous image jobs, which are not bound by the
+        # API Gateway integration timeout
+        self.job_worker = _lambda.Function(
+            self,
+            "ImageJobWorker",
+            code=code,
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="index.worker_handler",
+            layers=[SharedLayer.of(self)],
+            role=role,
+            memory_size=512,
+            timeout=cdk.Duration.seconds(300),
+            environment={
+                "IMAGE_MODEL_ID": context.get("bedrock-image-model-id"),
+                "BEDROCK_REGIONS": context.get("bedrock-regions"),
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/Image-API"
+            }
+        )
+
+        # Jobs, and their results, shared by the API, and the worker
+        self.job_table = _dynamodb.Table(
+            self,
+            "ImageJobTable",
+            partition_key=_dynamodb.Attribute(
+                name="job_id",
+                type=_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=cdk.RemovalPolicy.DESTROY
+        )
+
+        # Queue the jobs for the worker, jobs that keep failing (e.g. throttled) end up in the dead-letter queue
+        self.job_queue = _sqs.Queue(
+            self,
+            "ImageJobQueue",
+            visibility_timeout=cdk.Duration.seconds(1800),  # Six times the worker timeout, as recommended for Lambda
+            enforce_ssl=True,
+            dead_letter_queue=_sqs.DeadLetterQueue(
+                max_receive_count=3,
+                queue=_sqs.Queue(
+                    self,
+                    "ImageJobDeadLetterQueue",
+                    enforce_ssl=True,
+                    retention_period=cdk.Duration.days(4)
+                )
+            )
+        )
+        self.job_worker.add_event_source(
+            _event_sources.SqsEventSource(
+                self.job_queue,
+                batch_size=1
+            )
+        )
+
+        # Return images as presigned URLs of this bucket, rather than base64 strings, when requested.
+        # The URLs expire within the hour, so the images are kept for a day
+        self.output_bucket = _s3.Bucket(
+            self,
+            "ImageOutputBucket",
+            block_public_access=_s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=_s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            lifecycle_rules=[
+                _s3.LifecycleRule(
+                    id="ExpireImageOutputs",
+                    expiration=cdk.Duration.days(1)
+                )
+            ],
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            auto_delete_objects=True
+        )
+
+        # Cache the generated images in S3, unless the maximum age is zero
+        max_age_days = int(context.get("image-cache-max-age-days") or 0)
+        if max_age_days:
+            self.image_cache = ImageCache(
+                self,
+                "ImageCache",
+                max_age_days=max_age_days,
+                max_size_gb=float(context.get("image-cache-max-size-gb"))
+            )
+
+        for function in [self.image_handler, self.job_worker]:
+            function.add_environment("IMAGE_OUTPUT_BUCKET", self.output_bucket.bucket_name)
+            self.output_bucket.grant_read_write(function)
+            function.add_environment("JOB_TABLE", self.job_table.table_name)
+            function.add_environment("JOB_QUEUE_URL", self.job_queue.queue_url)
+            self.job_table.grant_read_write_data(function)
+
+            # Limit Bedrock calls to the model quotas
+            AdmissionControl.attach(function)
+
+            if max_age_days:
+                self.image_cache.attach(function)
+
+                # Coalesce identical requests in flight on the image's key in the shared response cache
+                ResponseCache.attach(function)
+        self.job_queue.grant_send_messages(self.image_handler)
+
         # Create the API Gateway 
         self.image_apigw = _apigw.LambdaRestApi(
             self,
@@ -18,57 +18,231 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import os
+import re
 import json
+import time
 import boto3
-import logging
+import random
 
-from typing import Dict
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from botocore.config import Config
+from botocore.exceptions import ClientError
+from llmops import admission, cache, clients, deadline, image_cache, image_output, jobs, logs, metrics
 
 # Environmental parameters
 IMAGE_MODEL_ID = os.environ["IMAGE_MODEL_ID"]
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "Image-API")
+JOB_PATH = re.compile(r"/jobs/([0-9a-f]{32})/?$")
+JOB_FIELDS = ["prompt", "style", "quality", "seed", "samples", "seed_strategy", "format", "thumbnail"] # Request fields kept by a job
+JOB_TIMEOUT = 300.0 # Seconds, the worker timeout
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 cfg_scale = 5 # How strictly the diffusion process adheres to the prompt text
-seed = 0 # Random seed omitted
-steps = 70 # No. of diffusion steps
+seed = 0 # Default random seed, a request can set another one
+max_seed = 4294967295
+max_samples = 4 # Most images per request, generated concurrently
+seed_strategies = ["sequential", "random"] # Seeds of the samples: the seed, and the ones after it, or random ones
+default_seed_strategy = "sequential"
+default_quality = "final"
+# Quality tiers, from a fast draft to the final render. The tiers share the sampler, and resolution, so
+# that refining a draft (the same request, and seed, at a higher tier) keeps the draft's composition.
+# SDXL only generates a few resolutions of about one megapixel, so the tiers differ in their steps
+quality_tiers = {
+    "draft": {"steps": 20, "width": 1024, "height": 1024, "sampler": "K_DPMPP_2M"},
+    "standard": {"steps": 40, "width": 1024, "height": 1024, "sampler": "K_DPMPP_2M"},
+    "final": {"steps": 70, "width": 1024, "height": 1024, "sampler": "K_DPMPP_2M"}
+}
+min_steps = 30 # Fewest diffusion steps that still give a usable image, unless the tier has fewer
+seconds_per_step = 0.2 # Rough diffusion speed, used to fit the steps to the time left
 negative_prompts = [
     "poorly rendered",
     "poor background details",
     "poorly drawn images",
     "disfigured features"
 ]
-bedrock_client = boto3.client("bedrock-runtime")
+bedrock_client = clients.from_env() # Spreads calls across the configured regions
+admission_controller = admission.from_env() # Limits Bedrock calls to the model quotas, when configured
+response_cache = cache.from_env() # Answers identical requests from the shared cache, when enabled
+outputs = image_output.from_env() # Returns images as presigned S3 URLs, when requested
+image_jobs = jobs.from_env() # Generates images asynchronously, when requested
+# SDXL on Bedrock generates a single image per call, so the samples of a request are generated by
+# concurrent calls, within the admission control quotas
+sample_executor = ThreadPoolExecutor(max_workers=max_samples)
+# Seeded images are cached in S3, under a key version that changes with the model, or these defaults
+images = image_cache.from_env(
+    IMAGE_MODEL_ID,
+    defaults={
+        "cfg_scale": cfg_scale,
+        "quality_tiers": quality_tiers,
+        "negative_prompts": negative_prompts
+    }
+)
 
 def lambda_handler(event, context): 
-    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    if event.get("httpMethod") == "GET":
+        return get_job(event, request_deadline=deadline.Deadline.from_context(context))
+    request_metrics = metrics.RequestMetrics(METRICS_NAMESPACE, cold_start=metrics.cold_start())
     body = json.loads(event["body"])
     validate_response = validate_inputs(body)
     if validate_response:
         return validate_response
-    prompt = body["prompt"]
-    style = body["style"]
-    logger.info(f"Prompt: {prompt}")
-    response = get_prediction(prompt, style)
-    return build_response(
-        {
-            "response": response
+    logger.info(f"Prompt: {body['prompt']}")
+    if body.get("async"):
+        return submit_job(body)
+    try:
+        response = render(body, request_deadline=deadline.Deadline.from_context(context), request_metrics=request_metrics)
+    except deadline.DeadlineExceeded as e:
+        return build_deadline_response(e)
+    except (admission.Throttled, ClientError) as e:
+        throttled_response = build_throttled_response(e)
+        if throttled_response is None:
+            raise
+        return throttled_response
+    finally:
+        request_metrics.emit()
+    return build_response(response)
+
+
+def worker_handler(event, context):
+    # Runs the queued image jobs, without the API Gateway integration timeout. Throttled jobs are
+    # raised, so that the queue delivers them again, after the visibility timeout
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    cold_start = metrics.cold_start()
+    for record in event["Records"]:
+        request_metrics = metrics.RequestMetrics(METRICS_NAMESPACE, cold_start=cold_start)
+        try:
+            image_jobs.run(
+                json.loads(record["body"])["job_id"],
+                lambda request: render(request, request_deadline=deadline.Deadline.from_context(context, limit=JOB_TIMEOUT), request_metrics=request_metrics),
+                retryable=lambda error: admission.retry_after(error) is not None
+            )
+        finally:
+            request_metrics.emit()
+
+
+def render(body: Dict, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    # The quality tier, and seeds, are returned, so that a draft can be refined with the same seed
+    quality = body.get("quality", default_quality)
+    image_seeds = sample_seeds(body.get("seed", seed), body.get("samples", 1), body.get("seed_strategy", default_seed_strategy))
+    if len(image_seeds) == 1:
+        return {**render_sample(body, quality, image_seeds[0], request_deadline, request_metrics), "quality": quality}
+    # The samples are generated at the same time, so the request takes about as long as a single image
+    samples = list(sample_executor.map(lambda image_seed: render_sample(body, quality, image_seed, request_deadline, request_metrics), image_seeds))
+    return {
+        **samples[0],
+        "quality": quality,
+        "samples": samples
+    }
+
+
+def render_sample(body: Dict, quality: str, image_seed: int, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    image = get_prediction(body["prompt"], body["style"], quality=quality, image_seed=image_seed, request_deadline=request_deadline, request_metrics=request_metrics)
+    if body.get("output", "base64") == "url":
+        # The image is fetched from S3, instead of being carried in the JSON response
+        with metrics.stage(request_metrics, "output") as stage:
+            stored = outputs.store(image, output_format=body.get("format", "png"), thumbnail=bool(body.get("thumbnail")))
+            stage.add(Bytes=sum(output["bytes"] for output in stored.values()))
+        return {
+            "response": stored["image"]["url"],
+            **stored,
+            "seed": image_seed
         }
-    )
+    return {
+        "response": image,
+        "seed": image_seed
+    }
+
+
+def sample_seeds(image_seed: int, samples: int, strategy: str=default_seed_strategy) -> List[int]:
+    # Sequential seeds make the samples of a request repeatable, and cacheable, like a single image
+    if strategy == "random":
+        return [random.randint(0, max_seed) for _ in range(samples)]
+    return [(image_seed + sample) % (max_seed + 1) for sample in range(samples)]
+
+
+def submit_job(body: Dict) -> Dict:
+    # Job results are stored, so they are always returned as URLs
+    job = image_jobs.submit({**{name: body[name] for name in JOB_FIELDS if name in body}, "output": "url"})
+    return build_response(jobs.view(job), status_code=202, headers={"Location": f"jobs/{job['job_id']}"})
 
 
-def build_response(body: Dict) -> Dict:
+def get_job(event: Dict, request_deadline: Optional[deadline.Deadline]=None) -> Dict:
+    # GET /jobs/{id} returns the job, and its result once it succeeded. With `?wait=<seconds>`, the
+    # request waits for the job to complete, for as long as the time left allows
+    match = JOB_PATH.search(event.get("path", ""))
+    job = image_jobs.get(match.group(1), wait=job_wait(event, request_deadline)) if match and image_jobs else None
+    if job is None:
+        return build_response(
+            {
+                "status": "error",
+                "message": "Job not found"
+            },
+            status_code=404
+        )
+    if job["status"] == jobs.SUCCEEDED:
+        # The stored URLs may have expired since the job completed
+        job["result"] = refresh_result(job["result"])
+    return build_response(jobs.view(job))
+
+
+def refresh_result(result: Dict) -> Dict:
+    stored = outputs.refresh({name: result[name] for name in ["image", "thumbnail"] if name in result})
+    refreshed = {**result, "response": stored["image"]["url"], **stored}
+    if "samples" in result:
+        refreshed["samples"] = [refresh_result(sample) for sample in result["samples"]]
+    return refreshed
+
+
+def job_wait(event: Dict, request_deadline: Optional[deadline.Deadline]=None) -> float:
+    try:
+        wait = float((event.get("queryStringParameters") or {}).get("wait", 0))
+    except ValueError:
+        wait = 0.0
+    return min(wait, request_deadline.remaining() - deadline.RESPONSE_MARGIN) if request_deadline else wait
+
+
+def build_response(body: Dict, status_code: int=200, headers: Optional[Dict]=None) -> Dict:
     return {
-        "statusCode": 200,
+        "statusCode": status_code,
         "headers": {
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            **(headers or {})
         },
         "body": json.dumps(body)
     }
 
 
+def build_deadline_response(error: deadline.DeadlineExceeded) -> Dict:
+    # Answer before API Gateway times out, instead of running on with no one waiting for the response
+    logger.warning(str(error))
+    return build_response(
+        {
+            "status": "error",
+            "message": "The image could not be generated in time, please try again"
+        },
+        status_code=504
+    )
+
+
+def build_throttled_response(error: Exception) -> Optional[Dict]:
+    # A fast 429 for a shed, or throttled request, rather than holding it until the client gives up
+    seconds = admission.retry_after(error)
+    if seconds is None:
+        return None
+    logger.warning(str(error))
+    return build_response(
+        {
+            "status": "error",
+            "message": f"Too many requests, please retry after {seconds} seconds"
+        },
+        status_code=429,
+        headers={"Retry-After": str(seconds)}
+    )
+
+
 def validate_inputs(body: Dict):
     for input_name in ["prompt", "style"]:
         if input_name not in body:
@@ -78,39 +252,204 @@ def validate_inputs(body: Dict):
                     "message": f"{input_name} missing in payload"
                 }
             )
-
-
-def get_prediction(prompt: str, style: str) -> str:
-    logger.info(f"Sending prompt to Bedrock ... ")
-    response = bedrock_client.invoke_model(
-        body=json.dumps(
+    if body.get("async") and image_jobs is None:
+        return build_response(
+            {
+                "status": "error",
+                "message": "async jobs are not configured"
+            }
+        )
+    if body.get("async") and body.get("output") == "base64":
+        return build_response(
+            {
+                "status": "error",
+                "message": "async jobs return url output"
+            }
+        )
+    output = body.get("output", "url" if body.get("async") else "base64")
+    if output not in image_output.OUTPUT_MODES:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"output must be one of: {image_output.OUTPUT_MODES}"
+            }
+        )
+    if output == "url" and outputs is None:
+        return build_response(
+            {
+                "status": "error",
+                "message": "url output is not configured"
+            }
+        )
+    if output == "base64" and ("format" in body or "thumbnail" in body):
+        # The base64 output stays a PNG, as existing clients expect
+        return build_response(
+            {
+                "status": "error",
+                "message": "format and thumbnail require url output"
+            }
+        )
+    if body.get("quality", default_quality) not in quality_tiers:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"quality must be one of: {list(quality_tiers)}"
+            }
+        )
+    image_seed = body.get("seed", seed)
+    if not isinstance(image_seed, int) or isinstance(image_seed, bool) or not 0 <= image_seed <= max_seed:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"seed must be an integer from 0 to {max_seed}"
+            }
+        )
+    samples = body.get("samples", 1)
+    if not isinstance(samples, int) or isinstance(samples, bool) or not 1 <= samples <= max_samples:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"samples must be an integer from 1 to {max_samples}"
+            }
+        )
+    if output == "base64" and samples > 1:
+        # Several base64 images would exceed the Lambda response payload limit
+        return build_response(
             {
-                "text_prompts": (
-                    [
-                        {
-                            "text": prompt,
-                            "weight": 1.0
-                        }
-                    ]
-                    + [
-                        {
-                            "text": negative_prompt,
-                            "weight": -1.0
-                        } for negative_prompt in negative_prompts
-                    ]
-                ),
-                "cfg_scale": cfg_scale,
-                "seed": seed,
-                "steps": steps,
-                "style_preset": style
+                "status": "error",
+                "message": "samples above 1 require url output"
             }
+        )
+    if body.get("seed_strategy", default_seed_strategy) not in seed_strategies:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"seed_strategy must be one of: {seed_strategies}"
+            }
+        )
+    if body.get("seed_strategy") == "random" and "seed" in body:
+        return build_response(
+            {
+                "status": "error",
+                "message": "seed requires the sequential seed_strategy"
+            }
+        )
+    if body.get("format", "png") not in image_output.OUTPUT_FORMATS:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"format must be one of: {list(image_output.OUTPUT_FORMATS)}"
+            }
+        )
+
+
+def fit_steps(tier_steps: int, request_deadline: Optional[deadline.Deadline]) -> int:
+    # Fewer diffusion steps, down to a minimum, when there is not enough time left for all of them
+    if request_deadline is None:
+        return tier_steps
+    fitted = min(tier_steps, int((request_deadline.remaining() - deadline.FIRST_TOKEN_SECONDS) / seconds_per_step))
+    if fitted < min(min_steps, tier_steps):
+        raise deadline.DeadlineExceeded("image generation", request_deadline.remaining())
+    return fitted
+
+
+def get_prediction(prompt: str, style: str, quality: str=default_quality, image_seed: int=seed, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> str:
+    tier = quality_tiers[quality]
+    request = {
+        "text_prompts": (
+            [
+                {
+                    "text": prompt,
+                    "weight": 1.0
+                }
+            ]
+            + [
+                {
+                    "text": negative_prompt,
+                    "weight": -1.0
+                } for negative_prompt in negative_prompts
+            ]
         ),
-        modelId=IMAGE_MODEL_ID,
-        contentType="application/json",
-        accept="application/json"
+        "cfg_scale": cfg_scale,
+        "seed": image_seed,
+        "steps": tier["steps"],
+        "width": tier["width"],
+        "height": tier["height"],
+        "sampler": tier["sampler"],
+        "style_preset": style
+    }
+    # With a given seed, generation is deterministic, so identical requests are answered from the
+    # image cache, under the steps of their tier (before the steps are fitted to the time left)
+    if images:
+        with metrics.stage(request_metrics, "image_cache") as stage:
+            image = images.get(request)
+            stage.add(CacheHit=int(image is not None))
+        if image is not None:
+            logger.info(f"Image cache hit: {images.object_key(request)}")
+            return image
+    steps = fit_steps(tier["steps"], request_deadline)
+    if images is None:
+        # A base64 image is larger than a response cache item, so without the image cache there is
+        # nothing to share between identical requests
+        return generate_image({**request, "steps": steps}, quality, request_deadline, request_metrics)["image"]
+    if steps < tier["steps"]:
+        # An image with fewer steps than its tier is neither cached, nor shared, so that identical
+        # requests with the time for all the steps are not answered with it
+        return generate_image({**request, "steps": steps}, quality, request_deadline, request_metrics, cache_image=False)["image"]
+    # Identical requests in flight are coalesced on the image's S3 key: one request generates the
+    # image, the others wait for its key in the response cache, and read the image from S3
+    generated = {}
+    def compute() -> Dict:
+        generated.update(generate_image(request, quality, request_deadline, request_metrics))
+        return {"key": generated["key"]}
+    located = cache.get_or_compute(
+        response_cache,
+        cache.request_key([IMAGE_MODEL_ID], request),
+        compute,
+        cacheable=lambda located: located["key"] is not None,
+        request_deadline=request_deadline,
+        request_metrics=request_metrics
     )
-    response_body = json.loads(response.get("body").read())
-    logger.info(response_body)
-    image = response_body["artifacts"][0].get("base64")
-    logger.info(f"Bedrock returned the following base64 image array: {image}")
+    if generated:
+        return generated["image"]
+    image = images.load(located["key"])
+    if image is None:
+        # Evicted since its key was cached
+        return generate_image(request, quality, request_deadline, request_metrics)["image"]
     return image
+
+
+def generate_image(request: Dict, quality: str=default_quality, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None, cache_image: bool=True) -> Dict:
+    admission.admit(admission_controller, IMAGE_MODEL_ID)
+    logger.info(f"Sending prompt to Bedrock ({quality} quality, {request['steps']} steps) ... ")
+    start = time.perf_counter()
+    with metrics.stage(request_metrics, "generation", model_id=IMAGE_MODEL_ID) as stage:
+        response = clients.with_timeout(bedrock_client, deadline.timeout(request_deadline)).invoke_model(
+            body=json.dumps(request),
+            modelId=IMAGE_MODEL_ID,
+            contentType="application/json",
+            accept="application/json"
+        )
+        body = response.get("body").read()
+        stage.add(Bytes=len(body))
+    response_body = json.loads(body)
+    latency = time.perf_counter() - start
+    # Latency per quality tier, and per step, to tune the tiers, and `seconds_per_step`, from data
+    values = {
+        "GenerationLatency": latency,
+        "Steps": request["steps"],
+        "SecondsPerStep": latency / request["steps"]
+    }
+    metrics.emit(
+        metrics.emf_record(
+            namespace=METRICS_NAMESPACE,
+            dimensions={"ModelId": IMAGE_MODEL_ID, "Quality": quality},
+            values=values,
+            units={"GenerationLatency": "Seconds", "Steps": "Count", "SecondsPerStep": "Seconds"}
+        )
+    )
+    artifact = response_body["artifacts"][0]
+    image = artifact.get("base64")
+    # The image itself is not logged, only its size
+    logger.info(f"Bedrock returned a base64 image of {len(image)} characters (seed: {artifact.get('seed')}, finish reason: {artifact.get('finishReason')})")
+    return {"image": image, "key": images.put(request, image) if images and cache_image else None}
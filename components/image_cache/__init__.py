@@ -0,0 +1,94 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pathlib
+import constants
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_events as _events,
+    aws_events_targets as _targets,
+    aws_lambda as _lambda,
+    aws_s3 as _s3
+)
+from constructs import Construct
+from components.shared import SharedLayer
+
+class ImageCache(Construct):
+
+    def __init__(self, scope: Construct, id: str, max_age_days: int, max_size_gb: float) -> None:
+
+        super().__init__(scope, id)
+
+        # Generated images, keyed by the hash of their generation request, and expired by age
+        self.bucket = _s3.Bucket(
+            self,
+            "ImageCacheBucket",
+            block_public_access=_s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=_s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            lifecycle_rules=[
+                _s3.LifecycleRule(
+                    id="ExpireCachedImages",
+                    expiration=cdk.Duration.days(max_age_days)
+                )
+            ],
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            auto_delete_objects=True
+        )
+
+        # Create a Lambda function to evict the oldest images, once the cache exceeds its maximum size
+        self.eviction_function = _lambda.Function(
+            self,
+            "EvictionFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            code=_lambda.Code.from_asset(
+                path=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
+                bundling=cdk.BundlingOptions(
+                    image=_lambda.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash", "-c", "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
+            handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
+            timeout=cdk.Duration.seconds(300),
+            environment={
+                "IMAGE_CACHE_BUCKET": self.bucket.bucket_name,
+                "IMAGE_CACHE_MAX_BYTES": str(int(max_size_gb * 1024 ** 3)),
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/Image-API"
+            }
+        )
+        self.bucket.grant_read(self.eviction_function)
+        self.bucket.grant_delete(self.eviction_function)
+
+        _events.Rule(
+            self,
+            "EvictionSchedule",
+            description="Rule to evict the oldest generated images from the image cache, on a schedule.",
+            schedule=_events.Schedule.rate(cdk.Duration.days(1)),
+            targets=[
+                _targets.LambdaFunction(self.eviction_function)
+            ]
+        )
+
+    def attach(self, function: _lambda.Function) -> None:
+        function.add_environment("IMAGE_CACHE_BUCKET", self.bucket.bucket_name)
+        self.bucket.grant_read_write(function)
@@ -0,0 +1,52 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import json
+import boto3
+
+from llmops import image_cache, logs, metrics
+
+# Environmental parameters
+IMAGE_CACHE_BUCKET = os.environ["IMAGE_CACHE_BUCKET"]
+IMAGE_CACHE_MAX_BYTES = int(os.environ["IMAGE_CACHE_MAX_BYTES"])
+METRICS_NAMESPACE = os.environ["METRICS_NAMESPACE"]
+
+# Global parameters
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
+s3_client = boto3.client("s3")
+
+def lambda_handler(event, context):
+    # Invoked on a schedule, to keep the image cache within its maximum size
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    result = image_cache.evict(client=s3_client, bucket=IMAGE_CACHE_BUCKET, max_bytes=IMAGE_CACHE_MAX_BYTES)
+    logger.info("Image cache eviction: %s", logs.lazy_json(result))
+    metrics.emit(
+        metrics.emf_record(
+            namespace=METRICS_NAMESPACE,
+            dimensions={"Cache": "Image"},
+            values={
+                "CachedImages": result["objects"],
+                "CacheSize": result["bytes"],
+                "EvictedImages": result["evicted_objects"]
+            },
+            units={"CachedImages": "Count", "CacheSize": "Bytes", "EvictedImages": "Count"}
+        )
+    )
+    return result
@@ -0,0 +1,94 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pathlib
+import constants
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_events as _events,
+    aws_events_targets as _targets,
+    aws_lambda as _lambda,
+    aws_secretsmanager as _secrets
+)
+from constructs import Construct
+from components.shared import SharedLayer
+
+class IndexReadiness(Construct):
+
+    def __init__(self, scope: Construct, id: str, endpoint: str, secret: _secrets.ISecret, index: str, ingest_job_name: str) -> None:
+
+        super().__init__(scope, id)
+
+        # Create a Lambda function to warm up the k-NN graphs, and report their readiness as metrics
+        self.readiness_function = _lambda.Function(
+            self,
+            "ReadinessFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            code=_lambda.Code.from_asset(
+                path=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
+                bundling=cdk.BundlingOptions(
+                    image=_lambda.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash", "-c", "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
+            handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
+            timeout=cdk.Duration.seconds(300),
+            environment={
+                "OPENSEARCH_ENDPOINT": endpoint,
+                "OPENSEARCH_SECRET": secret.secret_name,
+                "OPENSEARCH_INDEX": index,
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/RAG-Index"
+            }
+        )
+        secret.grant_read(self.readiness_function)
+
+        # Re-load graphs evicted from memory (e.g. after a domain restart, or a blue/green update)
+        _events.Rule(
+            self,
+            "ReadinessSchedule",
+            description="Rule to warm up the RAG k-NN index, and report its readiness, on a schedule.",
+            schedule=_events.Schedule.rate(cdk.Duration.minutes(15)),
+            targets=[
+                _targets.LambdaFunction(self.readiness_function)
+            ]
+        )
+
+        # Warm up the index as soon as a data ingest processing job completes
+        _events.Rule(
+            self,
+            "IngestCompletedRule",
+            description="Rule to warm up the RAG k-NN index when a data ingest processing job completes.",
+            event_pattern=_events.EventPattern(
+                detail_type=["SageMaker Processing Job State Change"],
+                source=["aws.sagemaker"],
+                detail={
+                    "ProcessingJobName": _events.Match.prefix(ingest_job_name),
+                    "ProcessingJobStatus": [
+                        "Completed"
+                    ]
+                }
+            ),
+            targets=[
+                _targets.LambdaFunction(self.readiness_function)
+            ]
+        )
@@ -0,0 +1,66 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import json
+
+from botocore.exceptions import ClientError
+from llmops import ingest, logs, metrics, readiness
+
+# Environmental parameters
+OPENSEARCH_ENDPOINT = os.environ["OPENSEARCH_ENDPOINT"]
+OPENSEARCH_SECRET = os.environ["OPENSEARCH_SECRET"]
+OPENSEARCH_INDEX = os.environ["OPENSEARCH_INDEX"]
+METRICS_NAMESPACE = os.environ["METRICS_NAMESPACE"]
+
+# Global parameters
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
+
+def lambda_handler(event, context):
+    # Invoked on a schedule, and when a data ingest processing job completes
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
+    try:
+        username, password = ingest.get_credentials(OPENSEARCH_SECRET, region)
+    except ClientError as e:
+        message = e.response["Error"]["Message"]
+        raise Exception(message)
+    endpoint = ingest.get_domain_url(OPENSEARCH_ENDPOINT)
+    status = readiness.check(endpoint=endpoint, index=OPENSEARCH_INDEX, username=username, password=password)
+    if status["index_exists"] and not status["ready"]:
+        # The graphs are not (or no longer) in memory, so they are loaded before queries need them
+        readiness.warmup(endpoint=endpoint, index=OPENSEARCH_INDEX, username=username, password=password)
+        status = readiness.check(endpoint=endpoint, index=OPENSEARCH_INDEX, username=username, password=password)
+    logger.info("Index readiness: %s", logs.lazy_json(status))
+    values = {
+        "Ready": int(status["ready"]),
+        "GraphMemoryUsage": status.get("graph_memory_usage_kb", 0),
+        "GraphMemoryUsagePercentage": status.get("graph_memory_usage_percentage", 0.0)
+    }
+    if status.get("cache_hit_rate") is not None:
+        values["CacheHitRate"] = status["cache_hit_rate"] * 100
+    metrics.emit(
+        metrics.emf_record(
+            namespace=METRICS_NAMESPACE,
+            dimensions={"Index": OPENSEARCH_INDEX},
+            values=values,
+            units={"Ready": "Count", "GraphMemoryUsage": "Kilobytes", "GraphMemoryUsagePercentage": "Percent", "CacheHitRate": "Percent"}
+        )
+    )
+    return status
@@ -27,6 +27,9 @@ from aws_cdk import (
     aws_apigateway as _apigw
 )
 from constructs import Construct
+from components.admission_control import AdmissionControl
+from components.response_cache import ResponseCache
+from components.shared import SharedLayer
 
 class RagApi(Construct):
 
@@ -78,11 +81,36 @@ class RagApi(Construct):
             ),
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             role=role,
             memory_size=512,
-            timeout=cdk.Duration.seconds(300)
+            timeout=cdk.Duration.seconds(300),
+            environment={
+                # Queries must be embedded with the same configuration as the ingested documents
+                "EMBEDDING_DIMENSION": context.get("bedrock-embedding-dimension"),
+                # Adaptive cut-off of the retrieved passages
+                "RETRIEVAL_MIN_SIMILARITY": context.get("retrieval-min-similarity"),
+                "RETRIEVAL_RELATIVE_SIMILARITY": context.get("retrieval-relative-similarity"),
+                "RETRIEVAL_ELBOW_GAP": context.get("retrieval-elbow-gap"),
+                # Regions to spread Bedrock calls across, besides the stack's region
+                "BEDROCK_REGIONS": context.get("bedrock-regions"),
+                # Models to route questions to, besides the text model
+                "ROUTER_MODEL_IDS": context.get("bedrock-router-model-ids"),
+                "ROUTER_ESCALATE": context.get("bedrock-router-escalate"),
+                # Hedging of slow Bedrock calls, disabled with a zero budget
+                "HEDGE_BUDGET_PERCENT": context.get("bedrock-hedge-budget-percent"),
+                "HEDGE_PERCENTILE": context.get("bedrock-hedge-percentile"),
+                "HEDGE_REGION": context.get("bedrock-hedge-region"),
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/RAG-API"
+            }
         )
 
+        # Limit Bedrock calls to the model quotas
+        AdmissionControl.attach(self.rag_handler)
+
+        # Answer identical requests from the shared response cache
+        ResponseCache.attach(self.rag_handler)
+
         # Create the API Gateway
         self.rag_apigw = _apigw.LambdaRestApi(
             self,
@@ -18,53 +18,192 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 import os
 import json
+import time
 import boto3
-import logging
 import requests
 
 from typing import Optional, Dict, List, Tuple, Any
 from botocore.config import Config
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError
 from requests.auth import HTTPBasicAuth
+from llmops import admission, budget, cache, clients, deadline, embeddings, hedging, logs, metrics, models, readiness, retrieval, router
 
 # Environmental parameters
 TEXT_MODEL_ID = os.environ["TEXT_MODEL_ID"]
-EMBEDDING_MODEL_ID = os.environ["EMBEDDING_MODEL_ID"]
+EMBEDDING_CONFIG = embeddings.config_from_env()
 OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT", None)
 OPENSEARCH_SECRET = os.getenv("OPENSEARCH_SECRET", None)
 OPENSEARCH_INDEX = os.getenv("OPENSEARCH_INDEX", None)
+RETRIEVAL_CUTOFF = retrieval.cutoff_from_env()
+RETRIEVAL_TIMEOUT = 5.0 # Upper bound (seconds) of each call to retrieve the RAG context
+GENERATION_RESERVE = 5.0 # Seconds of a request kept for the generation, retrieval is skipped without more time
+GENERATION_TTL = 30 # Seconds between checks of the index generation, which is part of the response cache key
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "RAG-API")
+RAG_INSTRUCTIONS = """I'm going to give you a document. Then I'm going to ask you a question about it. I'd like you to first write down exact quotes of parts of the document that would help answer the question, and then I'd like you to answer the question using facts from the quoted content.
+
+First, find the quotes from the document that are most relevant to answering the question, and then print them in numbered order. Quotes should be relatively short.
+
+If there are no relevant quotes, write "No relevant quotes" instead.
+
+Then, answer the question, starting with "Answer:". Unless you are aksed to quote the document, do not include or reference quoted content verbatim in the answer. Don't say "According to Quote [1]" when answering. Instead make references to quotes relevant to each section of the answer solely by adding their bracketed numbers at the end of relevant sentences.
+
+Thus, the format of your overall response should look like what's shown between the <example></example> tags. Make sure to follow the formatting, spacing and line breaking exactly.
+
+<example>
+Relevant quotes:\n
+[1] "Company X reported revenue of $12 million in 2021."\n
+[2] "Almost 90% of revene came from widget sales, with gadget sales making up the remaining 10%."\n
+
+Answer:\n
+Company X earned $12 million. [1]  Almost 90% of it was from widget sales. [2]
+</example>
+
+If the question cannot be answered by the document, say so.
+
+Answer the question immediately without preamble."""
+# Worked examples of the response format, sent with the instructions. Besides showing the model how to
+# quote, and when there is nothing to quote, they make the static prefix long enough to be cached
+RAG_EXAMPLES = """Here are two worked examples, each with a document, a question, and the response to it.
+
+<examples>
+<example>
+<document>
+Northwind Outdoor Gear, Annual Report 2022
+
+Northwind Outdoor Gear designs and sells equipment for hiking, climbing, and camping. The company sells through its own online store, through 140 partner retailers in North America, and, since March 2022, through 35 partner retailers in Europe.
+
+Revenue for the year was $48.2 million, up 14% from $42.3 million in 2021. Online sales grew fastest, by 23%, and made up 41% of revenue. Sales through partner retailers grew by 9%. European retailers contributed $3.1 million in their first ten months.
+
+Tents and sleeping bags remained the largest product category, at 38% of revenue. The climbing category grew by 31%, helped by the launch of the Summit harness line in May. Footwear sales declined by 4%, as the company discontinued two older boot models.
+
+Gross margin improved from 44% to 47%, mainly because more of the sales were made online. Operating expenses rose by 11%, to $15.9 million, including $1.2 million spent on opening the European distribution center in Rotterdam.
+
+In 2023, the company plans to add 20 European partner retailers, and to introduce a repair service for tents and backpacks, which it expects to extend the life of its products, and to bring customers back to its stores.
+</document>
+
+<question>How did the European expansion affect Northwind's results in 2022?</question>
+
+<response>
+Relevant quotes:
+[1] "European retailers contributed $3.1 million in their first ten months."
+[2] "including $1.2 million spent on opening the European distribution center in Rotterdam."
+[3] "In 2023, the company plans to add 20 European partner retailers"
+
+Answer:
+The European partner retailers, which Northwind started selling through in March 2022, added $3.1 million of revenue in 2022. [1] The expansion also cost $1.2 million, for the new distribution center in Rotterdam, which is part of the higher operating expenses. [2] The company plans to grow the European network further in 2023. [3]
+</response>
+</example>
+
+<example>
+<document>
+Harbor Street Library, Visitor Guide
+
+The library is open from 9 am to 8 pm on weekdays, and from 10 am to 5 pm on Saturdays. It is closed on Sundays, and on public holidays. Library cards are free for residents of the city, and can be requested at the front desk, with a proof of address.
+
+Card holders can borrow up to 15 items at a time. Books can be borrowed for three weeks, and films, and music, for one week. Items can be renewed twice, online or at the front desk, unless another card holder has reserved them.
+
+The second floor has 40 study desks, and six group rooms, which can be booked for up to two hours a day. The children's section, on the ground floor, hosts story time every Wednesday, and Saturday morning.
+</document>
+
+<question>How much does it cost to print a page at the library?</question>
+
+<response>
+Relevant quotes:
+No relevant quotes
+
+Answer:
+The document does not say whether the library offers printing, or what it costs, so the question cannot be answered from it.
+</response>
+</example>
+</examples>"""
+QUOTE_TOKENS = 512 # Output budget for the quotes, written before the answer
+LEGACY_MAX_TOKENS = {"anthropic": 8192} # Worst-case budget that every RAG request used to be given, with Claude
+MODEL_ROUTER = router.from_env(TEXT_MODEL_ID) # Latency EWMAs are kept per container
+# The instructions, and examples, are a cached system prompt, for models that support prompt caching.
+# At ~1,150 tokens, they pass the minimum cached prefix of most of them (1,024 tokens, 2,048 for Haiku)
+RAG_TEMPLATES = {model_id: budget.compile_templates(model_id, system=f"{RAG_INSTRUCTIONS}\n\n{RAG_EXAMPLES}", extra_tokens=QUOTE_TOKENS, cache_system=True) for model_id in MODEL_ROUTER.model_ids}
+TEXT_TEMPLATES = {model_id: budget.compile_templates(model_id, system=models.DEFAULT_SYSTEM_PROMPT) for model_id in MODEL_ROUTER.model_ids}
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
-bedrock_client = boto3.client("bedrock-runtime")
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
+bedrock_client = clients.from_env() # Spreads calls across the configured regions
+hedger = hedging.from_env(bedrock_client) # Hedges slow Bedrock calls, when enabled
+admission_controller = admission.from_env() # Limits Bedrock calls to the model quotas, when configured
+response_cache = cache.from_env() # Answers identical questions from the shared cache, when enabled
+embedding_mismatch = None # Checked once per container, against the index mapping
+index_ready = False # Checked until the index is ready, once per container
+index_generation = None # Changes with each ingest
+logger.info("RAG instructions prompt caching: %s", logs.lazy_json({model_id: templates["standard"]["prompt_cache"] for model_id, templates in RAG_TEMPLATES.items()}))
 
 def lambda_handler(event, context): 
-    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    request_metrics = metrics.RequestMetrics(METRICS_NAMESPACE, cold_start=metrics.cold_start())
+    if event.get("httpMethod") == "GET" and event.get("path", "").rstrip("/").endswith("/ready"):
+        return get_readiness()
     body = json.loads(event["body"])
     validate_response = validate_inputs(body)
     if validate_response:
         return validate_response
     question = body["question"]
-    logger.info(f"Question: {question}")
-    response = get_prediction(
-        question=question
-    )
+    response_length = budget.classify(question, hint=body.get("response_length"))
+    logger.info(f"Question: {question} (response length: {response_length})")
+    try:
+        prediction = get_prediction(
+            question=question,
+            filters=body.get("filters"),
+            response_length=response_length,
+            continuation=(body.get("continue_from") or "").rstrip() or None,
+            request_deadline=deadline.Deadline.from_context(context),
+            request_metrics=request_metrics
+        )
+    except deadline.DeadlineExceeded as e:
+        return build_deadline_response(e)
+    except (admission.Throttled, ClientError) as e:
+        throttled_response = build_throttled_response(e)
+        if throttled_response is None:
+            raise
+        return throttled_response
+    finally:
+        request_metrics.emit()
+    return build_response(prediction)
+
+
+def build_response(body: Dict, status_code: int=200, headers: Optional[Dict]=None) -> Dict:
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            **(headers or {})
+        },
+        "body": json.dumps(body)
+    }
+
+def build_deadline_response(error: deadline.DeadlineExceeded) -> Dict:
+    # Answer before API Gateway times out, instead of running on with no one waiting for the response
+    logger.warning(str(error))
     return build_response(
         {
-            "response": response
-        }
+            "status": "error",
+            "message": "The question could not be answered in time, please try again"
+        },
+        status_code=504
     )
 
 
-def build_response(body: Dict) -> Dict:
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json"
+def build_throttled_response(error: Exception) -> Optional[Dict]:
+    # A fast 429 for a shed, or throttled request, rather than holding it until the client gives up
+    seconds = admission.retry_after(error)
+    if seconds is None:
+        return None
+    logger.warning(str(error))
+    return build_response(
+        {
+            "status": "error",
+            "message": f"Too many requests, please retry after {seconds} seconds"
         },
-        "body": json.dumps(body)
-    }
+        status_code=429,
+        headers={"Retry-After": str(seconds)}
+    )
 
 
 def validate_inputs(body: Dict):
@@ -76,12 +215,44 @@ def validate_inputs(body: Dict):
                     "message": f"{input_name} missing in request payload"
                 }
             )
+    if body.get("response_length") not in [None, *budget.RESPONSE_LENGTHS]:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"response_length must be one of: {list(budget.RESPONSE_LENGTHS)}"
+            }
+        )
+    try:
+        retrieval.build_filter(body.get("filters"))
+    except ValueError as e:
+        return build_response(
+            {
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
+
+def get_readiness() -> Dict:
+    # Readiness probe (GET /ready), for clients, and system tests, to check before sending traffic
+    region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
+    domain_endpoint = f"https://{OPENSEARCH_ENDPOINT}" if not OPENSEARCH_ENDPOINT.startswith("https://") else OPENSEARCH_ENDPOINT
+    username, password = get_credentials(OPENSEARCH_SECRET, region)
+    status = readiness.check(endpoint=domain_endpoint, index=OPENSEARCH_INDEX, username=username, password=password)
+    return build_response(status, status_code=200 if status["ready"] else 503)
+
+
+def retrieval_timeout(request_deadline: Optional[deadline.Deadline]) -> float:
+    # Retrieval calls may use the time left, except the time kept for the generation
+    return deadline.stage_timeout(request_deadline, "retrieval", cap=RETRIEVAL_TIMEOUT, reserve=GENERATION_RESERVE)
 
 
-def verify_index(endpoint: str, index: str, username: str, password: str) -> Any:
-    url = f"{endpoint}/{index}"
-    response = requests.head(url, auth=HTTPBasicAuth(username, password))
-    if response.status_code != 200:
+def verify_index(endpoint: str, index: str, username: str, password: str, timeout: Optional[float]=None) -> Any:
+    global index_ready
+    if index_ready:
+        return None
+    status = readiness.check(endpoint=endpoint, index=index, username=username, password=password, timeout=timeout)
+    if not status["index_exists"]:
         logger.info("Embedding index unavailable. RAG data ingest required.")
         return build_response(
             {
@@ -89,10 +260,19 @@ def verify_index(endpoint: str, index: str, username: str, password: str) -> Any
                 "message": "The vector store is not hydrated. Please contact your System Administrator to ingest RAG data."
             }
         )
-
-
-def get_credentials(secret_id: str, region: str) -> str:
-    client = boto3.client("secretsmanager", region_name=region)
+    if not status["ready"]:
+        # Load the k-NN graphs once, instead of by the (slow) first searches
+        logger.info(f"Embedding index graphs are not loaded, warming up: {json.dumps(status)}")
+        try:
+            readiness.warmup(endpoint=endpoint, index=index, username=username, password=password, timeout=timeout)
+        except requests.exceptions.Timeout:
+            logger.info("Embedding index warmup continues on the domain, searching meanwhile")
+    index_ready = True
+
+
+def get_credentials(secret_id: str, region: str, timeout: Optional[float]=None) -> str:
+    config = Config(connect_timeout=timeout, read_timeout=timeout, retries={"total_max_attempts": 1}) if timeout else None
+    client = boto3.client("secretsmanager", region_name=region, config=config)
     try:
         response = client.get_secret_value(SecretId=secret_id)
         json_body = json.loads(response["SecretString"])
@@ -108,23 +288,34 @@ def get_credentials(secret_id: str, region: str) -> str:
         )
 
 
-def get_embedding(passage: str) -> List[float]:
-    body = json.dumps(
-        {
-            "inputText": f"{passage}"
-        }
-    )
-    try:
-        request = bedrock_client.invoke_model(
-            body=body,
-            modelId=EMBEDDING_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
+def verify_embedding_config(endpoint: str, index: str, username: str, password: str, timeout: Optional[float]=None) -> Any:
+    global embedding_mismatch
+    if embedding_mismatch is None:
+        embedding_mismatch = embeddings.check_index(
+            endpoint=endpoint,
+            index=index,
+            config=EMBEDDING_CONFIG,
+            username=username,
+            password=password,
+            timeout=timeout
+        ) or ""
+    if embedding_mismatch:
+        logger.error(f"Embedding configuration mismatch: {embedding_mismatch}")
+        return build_response(
+            {
+                "status": "error",
+                "message": f"The vector store was built with a different embedding configuration. {embedding_mismatch}. Please re-ingest the RAG data."
+            }
         )
-        response = json.loads(request.get("body").read())
-        embedding = response.get("embedding")
-        return embedding
+
+
+def get_embedding(passage: str, timeout: Optional[float]=None) -> List[float]:
+    try:
+        admission.admit(admission_controller, EMBEDDING_CONFIG["model_id"], retrieval.estimate_tokens(passage))
+        return hedging.call(hedger, bedrock_client, "embed", lambda client: embeddings.get_embedding(client=clients.with_timeout(client, timeout), text=passage, config=EMBEDDING_CONFIG))
     except ClientError as e:
+        if admission.retry_after(e) is not None:
+            raise  # Answered with a 429 by the handler
         message = e.response["Error"]["Message"]
         logger.error(message)
         return build_response(
@@ -135,111 +326,216 @@ def get_embedding(passage: str) -> List[float]:
         )
 
 
-def get_hits(query: str, url: str, username: str, password: str) -> List[dict]:
-    k = 5  # Retrieve top 5 matching context from search
+def get_hits(query: str, url: str, username: str, password: str, filters: Optional[Dict]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> List[dict]:
+    k = retrieval.CANDIDATE_K  # Retrieve the top matching child passages from search
+    with metrics.stage(request_metrics, "embedding", model_id=EMBEDDING_CONFIG["model_id"]) as stage:
+        vector = get_embedding(query, timeout=retrieval_timeout(request_deadline))
+        stage.add(InputTokens=retrieval.estimate_tokens(query))
     search_query = {
         "size": k,
         "query": {
             "knn": {
                 "vector_field": { # k-NN vector field
-                    "vector": get_embedding(query),
+                    "vector": vector,
                     "k": k
                 }
             }
         }
     }
-    response = requests.post(
-        url=url,
-        auth=HTTPBasicAuth(username, password),
-        json=search_query
-    ).json()
-    hits = response["hits"]["hits"]
-    return hits
-
-
-def get_prediction(question: str) -> str:
-    region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-    domain_endpoint = f"https://{OPENSEARCH_ENDPOINT}" if not OPENSEARCH_ENDPOINT.startswith("https://") else OPENSEARCH_ENDPOINT
-    logger.info(f"Retrieving OpenSearch credentials ...")
-    username, password = get_credentials(OPENSEARCH_SECRET, region)
-    logger.info("Verifying embedding index exists ...")
-    verify_response = verify_index(endpoint=domain_endpoint, index=OPENSEARCH_INDEX, username=username, password=password)
-    if verify_response:
-        return verify_response
-    search_url = f"{domain_endpoint}/{OPENSEARCH_INDEX}/_search"
-    
-    logger.info(f"Embedding index exists, retrieving query hits from OpenSearch endpoint: {search_url}")
-    hits = get_hits(query=question, url=search_url, username=username, password=password)
-    
-    logger.info("The following documents were returned from OpenSearch:")
-    for hit in hits:
-        logging.info(f"Score: {hit['_score']} | Document: {hit['_source']['file_name']} | Passage: {hit['_source']['passage']}\n")
-    
-    logger.info(f"Sending prompt to Bedrock (Using OpenSearch context) ...")
-    context = "\n".join([hit["_source"]["passage"] for hit in hits])
-
-    logger.info(f"Bedrock model Id: {TEXT_MODEL_ID}")
-
-    if TEXT_MODEL_ID == "anthropic.claude-3-sonnet-20240229-v1:0" or TEXT_MODEL_ID == "anthropic.claude-3-haiku-20240307-v1:0" or TEXT_MODEL_ID == "anthropic.claude-instant-v1":
-        answer = invoke_anthropic_model(question=question, context=context)
-    else:
-        logger.info(f"Model is not supported: {TEXT_MODEL_ID}")
-        answer = build_response(
-            {
-                "status": "error",
-                "message": f"Model is not supported: {TEXT_MODEL_ID}"
-            }
+    search_filter = retrieval.build_filter(filters)
+    if search_filter:
+        # Filtering inside the k-NN query returns the top k matching passages, where a post-filter
+        # would discard non-matching passages from the top k, and return fewer (or no) hits
+        search_query["query"]["knn"]["vector_field"]["filter"] = search_filter
+    with metrics.stage(request_metrics, "search") as stage:
+        response = requests.post(
+            url=url,
+            auth=HTTPBasicAuth(username, password),
+            json=search_query,
+            timeout=retrieval_timeout(request_deadline)
         )
+        stage.add(Bytes=len(response.content))
+    hits = response.json()["hits"]["hits"]
+    return hits
 
-    logger.info(f"Bedrock returned the following answer: {answer}")
-    return answer
-
-def invoke_anthropic_model(question: str, context: str) -> Any:
-    prompt = f"""I'm going to give you a document. Then I'm going to ask you a question about it. I'd like you to first write down exact quotes of parts of the document that would help answer the question, and then I'd like you to answer the question using facts from the quoted content. Here is the document:
-
-    <document>
-    {context}
-    </document>
-
-    First, find the quotes from the document that are most relevant to answering the question, and then print them in numbered order. Quotes should be relatively short.
-
-    If there are no relevant quotes, write "No relevant quotes" instead.
-
-    Then, answer the question, starting with "Answer:". Unless you are aksed to quote the document, do not include or reference quoted content verbatim in the answer. Don't say "According to Quote [1]" when answering. Instead make references to quotes relevant to each section of the answer solely by adding their bracketed numbers at the end of relevant sentences.
 
-    Thus, the format of your overall response should look like what's shown between the <example></example> tags. Make sure to follow the formatting, spacing and line breaking exactly.
+def get_index_generation(connection: Dict, request_deadline: Optional[deadline.Deadline]=None) -> Optional[str]:
+    # Checked at most every GENERATION_TTL seconds per container, so that cached responses of an
+    # older index generation stop being used shortly after a re-ingest
+    global index_generation
+    if index_generation is None or time.time() - index_generation["checked_at"] > GENERATION_TTL:
+        index_generation = {
+            "value": readiness.generation(index=OPENSEARCH_INDEX, timeout=retrieval_timeout(request_deadline), **connection),
+            "checked_at": time.time()
+        }
+    return index_generation["value"]
 
-    <example>
-    Relevant quotes:\n
-    [1] "Company X reported revenue of $12 million in 2021."\n
-    [2] "Almost 90% of revene came from widget sales, with gadget sales making up the remaining 10%."\n
 
-    Answer:\n
-    Company X earned $12 million. [1]  Almost 90% of it was from widget sales. [2]
-    </example>
+def get_prediction(question: str, filters: Optional[Dict]=None, response_length: str="standard", continuation: Optional[str]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    connection, generation = None, None
+    try:
+        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
+        domain_endpoint = f"https://{OPENSEARCH_ENDPOINT}" if not OPENSEARCH_ENDPOINT.startswith("https://") else OPENSEARCH_ENDPOINT
+        logger.info(f"Retrieving OpenSearch credentials ...")
+        with metrics.stage(request_metrics, "secret"):
+            username, password = get_credentials(OPENSEARCH_SECRET, region, timeout=retrieval_timeout(request_deadline))
+        logger.info("Verifying embedding index exists ...")
+        with metrics.stage(request_metrics, "index"):
+            verify_response = verify_index(endpoint=domain_endpoint, index=OPENSEARCH_INDEX, username=username, password=password, timeout=retrieval_timeout(request_deadline))
+            if verify_response:
+                return {"response": verify_response}
+            verify_response = verify_embedding_config(endpoint=domain_endpoint, index=OPENSEARCH_INDEX, username=username, password=password, timeout=retrieval_timeout(request_deadline))
+            if verify_response:
+                return {"response": verify_response}
+            connection = {"endpoint": domain_endpoint, "username": username, "password": password}
+            generation = get_index_generation(connection, request_deadline)
+    except (deadline.DeadlineExceeded, requests.exceptions.Timeout, ConnectTimeoutError, ReadTimeoutError) as e:
+        logger.warning(f"Retrieval ran out of time, answering without RAG context: {e}")
+    if generation is None:
+        return answer_question(question=question, connection=connection, filters=filters, response_length=response_length, continuation=continuation, request_deadline=request_deadline, request_metrics=request_metrics)
+
+    # Identical questions are answered from the shared cache, while the index is unchanged. Answers
+    # without the RAG context, truncated answers, and answers limited by the time left, are not cached,
+    # as the next request may well have the time (and budget) for a full answer
+    key = cache.request_key(
+        MODEL_ROUTER.model_ids,
+        {
+            "question": question,
+            "filters": filters,
+            "response_length": response_length,
+            "continue_from": continuation
+        },
+        generation=generation
+    )
+    return cache.get_or_compute(
+        response_cache,
+        key,
+        lambda: answer_question(question=question, connection=connection, filters=filters, response_length=response_length, continuation=continuation, request_deadline=request_deadline, request_metrics=request_metrics),
+        cacheable=lambda prediction: not prediction["context_skipped"] and not prediction["truncated"] and not prediction["deadline_limited"],
+        request_deadline=request_deadline,
+        request_metrics=request_metrics
+    )
 
-    Here is the question: {question}
 
-    If the question cannot be answered by the document, say so.
+def answer_question(question: str, connection: Optional[Dict], filters: Optional[Dict]=None, response_length: str="standard", continuation: Optional[str]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    # A continuation repeats the retrieval, which returns the same context for the same question
+    candidates, hits, passages = [], [], []
+    context_skipped = connection is None
+    try:
+        if connection:
+            search_url = f"{connection['endpoint']}/{OPENSEARCH_INDEX}/_search"
+            logger.info(f"Embedding index exists, retrieving query hits from OpenSearch endpoint: {search_url}")
+            candidates = get_hits(query=question, url=search_url, username=connection["username"], password=connection["password"], filters=filters, request_deadline=request_deadline, request_metrics=request_metrics)
+            hits = retrieval.cut_hits(candidates, **RETRIEVAL_CUTOFF)
+            logger.info(f"{len(hits)} of {len(candidates)} candidate passages passed the retrieval cut-off")
+
+            # Expand the matching passages to their parent windows, within the context token budget
+            with metrics.stage(request_metrics, "parents"):
+                parents = retrieval.fetch_parents(
+                    index=OPENSEARCH_INDEX,
+                    parent_ids=list(dict.fromkeys(hit["_source"]["parent_id"] for hit in hits if hit["_source"].get("parent_id"))),
+                    timeout=retrieval_timeout(request_deadline),
+                    **connection
+                )
+            passages = retrieval.expand_to_parents(hits=hits, parents=parents, token_budget=retrieval.CONTEXT_TOKEN_BUDGET)
+    except (deadline.DeadlineExceeded, requests.exceptions.Timeout, ConnectTimeoutError, ReadTimeoutError) as e:
+        # Answer without context, rather than not at all
+        logger.warning(f"Retrieval ran out of time, answering without RAG context: {e}")
+        candidates, hits, passages = [], [], []
+        context_skipped = True
+
+    # Full passages are verbose, only a sample of them is logged
+    logger.info(
+        "The following documents were returned from OpenSearch: %s",
+        logs.Lazy(lambda: "\n".join(f"Score: {passage['score']} | Document: {passage['file_name']} | Passage: {passage['passage']}" for passage in passages)),
+        extra=logs.VERBOSE
+    )
     
-    Answer the question immediately without preamble.
-    """
-
-    response = bedrock_client.invoke_model(
-        body=json.dumps(
-            {
-                "max_tokens": 8192,
-                "anthropic_version": "bedrock-2023-05-31",
-                "temperature": 0.5,
-                "top_k": 250,
-                "top_p": 1,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-        ),
-        modelId=TEXT_MODEL_ID,
-        accept="*/*",
-        contentType="application/json"
+    context = "\n".join([passage["passage"] for passage in passages])
+
+    with metrics.stage(request_metrics, "generation") as stage:
+        if passages:
+            logger.info(f"Sending prompt to Bedrock (Using OpenSearch context) ...")
+            result = invoke_model(question=question, context=context, response_length=response_length, continuation=continuation, request_deadline=request_deadline)
+        else:
+            # Without relevant passages, the (much shorter) prompt without context is sent instead
+            logger.info(f"Sending prompt to Bedrock (No relevant OpenSearch context) ...")
+            result = router.generate(
+                client=bedrock_client,
+                router=MODEL_ROUTER,
+                templates=TEXT_TEMPLATES,
+                question=question,
+                prompt=question,
+                response_length=response_length,
+                continuation=continuation,
+                hedger=hedger,
+                admission_controller=admission_controller,
+                request_deadline=request_deadline
+            )
+        # The model is chosen by the router
+        stage.model_id = result["model_id"]
+        stage.add(InputTokens=result["usage"]["input_tokens"], OutputTokens=result["usage"]["output_tokens"])
+    answer = (continuation or "") + result["text"]
+    usage = result["usage"]
+    logger.info(
+        "Bedrock model Id: %s (escalated: %s), model latency: %s, hedging: %s",
+        result["model_id"],
+        result["escalated"],
+        logs.lazy_json(MODEL_ROUTER.report()),
+        logs.lazy_json(hedger.report() if hedger else None)
+    )
+    logger.info("Token usage: %s, truncated: %s", logs.lazy_json(usage), result["truncated"])
+    values = {
+        **budget.budget_metrics(result["model_id"], response_length, extra_tokens=QUOTE_TOKENS if passages else 0, truncated=result["truncated"], legacy_max_tokens_by_family=LEGACY_MAX_TOKENS),
+        "CandidatePassages": len(candidates),
+        "ChosenK": len(hits),
+        "ContextPassages": len(passages),
+        "ContextSkipped": int(context_skipped),
+        "InputTokens": usage["input_tokens"],
+        "OutputTokens": usage["output_tokens"],
+        "CacheReadInputTokens": usage["cache_read_input_tokens"],
+        "CacheWriteInputTokens": usage["cache_write_input_tokens"],
+        "Escalated": int(result["escalated"]),
+        "DeadlineLimited": int(result["deadline_limited"]),
+        "ModelLatency": result["latency"]
+    }
+    metrics.emit(
+        metrics.emf_record(
+            namespace=METRICS_NAMESPACE,
+            dimensions={"Api": "rag", "ModelId": result["model_id"]},
+            values=values,
+            units={name: "Seconds" if name in ["WorstCaseLatencySaved", "ModelLatency"] else "Count" for name in values}
+        )
     )
-    response_body = json.loads(response.get("body").read())
-    return response_body.get("content")[0].get("text")
 
+    # Full answers are verbose, only a sample of them is logged
+    logger.info("Bedrock returned the following answer: %s", answer, extra=logs.VERBOSE)
+    return {
+        "response": answer,
+        "truncated": result["truncated"],  # The client can continue a truncated answer, with `continue_from`
+        "response_length": response_length,
+        "context_skipped": context_skipped,
+        "deadline_limited": result["deadline_limited"]
+    }
+
+def invoke_model(question: str, context: str, response_length: str="standard", continuation: Optional[str]=None, request_deadline: Optional[deadline.Deadline]=None) -> Dict:
+    # The instructions are the (cacheable) system prompt, so only the document, and question, vary
+    prompt = f"""Here is the document:
+
+<document>
+{context}
+</document>
+
+Here is the question: {question}"""
+    return router.generate(
+        client=bedrock_client,
+        router=MODEL_ROUTER,
+        templates=RAG_TEMPLATES,
+        question=question,
+        prompt=prompt,
+        response_length=response_length,
+        continuation=continuation,
+        hedger=hedger,
+        admission_controller=admission_controller,
+        request_deadline=request_deadline
+    )
@@ -0,0 +1,59 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_dynamodb as _dynamodb,
+    aws_lambda as _lambda
+)
+from constructs import Construct
+
+class ResponseCache(Construct):
+
+    def __init__(self, scope: Construct, id: str) -> None:
+        super().__init__(scope, id)
+
+        # Cached API responses, and claims of responses being computed, shared by all function instances
+        self.table = _dynamodb.Table(
+            self,
+            "ResponseCacheTable",
+            partition_key=_dynamodb.Attribute(
+                name="key",
+                type=_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=cdk.RemovalPolicy.DESTROY
+        )
+
+    @staticmethod
+    def attach(function: _lambda.Function) -> None:
+        # Answer identical requests of the function from the cache, if a TTL is configured, using the
+        # stack-wide cache table, created the first time a function is attached
+        ttl = function.node.try_get_context("toolchain-context").get("response-cache-ttl-seconds") or "0"
+        if not float(ttl):
+            return
+        stack = cdk.Stack.of(function)
+        response_cache = stack.node.try_find_child("ResponseCache")
+        if response_cache is None:
+            response_cache = ResponseCache(stack, "ResponseCache")
+        function.add_environment("RESPONSE_CACHE_TTL", ttl)
+        function.add_environment("RESPONSE_CACHE_TABLE", response_cache.table.table_name)
+        response_cache.table.grant_read_write_data(function)
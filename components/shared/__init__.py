@@ -0,0 +1,54 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pathlib
+import aws_cdk as cdk
+
+from aws_cdk import (
+    aws_lambda as _lambda
+)
+from constructs import Construct
+
+# Location of the shared `llmops` Python package, also deployed alongside the SageMaker processing scripts
+LIBRARY_PATH = str(pathlib.Path(__file__).parent.joinpath("runtime", "python").resolve())
+
+class SharedLayer(Construct):
+
+    def __init__(self, scope: Construct, id: str) -> None:
+        super().__init__(scope, id)
+
+        # Package the shared runtime library as a Lambda Layer, mounted under `/opt/python`
+        self.layer = _lambda.LayerVersion(
+            self,
+            "SharedRuntimeLayer",
+            code=_lambda.Code.from_asset(str(pathlib.Path(__file__).parent.joinpath("runtime").resolve())),
+            compatible_runtimes=[
+                _lambda.Runtime.PYTHON_3_12
+            ],
+            description="Shared runtime library (llmops) for the workshop Lambda Functions"
+        )
+
+    @staticmethod
+    def of(scope: Construct) -> _lambda.ILayerVersion:
+        # Return the stack-wide shared layer, creating it the first time a component asks for it
+        stack = cdk.Stack.of(scope)
+        shared_layer = stack.node.try_find_child("SharedLayer")
+        if shared_layer is None:
+            shared_layer = SharedLayer(stack, "SharedLayer")
+        return shared_layer.layer
@@ -0,0 +1,194 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Client-side admission control for Bedrock calls. Each model has token buckets sized to its requests
+per minute (RPM), and tokens per minute (TPM) quotas, shared by all function instances through a
+DynamoDB table. A call waits briefly for its tokens, or is shed, so that the API can answer with a
+fast 429 and a Retry-After, instead of piling on retries against a throttled model.
+"""
+
+import os
+import json
+import math
+import time
+import boto3
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+from typing import Callable, Dict, Optional
+
+from llmops import clients, metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_WAIT_SECONDS = 2.0 # A call waits up to this long for its tokens, before it is shed
+WRITE_ATTEMPTS = 3 # Attempts to update a bucket that other instances are updating concurrently
+BUCKET_TTL_SECONDS = 3600 # Idle buckets expire, and start full again
+RETRY_AFTER_SECONDS = 5 # Suggested to clients when Bedrock throttled the request despite retries
+
+
+class Throttled(Exception):
+
+    def __init__(self, model_id: str, retry_after: int) -> None:
+        super().__init__(f"Admission control shed the request for {model_id}, retry after {retry_after}s")
+        self.model_id = model_id
+        self.retry_after = retry_after
+
+
+def refill(state: Optional[Dict], limits: Dict[str, float], now: float) -> Dict[str, float]:
+    # Tokens of each bucket (`rpm`, `tpm`) at `now`, full if the bucket is new
+    if not state:
+        return {name: float(limit) for name, limit in limits.items()}
+    elapsed = max(now - state["updated_at"], 0)
+    return {name: min(float(limit), state.get(name, limit) + elapsed * limit / 60) for name, limit in limits.items()}
+
+
+def wait_time(tokens: Dict[str, float], limits: Dict[str, float], cost: Dict[str, float]) -> float:
+    # Seconds until every bucket holds the cost, zero if it does already
+    return max([(cost[name] - tokens[name]) * 60 / limit for name, limit in limits.items() if tokens[name] < cost[name]], default=0.0)
+
+
+class MemoryBuckets:
+    # Buckets of a single process, e.g. for local runs, and tests
+
+    def __init__(self) -> None:
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def take(self, key: str, limits: Dict[str, float], cost: Dict[str, float], now: float) -> float:
+        with self.lock:
+            tokens = refill(self.state.get(key), limits, now)
+            wait = wait_time(tokens, limits, cost)
+            if not wait:
+                self.state[key] = {**{name: tokens[name] - cost[name] for name in limits}, "updated_at": now}
+            return wait
+
+
+class DynamoDBBuckets:
+    # Buckets shared by all function instances, one item per model, updated with a conditional write
+
+    def __init__(self, table_name: str, client=None) -> None:
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def take(self, key: str, limits: Dict[str, float], cost: Dict[str, float], now: float) -> float:
+        for _ in range(WRITE_ATTEMPTS):
+            item = self.client.get_item(TableName=self.table_name, Key={"bucket": {"S": key}}, ConsistentRead=True).get("Item")
+            state = {name: float(value["N"]) for name, value in item.items() if "N" in value} if item else None
+            tokens = refill(state, limits, now)
+            wait = wait_time(tokens, limits, cost)
+            if wait:
+                return wait
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        "bucket": {"S": key},
+                        "updated_at": {"N": repr(now)},
+                        "expires_at": {"N": str(int(now) + BUCKET_TTL_SECONDS)},
+                        **{name: {"N": repr(tokens[name] - cost[name])} for name in limits}
+                    },
+                    # Only if no other instance took tokens since the read
+                    ConditionExpression="attribute_not_exists(updated_at) OR updated_at = :updated_at",
+                    ExpressionAttributeValues={":updated_at": {"N": repr(state["updated_at"]) if state else "0"}}
+                )
+                return 0.0
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+        return 0.1 # Heavily contended, try again shortly
+
+
+class AdmissionController:
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], backend=None, namespace: Optional[str]=None, max_wait: float=MAX_WAIT_SECONDS, clock: Callable[[], float]=time.time, sleep: Callable[[float], None]=time.sleep) -> None:
+        self.limits = limits
+        self.backend = backend or MemoryBuckets()
+        self.namespace = namespace
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.counters = {"Admitted": 0, "Shed": 0}
+
+    def model_limits(self, model_id: str) -> Optional[Dict[str, float]]:
+        # Limits of the model, matched exactly or by prefix, none if the model is not limited
+        for prefix, limits in self.limits.items():
+            if model_id.startswith(prefix):
+                return {name: float(limit) for name, limit in limits.items() if name in ["rpm", "tpm"] and limit}
+        return None
+
+    def admit(self, model_id: str, tokens: int=0) -> float:
+        # Take a request, and `tokens` (input tokens plus the output budget), from the model's buckets,
+        # returning the seconds waited for them, or raise Throttled once the wait would be too long
+        limits = self.model_limits(model_id)
+        if not limits:
+            return 0.0
+        cost = {"rpm": 1, "tpm": min(tokens, limits.get("tpm", 0))}
+        start = self.clock()
+        while True:
+            wait = self.backend.take(model_id, limits, cost, self.clock())
+            waited = self.clock() - start
+            if not wait:
+                self.record(model_id, "Admitted", waited)
+                return waited
+            if waited + wait > self.max_wait:
+                self.record(model_id, "Shed", waited)
+                raise Throttled(model_id, retry_after=max(1, math.ceil(wait)))
+            self.sleep(wait)
+
+    def record(self, model_id: str, outcome: str, waited: float) -> None:
+        self.counters[outcome] += 1
+        if outcome == "Shed":
+            logger.warning(f"Shed a request for {model_id}, after waiting {waited:.3f}s")
+        if self.namespace:
+            metrics.emit(
+                metrics.emf_record(
+                    namespace=self.namespace,
+                    dimensions={"ModelId": model_id},
+                    values={outcome: 1, "AdmissionWait": waited},
+                    units={outcome: "Count", "AdmissionWait": "Seconds"}
+                )
+            )
+
+
+def from_env() -> Optional[AdmissionController]:
+    # ADMISSION_LIMITS maps model ids (or prefixes) to their `rpm`, and `tpm` limits, none disables it
+    limits = json.loads(os.getenv("ADMISSION_LIMITS") or "{}")
+    if not limits:
+        return None
+    table_name = os.getenv("ADMISSION_TABLE")
+    return AdmissionController(
+        limits=limits,
+        backend=DynamoDBBuckets(table_name) if table_name else MemoryBuckets(),
+        namespace=os.getenv("METRICS_NAMESPACE")
+    )
+
+
+def retry_after(error: Exception) -> Optional[int]:
+    # Seconds after which a request that failed with `error` can be retried, none if it was not throttled
+    if isinstance(error, Throttled):
+        return error.retry_after
+    if isinstance(error, ClientError) and error.response["Error"]["Code"] in clients.THROTTLE_CODES:
+        return RETRY_AFTER_SECONDS
+    return None
+
+
+def admit(controller: Optional[AdmissionController], model_id: str, tokens: int=0) -> float:
+    return controller.admit(model_id, tokens) if controller else 0.0
@@ -0,0 +1,96 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Output length budgeting. Each request is given a `max_tokens` budget for its class of answer (from a
+client hint, or the shape of the question), instead of a worst-case budget. An answer that reaches
+its budget is reported as truncated, and can be continued by the client on demand.
+"""
+
+import re
+
+from typing import Dict, Optional
+
+from llmops import models
+
+# Output token budget of each response length class
+RESPONSE_LENGTHS = {
+    "short": 256,
+    "standard": 1024,
+    "long": 2048
+}
+OUTPUT_TOKENS_PER_SECOND = 50 # Rough generation speed, used to estimate the worst-case latency saved
+
+LONG_ANSWER = re.compile(r"\b(explain|describe|summari[sz]e|compare|list|write|steps|essay|detail(ed)?|elaborate|tell me about|why|how (do|does|can|to))\b", re.IGNORECASE)
+SHORT_ANSWER = re.compile(r"^\s*(who|what|when|where|which|how (many|much|old|long))\b", re.IGNORECASE)
+SHORT_QUESTION_WORDS = 15
+
+
+def classify(question: str, hint: Optional[str]=None) -> str:
+    # A valid client hint wins, otherwise the question shape decides: requests for explanations, or
+    # lists, get a long budget, and short factual questions a short one
+    if hint in RESPONSE_LENGTHS:
+        return hint
+    if LONG_ANSWER.search(question):
+        return "long"
+    if SHORT_ANSWER.search(question) and len(question.split()) <= SHORT_QUESTION_WORDS:
+        return "short"
+    return "standard"
+
+
+def max_tokens(model_id: str, length: str, extra_tokens: int=0) -> int:
+    # The output token budget of a response length class, within the output limit of the model
+    return min(RESPONSE_LENGTHS[length] + extra_tokens, models.ADAPTERS[models.get_family(model_id)]["max_output_tokens"])
+
+
+def compile_templates(model_id: str, system: Optional[str]=None, extra_tokens: int=0, cache_system: bool=False) -> Dict[str, Dict]:
+    # One precompiled request template per response length class. `extra_tokens` is added to each
+    # budget, for output that the prompt asks for besides the answer (e.g. quotes).
+    family = models.get_family(model_id)
+    templates = {}
+    for length in RESPONSE_LENGTHS:
+        templates[length] = models.compile_template(
+            model_id,
+            system=system,
+            params={models.ADAPTERS[family]["max_tokens_field"]: max_tokens(model_id, length, extra_tokens)},
+            stop_sequences=models.ADAPTERS[family]["stop_sequences"],
+            cache_system=cache_system
+        )
+        templates[length]["max_tokens"] = max_tokens(model_id, length, extra_tokens)
+    return templates
+
+
+def legacy_max_tokens(model_id: str) -> int:
+    # The worst-case budget that every request used to be given, the default of the model adapter
+    adapter = models.ADAPTERS[models.get_family(model_id)]
+    value = adapter["defaults"]
+    for field in adapter["max_tokens_field"].split("."):
+        value = value[field]
+    return value
+
+
+def budget_metrics(model_id: str, length: str, extra_tokens: int, truncated: bool, legacy_max_tokens_by_family: Optional[Dict[str, int]]=None) -> Dict[str, float]:
+    # `legacy_max_tokens_by_family` overrides the worst-case budget of the model families for which
+    # the API set its own, before budgeting
+    budget = max_tokens(model_id, length, extra_tokens)
+    legacy_budget = (legacy_max_tokens_by_family or {}).get(models.get_family(model_id), legacy_max_tokens(model_id))
+    return {
+        "MaxTokens": budget,
+        "Truncated": int(truncated),  # The average is the truncation rate
+        "WorstCaseLatencySaved": max(legacy_budget - budget, 0) / OUTPUT_TOKENS_PER_SECOND
+    }
@@ -0,0 +1,254 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Shared response cache. Identical requests (the same models, request body, and for RAG, index
+generation) are answered from a cache shared by all function instances, instead of paying for another
+Bedrock call. Concurrent misses of the same key are coalesced: the first request claims the key, and
+computes the response, while the others wait for it to be stored.
+"""
+
+import os
+import json
+import time
+import boto3
+import hashlib
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+from typing import Callable, Dict, List, Optional
+
+from llmops import deadline, metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = 3600 # Responses expire, so that a changed prompt, or model, is picked up
+LEASE_SECONDS = 30 # A claim expires, in case the instance computing the response fails
+MAX_WAIT_SECONDS = 10.0 # A request waits up to this long for a response computed by another request
+POLL_SECONDS = 0.1
+MAX_ITEM_BYTES = 380_000 # DynamoDB items are limited to 400 KB, larger responses are not cached
+
+
+def request_key(model_ids: List[str], request: Dict, generation: Optional[str]=None) -> str:
+    # Canonical hash of the request, so that key order, and whitespace, of the JSON body do not matter
+    canonical = json.dumps({"model_ids": model_ids, "request": request, "generation": generation}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    # Cache of a single process, e.g. for local runs, and tests
+
+    def __init__(self) -> None:
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[Dict]:
+        with self.lock:
+            item = self.items.get(key)
+            if item and "value" in item and item["expires_at"] > now:
+                return json.loads(item["value"])
+            return None
+
+    def claim(self, key: str, lease: float, now: float) -> bool:
+        with self.lock:
+            item = self.items.get(key)
+            if item and item["expires_at"] > now:
+                return False
+            self.items[key] = {"expires_at": now + lease}
+            return True
+
+    def put(self, key: str, value: Dict, ttl: float, now: float) -> bool:
+        with self.lock:
+            self.items[key] = {"value": json.dumps(value), "expires_at": now + ttl}
+            return True
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and "value" not in item:
+                del self.items[key]
+
+
+class DynamoDBCache:
+    # Cache shared by all function instances, one item per key, expired by the table's TTL
+
+    def __init__(self, table_name: str, client=None) -> None:
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def get(self, key: str, now: float) -> Optional[Dict]:
+        item = self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}}, ConsistentRead=True).get("Item")
+        # Expired items are only deleted eventually by the TTL, so they are checked here
+        if item and "value" in item and float(item["expires_at"]["N"]) > now:
+            return json.loads(item["value"]["S"])
+        return None
+
+    def claim(self, key: str, lease: float, now: float) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "key": {"S": key},
+                    "expires_at": {"N": repr(now + lease)}
+                },
+                # Only if no other request holds a claim, or a response that has not expired
+                ConditionExpression="attribute_not_exists(#key) OR expires_at < :now",
+                ExpressionAttributeNames={"#key": "key"},
+                ExpressionAttributeValues={":now": {"N": repr(now)}}
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def put(self, key: str, value: Dict, ttl: float, now: float) -> bool:
+        body = json.dumps(value)
+        if len(body.encode("utf-8")) > MAX_ITEM_BYTES:
+            logger.info(f"Response of {len(body)} characters is too large to cache")
+            self.release(key)
+            return False
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "key": {"S": key},
+                "value": {"S": body},
+                "expires_at": {"N": repr(now + ttl)}
+            }
+        )
+        return True
+
+    def release(self, key: str) -> None:
+        # Drop a claim without a response, so that waiting requests stop waiting on it
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={"key": {"S": key}},
+                ConditionExpression="attribute_exists(#key) AND attribute_not_exists(#value)",
+                ExpressionAttributeNames={"#key": "key", "#value": "value"}
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+
+class ResponseCache:
+
+    def __init__(self, backend=None, ttl: float=CACHE_TTL_SECONDS, namespace: Optional[str]=None, lease: float=LEASE_SECONDS, max_wait: float=MAX_WAIT_SECONDS, poll: float=POLL_SECONDS, clock: Callable[[], float]=time.time, sleep: Callable[[float], None]=time.sleep) -> None:
+        self.backend = backend or MemoryCache()
+        self.ttl = ttl
+        self.namespace = namespace
+        self.lease = lease
+        self.max_wait = max_wait
+        self.poll = poll
+        self.clock = clock
+        self.sleep = sleep
+        self.counters = {"Hits": 0, "Misses": 0, "Coalesced": 0, "Uncached": 0}
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict], cacheable: Optional[Callable[[Dict], bool]]=None, max_wait: Optional[float]=None) -> Dict:
+        # The cached response of `key`, or the response of `compute`, which is cached unless `cacheable`
+        # rejects it (e.g. an error, or degraded response). While another request computes the same
+        # key, this one waits up to `max_wait` for it, before computing the response itself
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        start = self.clock()
+        claimed = coalesced = False
+        while True:
+            value = self.backend.get(key, self.clock())
+            if value is not None:
+                self.record("Hits", self.clock() - start, coalesced)
+                return value
+            claimed = self.backend.claim(key, self.lease, self.clock())
+            if claimed:
+                break
+            coalesced = True
+            if self.clock() - start + self.poll > max_wait:
+                logger.info(f"Gave up waiting for the response of {key[:12]}, computing it")
+                break
+            self.sleep(self.poll)
+        try:
+            value = compute()
+        except BaseException:
+            if claimed:
+                self.backend.release(key)
+            raise
+        if cacheable is None or cacheable(value):
+            self.backend.put(key, value, self.ttl, self.clock())
+            self.record("Misses", self.clock() - start, coalesced)
+        else:
+            if claimed:
+                self.backend.release(key)
+            self.record("Uncached", self.clock() - start, coalesced)
+        return value
+
+    def record(self, outcome: str, waited: float, coalesced: bool) -> None:
+        with self.lock:
+            self.counters[outcome] += 1
+            self.counters["Coalesced"] += int(coalesced)
+        if self.namespace:
+            # The average of CacheHit is the hit rate
+            values = {"CacheHit": int(outcome == "Hits"), "CacheCoalesced": int(coalesced), "CacheWait": waited}
+            metrics.emit(
+                metrics.emf_record(
+                    namespace=self.namespace,
+                    dimensions={"Cache": "Response"},
+                    values=values,
+                    units={"CacheHit": "Count", "CacheCoalesced": "Count", "CacheWait": "Seconds"}
+                )
+            )
+
+    def report(self) -> Dict:
+        with self.lock:
+            lookups = self.counters["Hits"] + self.counters["Misses"] + self.counters["Uncached"]
+            return {**self.counters, "HitRate": round(self.counters["Hits"] / lookups, 4) if lookups else None}
+
+
+def from_env() -> Optional[ResponseCache]:
+    # RESPONSE_CACHE_TTL (seconds) enables the cache, RESPONSE_CACHE_TABLE shares it across instances
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL") or 0)
+    if not ttl:
+        return None
+    table_name = os.getenv("RESPONSE_CACHE_TABLE")
+    return ResponseCache(
+        backend=DynamoDBCache(table_name) if table_name else MemoryCache(),
+        ttl=ttl,
+        namespace=os.getenv("METRICS_NAMESPACE")
+    )
+
+
+def get_or_compute(cache: Optional[ResponseCache], key: str, compute: Callable[[], Dict], cacheable: Optional[Callable[[Dict], bool]]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    # Without a cache, the response is computed. With a deadline, a request waits at most half of the
+    # time left for another request's response, so that it can still compute its own
+    if cache is None:
+        return compute()
+    computed = []
+    def timed_compute() -> Dict:
+        start_time = time.perf_counter()
+        try:
+            return compute()
+        finally:
+            computed.append(time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    response = cache.get_or_compute(key, timed_compute, cacheable, max_wait=request_deadline.remaining() / 2 if request_deadline else None)
+    if request_metrics:
+        # The cache stage is the lookup (and the wait), a computed response is timed by its own stages
+        stage = metrics.Stage("cache")
+        stage.add(Latency=(time.perf_counter() - start_time - sum(computed)) * 1000, CacheHit=int(not computed))
+        request_metrics.record(stage)
+    return response
@@ -0,0 +1,200 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+A pool of Bedrock runtime clients, one per configured region, to spread calls across the regional
+throughput quotas. Calls stick to one region until it throttles, or fails, and then fall back to the
+fastest healthy region. A circuit breaker per region skips a region after repeated failures.
+"""
+
+import os
+import math
+import time
+import boto3
+import logging
+import threading
+
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_CODES = ["ThrottlingException", "ServiceQuotaExceededException", "TooManyRequestsException"]
+# Errors of one region (e.g. the model is not enabled, or unavailable there), that another region may not have
+REGION_ERROR_CODES = ["AccessDeniedException", "ResourceNotFoundException", "ModelNotReadyException", "ServiceUnavailableException", "InternalServerException"]
+THROTTLE_COOLDOWN = 10 # Seconds that a throttled region is passed over, while another region is available
+BREAKER_FAILURES = 3 # Consecutive failures that open a region's circuit breaker
+BREAKER_COOLDOWN = 30 # Seconds until an open breaker lets a trial call through (half-open)
+EWMA_ALPHA = 0.2 # Weight of the latest latency sample
+# Retries with exponential backoff, and jitter, and a client-side rate limit that adapts to throttling.
+# With other regions to fall back to, a throttled call fails over at once instead.
+RETRY_CONFIG = Config(retries={"mode": "adaptive", "total_max_attempts": 3})
+FAILOVER_CONFIG = Config(retries={"mode": "standard", "total_max_attempts": 1})
+TIMEOUT_STEP = 5 # Read timeouts of deadline-bound calls are rounded up to a multiple of this, to bound the no. of clients
+CONNECT_TIMEOUT = 5 # Upper bound of the connect timeout of deadline-bound calls
+
+
+class BedrockPool:
+
+    def __init__(self, regions: List[str], factory: Optional[Callable[[str, Config], Any]]=None, config: Config=RETRY_CONFIG, clock: Callable[[], float]=time.monotonic) -> None:
+        self.regions = list(dict.fromkeys(regions))
+        self.factory = factory or (lambda region, config: boto3.client("bedrock-runtime", region_name=region, config=config))
+        self.config = config
+        self.clock = clock
+        self.clients = {}
+        self.state = {
+            region: {
+                "ewma": 0.0, # Unmeasured regions are tried before slower measured ones
+                "throttled_at": None,
+                "failures": 0,
+                "open_until": 0.0,
+                "calls": 0,
+                "throttles": 0,
+                "errors": 0
+            } for region in self.regions
+        }
+        self.current = self.regions[0]
+        self.lock = threading.Lock()
+
+    def client(self, region: str, read_timeout: Optional[float]=None) -> Any:
+        # One client per region, and per read timeout step of deadline-bound calls
+        step = math.ceil(read_timeout / TIMEOUT_STEP) * TIMEOUT_STEP if read_timeout else None
+        with self.lock:
+            if (region, step) not in self.clients:
+                config = self.config.merge(Config(read_timeout=step, connect_timeout=min(step, CONNECT_TIMEOUT))) if step else self.config
+                self.clients[(region, step)] = self.factory(region, config)
+            return self.clients[(region, step)]
+
+    def available(self, region: str, now: float) -> bool:
+        return self.state[region]["open_until"] <= now
+
+    def throttled(self, region: str, now: float) -> bool:
+        throttled_at = self.state[region]["throttled_at"]
+        return throttled_at is not None and now - throttled_at < THROTTLE_COOLDOWN
+
+    def candidates(self) -> List[str]:
+        # The current region, unless it is throttled or its breaker is open, then the others: not
+        # recently throttled first, fastest first. If every breaker is open, all regions are tried.
+        now = self.clock()
+        with self.lock:
+            regions = [region for region in self.regions if self.available(region, now)] or list(self.regions)
+            ordered = sorted(regions, key=lambda region: (self.throttled(region, now), self.state[region]["ewma"]))
+            if self.current in ordered and not self.throttled(self.current, now):
+                ordered.insert(0, ordered.pop(ordered.index(self.current)))
+        return ordered
+
+    def success(self, region: str, seconds: float) -> None:
+        with self.lock:
+            state = self.state[region]
+            state["calls"] += 1
+            state["ewma"] = seconds if not state["ewma"] else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * state["ewma"]
+            state["failures"] = 0
+            state["open_until"] = 0.0
+            if region != self.current:
+                logger.info(f"Bedrock calls moved from {self.current} to {region}")
+                self.current = region  # Sticky, until this region fails in turn
+
+    def failure(self, region: str, throttled: bool) -> None:
+        with self.lock:
+            state = self.state[region]
+            state["calls"] += 1
+            state["throttles" if throttled else "errors"] += 1
+            state["failures"] += 1
+            if throttled:
+                state["throttled_at"] = self.clock()
+            if state["failures"] >= BREAKER_FAILURES:
+                state["open_until"] = self.clock() + BREAKER_COOLDOWN
+                logger.warning(f"Bedrock circuit breaker open for {region}, after {state['failures']} failures")
+
+    def call(self, fn: Callable[[Any], Any], read_timeout: Optional[float]=None) -> Any:
+        # Call `fn` with the client of each candidate region, until one succeeds. Other errors (e.g. a
+        # validation error) are raised, as another region would return the same.
+        last_error = None
+        for region in self.candidates():
+            start = time.perf_counter()
+            try:
+                result = fn(self.client(region, read_timeout))
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code not in THROTTLE_CODES + REGION_ERROR_CODES:
+                    raise
+                logger.info(f"Bedrock call failed in {region}: {code}")
+                self.failure(region, throttled=code in THROTTLE_CODES)
+                last_error = e
+                continue
+            except (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError) as e:
+                logger.info(f"Bedrock call failed in {region}: {e}")
+                self.failure(region, throttled=False)
+                last_error = e
+                continue
+            self.success(region, time.perf_counter() - start)
+            return result
+        raise last_error
+
+    # The pool stands in for a Bedrock runtime client
+    def invoke_model(self, **kwargs) -> Dict:
+        return self.call(lambda client: client.invoke_model(**kwargs))
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict:
+        return self.call(lambda client: client.invoke_model_with_response_stream(**kwargs))
+
+    def bound(self, read_timeout: float) -> "BoundPool":
+        return BoundPool(self, read_timeout)
+
+    def report(self) -> Dict[str, Dict]:
+        now = self.clock()
+        with self.lock:
+            return {
+                region: {
+                    "ewma_seconds": round(state["ewma"], 3),
+                    "calls": state["calls"],
+                    "throttles": state["throttles"],
+                    "errors": state["errors"],
+                    "breaker_open": not self.available(region, now),
+                    "current": region == self.current
+                } for region, state in self.state.items()
+            }
+
+
+class BoundPool:
+    # The pool, with a read timeout for each call, e.g. from a request deadline
+
+    def __init__(self, pool: BedrockPool, read_timeout: float) -> None:
+        self.pool = pool
+        self.read_timeout = read_timeout
+
+    def invoke_model(self, **kwargs) -> Dict:
+        return self.pool.call(lambda client: client.invoke_model(**kwargs), self.read_timeout)
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict:
+        return self.pool.call(lambda client: client.invoke_model_with_response_stream(**kwargs), self.read_timeout)
+
+
+def with_timeout(client: Any, read_timeout: Optional[float]) -> Any:
+    # Bind a read timeout to the calls of a pool, other clients keep the timeout they were created with
+    return client.bound(read_timeout) if read_timeout and isinstance(client, BedrockPool) else client
+
+
+def from_env(region: Optional[str]=None, regions: Optional[str]=None) -> BedrockPool:
+    # BEDROCK_REGIONS (or `regions`) lists the regions to spread calls across, besides the home region
+    home = region or os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION"))
+    regions = os.getenv("BEDROCK_REGIONS", "") if regions is None else regions
+    regions = list(dict.fromkeys([home, *[other.strip() for other in regions.split(",") if other.strip()]]))
+    config = FAILOVER_CONFIG if len(regions) > 1 else RETRY_CONFIG
+    return BedrockPool(regions, config=config)
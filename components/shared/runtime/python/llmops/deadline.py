@@ -0,0 +1,100 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Request deadlines. A deadline is taken from the Lambda remaining time, capped by the API Gateway
+integration timeout, and passed through every stage of a request. Each call is given a socket timeout
+from the time that is left, and the request degrades (e.g. without RAG context, or with a lower output
+token limit) rather than running past the point where its response can still be returned.
+"""
+
+import time
+
+from typing import Any, Callable, Dict, Optional
+
+from llmops import budget, models
+
+API_GATEWAY_TIMEOUT = 29.0 # Seconds, the API Gateway integration timeout
+RESPONSE_MARGIN = 1.0 # Seconds kept to build, and return the response
+MIN_TIMEOUT = 0.5 # Lower bound of a socket timeout
+FIRST_TOKEN_SECONDS = 1.0 # Rough latency of a generation call before its first token
+MIN_OUTPUT_TOKENS = 64 # Below this, there is no time for a useful answer
+
+
+class DeadlineExceeded(Exception):
+
+    def __init__(self, stage: str, remaining: float) -> None:
+        super().__init__(f"Not enough time left for {stage} ({remaining:.2f}s)")
+        self.stage = stage
+        self.remaining = remaining
+
+
+class Deadline:
+
+    def __init__(self, seconds: float, clock: Callable[[], float]=time.monotonic) -> None:
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    @staticmethod
+    def from_context(context: Any, limit: float=API_GATEWAY_TIMEOUT) -> "Deadline":
+        # The Lambda context is absent when the handler runs outside of Lambda, e.g. in tests
+        remaining = context.get_remaining_time_in_millis() / 1000 if context is not None else limit
+        return Deadline(min(remaining, limit) - RESPONSE_MARGIN)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - self.clock(), 0.0)
+
+    def timeout(self, cap: Optional[float]=None) -> float:
+        # Socket timeout for a call, the remaining time (or less, with `cap`)
+        remaining = self.remaining() if cap is None else min(self.remaining(), cap)
+        return max(remaining, MIN_TIMEOUT)
+
+    def check(self, stage: str, seconds: float=0.0) -> None:
+        # Raise DeadlineExceeded unless at least `seconds` are left for the stage
+        if self.remaining() <= seconds:
+            raise DeadlineExceeded(stage, self.remaining())
+
+    def stage_timeout(self, stage: str, cap: float, reserve: float=0.0) -> float:
+        # Socket timeout for a call of a stage that may use the time left, except the `reserve` kept
+        # for later stages, raising DeadlineExceeded when nothing is left for it
+        self.check(stage, reserve + MIN_TIMEOUT)
+        return min(cap, self.remaining() - reserve)
+
+    def output_tokens(self) -> int:
+        # Output tokens that can be generated in the remaining time, at the rough generation speed
+        return int((self.remaining() - FIRST_TOKEN_SECONDS) * budget.OUTPUT_TOKENS_PER_SECOND)
+
+    def fit_template(self, template: Dict) -> Dict:
+        # Lower the output token limit of the template to what can be generated in time, raising
+        # DeadlineExceeded if that would be too little for a useful answer
+        max_tokens = template.get("max_tokens")
+        available = self.output_tokens()
+        if max_tokens is None or available >= max_tokens:
+            return template
+        if available < MIN_OUTPUT_TOKENS:
+            raise DeadlineExceeded("generation", self.remaining())
+        return models.with_max_tokens(template, available)
+
+
+def timeout(deadline: Optional[Deadline], cap: Optional[float]=None) -> Optional[float]:
+    # Socket timeout for a call, none (the client default) without a deadline
+    return deadline.timeout(cap) if deadline else cap
+
+
+def stage_timeout(deadline: Optional[Deadline], stage: str, cap: float, reserve: float=0.0) -> float:
+    return deadline.stage_timeout(stage, cap, reserve) if deadline else cap
@@ -0,0 +1,77 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Near-duplicate passage detection using MinHash signatures, and locality sensitive hashing (LSH)
+to find candidate pairs without comparing every passage against every other passage.
+"""
+
+import re
+import random
+import hashlib
+
+from typing import Dict, List, Tuple
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16 # 16 bands of 4 rows. Pairs above ~0.5 Jaccard similarity become candidates
+SHINGLE_SIZE = 5 # No. of consecutive words in each shingle
+
+# Each permutation XORs the 64-bit shingle hash with a random mask. The masks use a fixed seed, so
+# that the same passage always produces the same signature
+_random = random.Random(42)
+_MASKS = [_random.getrandbits(64) for _ in range(NUM_PERMUTATIONS)]
+
+
+def shingles(passage: str) -> set:
+    words = re.findall(r"\w+", passage.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(passage: str) -> Tuple[int, ...]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") for shingle in shingles(passage)
+    ]
+    return tuple(min(h ^ mask for h in hashes) for mask in _MASKS)
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    # The fraction of matching MinHash values estimates the Jaccard similarity of the shingle sets
+    return sum(1 for l, r in zip(left, right) if l == r) / len(left)
+
+
+def drop_near_duplicates(chunks: List[Dict], threshold: float) -> Tuple[List[Dict], List[Dict]]:
+    # Keep the first occurrence of each passage, and drop later passages at, or above, the similarity `threshold`
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    signatures = []
+    kept = []
+    dropped = []
+    for chunk in chunks:
+        chunk_signature = signature(chunk["passage"])
+        bands = [(band, chunk_signature[band * rows:(band + 1) * rows]) for band in range(LSH_BANDS)]
+        candidates = {candidate for band in bands for candidate in buckets.get(band, [])}
+        if any(similarity(chunk_signature, signatures[candidate]) >= threshold for candidate in candidates):
+            dropped.append(chunk)
+            continue
+        for band in bands:
+            buckets.setdefault(band, []).append(len(kept))
+        signatures.append(chunk_signature)
+        kept.append(chunk)
+    return kept, dropped
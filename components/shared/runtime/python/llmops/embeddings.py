@@ -0,0 +1,125 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Embedding model configuration shared by RAG ingest, the k-NN index mapping, and the RAG API, so that
+documents and queries are always embedded with the same model, and dimension. Embeddings are always
+unit length, as the k-NN index ranks by inner product.
+"""
+
+import os
+import json
+import math
+import logging
+import requests
+
+from requests.auth import HTTPBasicAuth
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Output dimensions supported by each embedding model. Only Titan v2 accepts the `dimensions`,
+# and `normalize` request parameters, other models' embeddings are normalized once returned.
+SUPPORTED_MODELS = {
+    "amazon.titan-embed-text-v1": {
+        "dimensions": [1536],
+        "configurable": False
+    },
+    "amazon.titan-embed-text-v2:0": {
+        "dimensions": [256, 512, 1024],
+        "configurable": True
+    }
+}
+
+
+def get_config(model_id: str, dimension: Optional[int]=None) -> Dict:
+    model = SUPPORTED_MODELS.get(model_id)
+    if model is None:
+        raise ValueError(f"Embedding model is not supported: {model_id}")
+    dimension = int(dimension) if dimension else model["dimensions"][-1]
+    if dimension not in model["dimensions"]:
+        raise ValueError(f"{model_id} does not support {dimension} dimensions, use one of: {model['dimensions']}")
+    return {
+        "model_id": model_id,
+        "dimension": dimension
+    }
+
+
+def config_from_env() -> Dict:
+    return get_config(
+        model_id=os.environ["EMBEDDING_MODEL_ID"],
+        dimension=os.getenv("EMBEDDING_DIMENSION")
+    )
+
+
+def build_request(text: str, config: Dict) -> str:
+    body = {
+        "inputText": text
+    }
+    if SUPPORTED_MODELS[config["model_id"]]["configurable"]:
+        body["dimensions"] = config["dimension"]
+        body["normalize"] = True
+    return json.dumps(body)
+
+
+def parse_response(response_body: Dict, config: Dict) -> List[float]:
+    embedding = response_body["embedding"]
+    if len(embedding) != config["dimension"]:
+        raise ValueError(f"{config['model_id']} returned {len(embedding)} dimensions, expected {config['dimension']}")
+    return unit_vector(embedding)
+
+
+def unit_vector(embedding: List[float]) -> List[float]:
+    # The k-NN index ranks by inner product, which equals cosine similarity for unit length vectors
+    norm = math.sqrt(sum(value * value for value in embedding))
+    return [value / norm for value in embedding] if norm else embedding
+
+
+def get_embedding(client: Any, text: str, config: Dict) -> List[float]:
+    response = client.invoke_model(
+        body=build_request(text, config),
+        modelId=config["model_id"],
+        accept="application/json",
+        contentType="application/json"
+    )
+    return parse_response(json.loads(response.get("body").read()), config)
+
+
+def index_metadata(config: Dict) -> Dict:
+    # Stored in the `_meta` of the index mapping, to detect indexes built with another configuration
+    return {
+        "embedding_model": config["model_id"],
+        "embedding_dimension": config["dimension"]
+    }
+
+
+def check_index(endpoint: str, index: str, config: Dict, username: str, password: str, timeout: Optional[float]=None) -> Optional[str]:
+    # Return a description of the mismatch between the index, and the query embedding configuration,
+    # or `None` when they are compatible
+    response = requests.get(f"{endpoint}/{index}/_mapping", auth=HTTPBasicAuth(username, password), timeout=timeout)
+    if response.status_code != 200:
+        return None
+    mapping = next(iter(response.json().values()))["mappings"]
+    dimension = mapping.get("properties", {}).get("vector_field", {}).get("dimension")
+    if dimension is not None and dimension != config["dimension"]:
+        return f"Index {index} stores {dimension} dimension vectors, but queries are embedded with {config['dimension']} dimensions ({config['model_id']})"
+    metadata = mapping.get("_meta", {})
+    for key, value in index_metadata(config).items():
+        if key in metadata and metadata[key] != value:
+            return f"Index {index} was built with {key}={metadata[key]}, but queries use {key}={value}"
+    return None
@@ -0,0 +1,138 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Request hedging, to cut the tail latency of Bedrock calls. A call that has not returned within a
+percentile of its recent latency is duplicated (optionally on a client for another region, or
+inference profile), and the first result wins. A budget limits the duplicated calls to a percentage
+of all calls.
+"""
+
+import os
+import time
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+
+from llmops import clients, metrics
+
+logger = logging.getLogger(__name__)
+
+HEDGE_PERCENTILE = 95 # A call is hedged once it is slower than this percentile of recent calls
+HEDGE_BUDGET_PERCENT = 5 # Upper bound of hedged calls, as a percentage of all calls
+WINDOW = 200 # No. of recent latency samples per operation
+MIN_SAMPLES = 20 # No hedging until an operation has this many samples
+MAX_TOKENS = 10 # Cap of the hedge budget, so that a quiet period cannot save up for a burst of hedges
+
+
+class Hedger:
+
+    def __init__(self, client: Any, hedge_client: Optional[Any]=None, percentile: float=HEDGE_PERCENTILE, budget_percent: float=HEDGE_BUDGET_PERCENT, window: int=WINDOW, min_samples: int=MIN_SAMPLES) -> None:
+        self.client = client
+        self.hedge_client = hedge_client or client
+        self.percentile = percentile
+        self.budget = budget_percent / 100
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = {}
+        self.tokens = 0.0
+        self.counters = {"Calls": 0, "Hedged": 0, "HedgeWins": 0, "BudgetExhausted": 0}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=8)
+
+    def record(self, operation: str, seconds: float) -> None:
+        with self.lock:
+            self.samples.setdefault(operation, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, operation: str) -> Optional[float]:
+        with self.lock:
+            samples = list(self.samples.get(operation, []))
+        if not self.budget or len(samples) < self.min_samples:
+            return None
+        return metrics.percentile(samples, self.percentile)
+
+    def submit(self, operation: str, fn: Callable[[Any], Any], client: Any):
+        start = time.perf_counter()
+        def completed(future):
+            # Both attempts are sampled as they complete, including the one that lost
+            if not future.cancelled() and future.exception() is None:
+                self.record(operation, time.perf_counter() - start)
+        future = self.executor.submit(fn, client)
+        future.add_done_callback(completed)
+        return future
+
+    def call(self, operation: str, fn: Callable[[Any], Any]) -> Any:
+        # `fn` makes the call with the client it is given. The losing attempt is cancelled if it has not
+        # started, but an HTTP request in flight cannot be aborted, so it completes in the background.
+        with self.lock:
+            self.counters["Calls"] += 1
+            self.tokens = min(self.tokens + self.budget, MAX_TOKENS)
+        delay = self.delay(operation)
+        primary = self.submit(operation, fn, self.client)
+        done, _ = wait([primary], timeout=delay)
+        if done or delay is None:
+            return primary.result()
+        with self.lock:
+            hedge = self.tokens >= 1
+            if hedge:
+                self.tokens -= 1
+                self.counters["Hedged"] += 1
+            else:
+                self.counters["BudgetExhausted"] += 1
+        if not hedge:
+            return primary.result()
+        logger.info(f"{operation} is slower than {delay:.3f}s, hedging")
+        attempts = [primary, self.submit(operation, fn, self.hedge_client)]
+        while attempts:
+            done, _ = wait(attempts, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempts.remove(future)
+                if future.exception() is None or not attempts:
+                    for loser in attempts:
+                        loser.cancel()
+                    if future is not primary:
+                        with self.lock:
+                            self.counters["HedgeWins"] += 1
+                    return future.result()
+
+    def report(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.counters)
+
+
+def from_env(client: Any) -> Optional[Hedger]:
+    # Hedging is opt-in, with a budget above zero, and duplicates go to another region if one is set,
+    # through a pool of its own, with the retries, circuit breaker, and timeouts of the primary calls
+    budget_percent = float(os.getenv("HEDGE_BUDGET_PERCENT", "0"))
+    if not budget_percent:
+        return None
+    hedge_region = os.getenv("HEDGE_REGION")
+    return Hedger(
+        client=client,
+        hedge_client=clients.from_env(region=hedge_region, regions="") if hedge_region else None,
+        percentile=float(os.getenv("HEDGE_PERCENTILE", HEDGE_PERCENTILE)),
+        budget_percent=budget_percent
+    )
+
+
+def call(hedger: Optional[Hedger], client: Any, operation: str, fn: Callable[[Any], Any]) -> Any:
+    # Call `fn` hedged, or directly on `client` when hedging is disabled
+    return hedger.call(operation, fn) if hedger else fn(client)
@@ -0,0 +1,146 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Content-addressed image cache in S3. Image generation with a fixed seed is deterministic, so an image
+is stored under the hash of its full generation request, and identical requests are answered from S3
+instead of another diffusion run. Keys are prefixed with a version of the model id, and the generation
+defaults, so that a change of either starts a fresh cache, while the old one ages out.
+"""
+
+import os
+import json
+import time
+import boto3
+import base64
+import hashlib
+import logging
+
+from botocore.exceptions import ClientError
+from typing import Any, Dict, List, Optional
+
+from llmops import metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "image-cache"
+MAX_BYTES = 10 * 1024 ** 3 # Total size kept by the eviction, the oldest images are deleted beyond it
+DELETE_BATCH_SIZE = 1000 # Most keys of a DeleteObjects call
+
+
+def canonical_hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def key_version(model_id: str, defaults: Dict) -> str:
+    return canonical_hash({"model_id": model_id, "defaults": defaults})[:12]
+
+
+class ImageCache:
+
+    def __init__(self, bucket: str, model_id: str, defaults: Dict, client=None, namespace: Optional[str]=None, prefix: str=KEY_PREFIX) -> None:
+        self.bucket = bucket
+        self.model_id = model_id
+        self.version = key_version(model_id, defaults)
+        self.client = client or boto3.client("s3")
+        self.namespace = namespace
+        self.prefix = prefix
+        self.counters = {"Hits": 0, "Misses": 0}
+
+    def object_key(self, request: Dict) -> str:
+        return f"{self.prefix}/{self.version}/{canonical_hash({'model_id': self.model_id, 'request': request})}.png"
+
+    def get(self, request: Dict) -> Optional[str]:
+        # The base64 encoded image generated for `request`, none if it is not cached
+        return self.load(self.object_key(request))
+
+    def load(self, key: str) -> Optional[str]:
+        # The base64 encoded image stored under `key`, none if it is not cached (or was evicted)
+        start = time.perf_counter()
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            # A cache failure is a miss, rather than a failed request
+            if e.response["Error"]["Code"] != "NoSuchKey":
+                logger.warning(f"Image cache unavailable: {e}")
+            self.record("Misses", time.perf_counter() - start)
+            return None
+        image = base64.b64encode(response["Body"].read()).decode("utf-8")
+        self.record("Hits", time.perf_counter() - start)
+        return image
+
+    def put(self, request: Dict, image: str) -> Optional[str]:
+        key = self.object_key(request)
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=base64.b64decode(image), ContentType="image/png")
+        except ClientError as e:
+            logger.warning(f"Image not cached: {e}")
+            return None
+        return key
+
+    def record(self, outcome: str, seconds: float) -> None:
+        self.counters[outcome] += 1
+        if self.namespace:
+            metrics.emit(
+                metrics.emf_record(
+                    namespace=self.namespace,
+                    dimensions={"Cache": "Image"},
+                    values={"CacheHit": int(outcome == "Hits"), "CacheLookup": seconds},
+                    units={"CacheHit": "Count", "CacheLookup": "Seconds"}
+                )
+            )
+
+    def report(self) -> Dict:
+        return dict(self.counters)
+
+
+def evict(client: Any, bucket: str, max_bytes: int=MAX_BYTES, prefix: str=KEY_PREFIX) -> Dict:
+    # Delete the oldest images until the cache is within `max_bytes`. Images past the maximum age are
+    # expired by the bucket's lifecycle rule
+    objects = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        objects += page.get("Contents", [])
+    total_bytes = sum(item["Size"] for item in objects)
+    evicted: List[Dict] = []
+    for item in sorted(objects, key=lambda item: item["LastModified"]):
+        if total_bytes <= max_bytes:
+            break
+        evicted.append(item)
+        total_bytes -= item["Size"]
+    for i in range(0, len(evicted), DELETE_BATCH_SIZE):
+        client.delete_objects(
+            Bucket=bucket,
+            Delete={
+                "Objects": [{"Key": item["Key"]} for item in evicted[i:i + DELETE_BATCH_SIZE]],
+                "Quiet": True
+            }
+        )
+    return {
+        "objects": len(objects) - len(evicted),
+        "bytes": total_bytes,
+        "evicted_objects": len(evicted),
+        "evicted_bytes": sum(item["Size"] for item in evicted)
+    }
+
+
+def from_env(model_id: str, defaults: Dict) -> Optional[ImageCache]:
+    # IMAGE_CACHE_BUCKET enables the cache
+    bucket = os.getenv("IMAGE_CACHE_BUCKET")
+    if not bucket:
+        return None
+    return ImageCache(bucket=bucket, model_id=model_id, defaults=defaults, namespace=os.getenv("METRICS_NAMESPACE"))
@@ -0,0 +1,107 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Image output through S3. Rather than a base64 string in the JSON response (a third larger than the
+image, and bounded by the 10 MB API Gateway payload limit), the image is written to S3, optionally
+transcoded to WebP, or JPEG, with a thumbnail, and the response carries a presigned URL and metadata.
+"""
+
+import io
+import os
+import boto3
+import base64
+import hashlib
+import logging
+
+from botocore.config import Config
+from PIL import Image
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_MODES = ["base64", "url"]
+OUTPUT_FORMATS = {
+    "png": {"content_type": "image/png", "params": {"optimize": True}},
+    "webp": {"content_type": "image/webp", "params": {"quality": 90, "method": 4}},
+    "jpeg": {"content_type": "image/jpeg", "params": {"quality": 90, "optimize": True}}
+}
+OUTPUT_PREFIX = "outputs"
+URL_EXPIRES_SECONDS = 3600
+THUMBNAIL_SIZE = 256 # Longest side, in pixels
+
+
+def transcode(png: bytes, output_format: str, max_size: Optional[int]=None) -> Tuple[bytes, Dict]:
+    # The image in `output_format`, scaled down to `max_size` (longest side), and its dimensions
+    if output_format == "png" and max_size is None:
+        with Image.open(io.BytesIO(png)) as image:
+            return png, {"width": image.width, "height": image.height}
+    with Image.open(io.BytesIO(png)) as image:
+        image = image.convert("RGB") if output_format == "jpeg" else image
+        if max_size:
+            image.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format.upper(), **OUTPUT_FORMATS[output_format]["params"])
+        return buffer.getvalue(), {"width": image.width, "height": image.height}
+
+
+class ImageOutput:
+
+    def __init__(self, bucket: str, client=None, expires_in: int=URL_EXPIRES_SECONDS, prefix: str=OUTPUT_PREFIX) -> None:
+        self.bucket = bucket
+        # Presigned URLs need SigV4, and the regional endpoint of the bucket
+        self.client = client or boto3.client("s3", config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"}))
+        self.expires_in = expires_in
+        self.prefix = prefix
+
+    def put(self, key: str, body: bytes, output_format: str, dimensions: Dict) -> Dict:
+        content_type = OUTPUT_FORMATS[output_format]["content_type"]
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+        return {
+            "url": self.presign(key),
+            "key": key,
+            "content_type": content_type,
+            "bytes": len(body),
+            "expires_in": self.expires_in,
+            **dimensions
+        }
+
+    def presign(self, key: str) -> str:
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=self.expires_in)
+
+    def refresh(self, stored: Dict) -> Dict:
+        # Stored images with new URLs, e.g. for a job result that is fetched after its URLs expired
+        return {name: {**output, "url": self.presign(output["key"])} for name, output in stored.items()}
+
+    def store(self, image: str, output_format: str="png", thumbnail: bool=False) -> Dict:
+        # Write the base64 encoded PNG `image` to S3, keyed by its content, and return its presigned URL
+        png = base64.b64decode(image)
+        digest = hashlib.sha256(png).hexdigest()
+        body, dimensions = transcode(png, output_format)
+        result = {"image": self.put(f"{self.prefix}/{digest}.{output_format}", body, output_format, dimensions)}
+        if thumbnail:
+            body, dimensions = transcode(png, output_format, max_size=THUMBNAIL_SIZE)
+            result["thumbnail"] = self.put(f"{self.prefix}/{digest}-{THUMBNAIL_SIZE}.{output_format}", body, output_format, dimensions)
+        logger.info(f"Stored image {digest[:12]} as {output_format}: {result['image']['bytes']} bytes, base64 {len(image)} characters")
+        return result
+
+
+def from_env() -> Optional[ImageOutput]:
+    # IMAGE_OUTPUT_BUCKET enables the URL output mode
+    bucket = os.getenv("IMAGE_OUTPUT_BUCKET")
+    return ImageOutput(bucket=bucket) if bucket else None
@@ -0,0 +1,366 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import json
+import time
+import hashlib
+import boto3
+import logging
+import requests
+
+from requests.auth import HTTPBasicAuth
+from typing import Dict, Iterator, List, Tuple, Any
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from botocore.exceptions import ClientError
+from llmops import dedup, embeddings, logs, retrieval
+from llmops.metrics import StageMetrics
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 100 # No. of documents sent per OpenSearch `_bulk` request
+DEDUP_THRESHOLD = 0.9 # Passages at, or above, this similarity to an earlier passage are not indexed
+CHUNK_SIZE = 256 # Size of the child passages that are embedded, and searched
+PARENT_CHUNK_SIZE = 1024 # Size of the parent windows that are returned as context, 0 disables parent windows
+DEFAULT_COLLECTION = "default" # Collection of documents uploaded to the root of the bucket
+METADATA_FIELDS = ["collection", "ingest_version", "ingested_at"] # Stored with each passage, for filtered search
+PROGRESS_LOG_SECONDS = 30 # Indexing progress is logged at most this often
+BULK_RETRIES = 3 # Attempts for a `_bulk` request throttled by OpenSearch (HTTP 429)
+
+
+def log_sampled(n: int) -> bool:
+    # Log the first few items, and then every 100th item, instead of every item
+    return n <= 5 or n % 100 == 0
+
+
+def get_domain_url(endpoint: str) -> str:
+    return f"https://{endpoint}" if not endpoint.startswith("https://") else endpoint
+
+
+def get_credentials(secret_id: str, region: str) -> Tuple[str, str]:
+    client = boto3.client("secretsmanager", region_name=region)
+    try:
+        response = client.get_secret_value(SecretId=secret_id)
+        json_body = json.loads(response["SecretString"])
+        return json_body["USERNAME"], json_body["PASSWORD"]
+
+    except ClientError as e:
+        message = e.response["Error"]["Message"]
+        logger.error(message)
+        raise e
+
+
+def recreate_index(url: str, body: Dict, username: str, password: str) -> None:
+    response = requests.head(url, auth=HTTPBasicAuth(username, password))
+    if response.status_code != 404:
+        logger.info(f"{url} already exists!")
+        response = requests.delete(url, auth=HTTPBasicAuth(username, password))
+    logger.info(f"Creating fresh index: {url}")
+    response = requests.put(url, auth=HTTPBasicAuth(username, password), json=body)
+    logger.info("Fresh index created: %s", logs.truncate(response.text, 1000))
+
+
+def verify_index(endpoint: str, index: str, username: str, password: str, embedding_config: Dict) -> Any:
+    knn_index = {
+        "settings": {
+            "index": {
+                "knn": True  # Enable k-NN search for this index
+            }
+        },
+        "mappings": {
+            "_meta": embeddings.index_metadata(embedding_config),
+            "properties": {
+                "vector_field": {  # k-NN vector field
+                    "type": "knn_vector",
+                    "dimension": embedding_config["dimension"],  # Dimension of the vector
+                    "method": {  # The faiss engine applies filters during the search (OpenSearch 2.9+)
+                        "name": "hnsw",
+                        "engine": "faiss",
+                        "space_type": "innerproduct"  # Vectors are unit length, so this ranks by cosine similarity
+                    }
+                },
+                "file_name": {  # Metadata fields are keywords (or dates), so that they can be used as filters
+                    "type": "keyword"
+                },
+                "page": {
+                    "type": "keyword"
+                },
+                "collection": {  # S3 prefix (folder) of the document
+                    "type": "keyword"
+                },
+                "ingest_version": {  # S3 version id of the upload that ingested the document
+                    "type": "keyword"
+                },
+                "ingested_at": {
+                    "type": "date",
+                    "format": "epoch_millis"
+                },
+                "passage": {
+                    "type": "text"
+                },
+                "start": {  # Character offsets of the passage within the source document
+                    "type": "integer"
+                },
+                "end": {
+                    "type": "integer"
+                },
+                "parent_id": {  # Parent window that is returned as context for this passage
+                    "type": "keyword"
+                }
+            }
+        }
+    }
+    # Parent windows are only fetched by id, so the passage is stored without being searchable
+    parent_index = {
+        "mappings": {
+            "properties": {
+                "file_name": {
+                    "type": "keyword"
+                },
+                "page": {
+                    "type": "keyword"
+                },
+                "passage": {
+                    "type": "text",
+                    "index": False
+                },
+                "start": {
+                    "type": "integer"
+                },
+                "end": {
+                    "type": "integer"
+                }
+            }
+        }
+    }
+    recreate_index(url=f"{endpoint}/{index}", body=knn_index, username=username, password=password)
+    recreate_index(url=f"{endpoint}/{retrieval.parent_index_name(index)}", body=parent_index, username=username, password=password)
+
+
+def doc_iterator(dir_path: str, metrics: StageMetrics=None) -> Iterator[Tuple[str, str, str, str, str]]:
+    # Documents are stored under their S3 key, relative to the data path, and the key prefix is the collection
+    metrics = metrics or StageMetrics()
+    for root, _, filenames in os.walk(dir_path):
+        collection = os.path.relpath(root, dir_path).replace(os.sep, "/")
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            page = filename.split(".")[0].split("_")[-1]
+            if os.path.isfile(file_path):
+                with metrics.time("read"):
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        file_contents = f.read()
+                key = os.path.relpath(file_path, dir_path).replace(os.sep, "/")
+                yield filename, page, DEFAULT_COLLECTION if collection == "." else collection, file_contents, key
+
+
+def parent_id_of(key: str, window_no: int) -> str:
+    # Parent windows are identified by the document's relative key, so that documents with the same file
+    # name, under different prefixes (collections), do not overwrite each other's windows
+    return f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}-{window_no}"
+
+
+def get_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
+        chunk_overlap=chunk_overlap,
+    )
+
+
+def split_with_offsets(text_splitter: RecursiveCharacterTextSplitter, text: str, offset: int=0) -> List[Tuple[int, str]]:
+    # Locate each split within the source text, so that passages can be traced back to character offsets
+    splits = []
+    cursor = 0
+    for split in text_splitter.split_text(text):
+        start = text.find(split, cursor)
+        if start == -1:
+            start = cursor
+        splits.append((offset + start, split))
+        cursor = start + 1
+    return splits
+
+
+def create_chunks(data_path: str, chunk_size: int, chunk_overlap: int, dedup_threshold: float=DEDUP_THRESHOLD, parent_chunk_size: int=PARENT_CHUNK_SIZE, embedding_dimension: int=1536, metadata: Dict=None, metrics: StageMetrics=None) -> Tuple[List[Dict], List[Dict]]:
+    # Split each document into parent windows, and each parent window into the (smaller) child passages
+    # that are embedded. Without parent windows, documents are split directly into passages.
+    metrics = metrics or StageMetrics()
+    chunks = []
+    parents = []
+    total_passages = 0
+    text_splitter = get_text_splitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    parent_splitter = get_text_splitter(chunk_size=parent_chunk_size, chunk_overlap=0) if parent_chunk_size else None
+    for n_docs, (file_name, page, collection, doc, key) in enumerate(doc_iterator(data_path, metrics=metrics), start=1):
+        start_time = time.perf_counter()
+        n_passages = 0
+        windows = split_with_offsets(parent_splitter, doc) if parent_splitter else [(0, doc)]
+        for window_no, (window_start, window) in enumerate(windows):
+            parent_id = parent_id_of(key, window_no) if parent_splitter else None
+            if parent_id:
+                parents.append({
+                    "parent_id": parent_id,
+                    "file_name": file_name,
+                    "page": page,
+                    "passage": window,
+                    "start": window_start,
+                    "end": window_start + len(window)
+                })
+            for start, chunk in split_with_offsets(text_splitter, window, offset=window_start):
+                chunks.append({
+                    "file_name": file_name,
+                    "page": page,
+                    "passage": chunk,
+                    "start": start,
+                    "end": start + len(chunk),
+                    "parent_id": parent_id,
+                    "collection": collection,
+                    **(metadata or {})
+                })
+                n_passages += 1
+                total_passages += 1
+        metrics.record("split", seconds=time.perf_counter() - start_time, items=n_passages)
+        if log_sampled(n_docs):
+            logger.info(f"Document {n_docs}: {file_name} segmented into {n_passages} passages, across {len(windows) if parent_splitter else 0} parent windows")
+    if dedup_threshold:
+        with metrics.time("dedup", items=len(chunks)):
+            chunks, duplicates = dedup.drop_near_duplicates(chunks, threshold=dedup_threshold)
+        metrics.count("DuplicatesDropped", len(duplicates))
+        saved_bytes = sum(len(chunk["passage"].encode("utf-8")) + 4 * embedding_dimension for chunk in duplicates)
+        logger.info(
+            f"Dropped {len(duplicates)} near-duplicate passages (similarity >= {dedup_threshold}): "
+            f"{len(duplicates)} fewer Bedrock embedding calls, ~{saved_bytes / 1024:.1f} KiB smaller index "
+            f"({len(duplicates) / max(total_passages, 1):.1%} reduction)"
+        )
+    # Only parent windows that still have a passage pointing at them are stored
+    referenced = {chunk["parent_id"] for chunk in chunks}
+    parents = [parent for parent in parents if parent["parent_id"] in referenced]
+    logger.info(f"Total passages to index: {len(chunks)}, parent windows to store: {len(parents)}")
+    return chunks, parents
+
+
+def get_embedding(client: Any, passage: str, embedding_config: Dict, metrics: StageMetrics=None) -> List[float]:
+    metrics = metrics or StageMetrics()
+    try:
+        with metrics.time("embed"):
+            response = client.invoke_model(
+                body=embeddings.build_request(passage, embedding_config),
+                modelId=embedding_config["model_id"],
+                accept="application/json",
+                contentType="application/json"
+            )
+            embedding = embeddings.parse_response(json.loads(response.get("body").read()), embedding_config)
+        # The SDK retries throttled, and transient errors itself, which would otherwise go unnoticed
+        metrics.count("BedrockRetries", response["ResponseMetadata"].get("RetryAttempts", 0))
+        return embedding
+
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ThrottlingException":
+            metrics.count("BedrockThrottles")
+        message = e.response["Error"]["Message"]
+        logger.error(message)
+        raise e
+
+
+def bulk_index(endpoint: str, index: str, username: str, password: str, documents: List[Dict], ids: List[str]=None, metrics: StageMetrics=None, stage: str="index") -> int:
+    # Send the documents as a single NDJSON `_bulk` request, returning the number of failed documents
+    metrics = metrics or StageMetrics()
+    actions = [{"index": {"_index": index, "_id": id}} for id in ids] if ids else [{"index": {"_index": index}}] * len(documents)
+    payload = "".join(
+        json.dumps(action) + "\n" + json.dumps(document) + "\n" for action, document in zip(actions, documents)
+    )
+    metrics.gauge_max("MaxBulkQueueDepth", len(documents))
+    for attempt in range(1, BULK_RETRIES + 1):
+        with metrics.time(stage, items=len(documents)):
+            response = requests.post(
+                f"{endpoint}/_bulk",
+                auth=HTTPBasicAuth(username, password),
+                data=payload,
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+        if response.status_code != 429 or attempt == BULK_RETRIES:
+            break
+        metrics.count("OpenSearchThrottles")
+        metrics.count("OpenSearchRetries")
+        time.sleep(2 ** attempt)
+    if response.status_code not in [200, 201]:
+        logger.info("Bulk ingest failure: %s, Message: %s", response.status_code, logs.truncate(response.text, 1000))
+        return len(documents)
+    result = response.json()
+    if not result.get("errors"):
+        return 0
+    failures = [item["index"] for item in result["items"] if item["index"].get("error")]
+    for failure in failures[:5]:
+        logger.info("Chunk ingest failure: %s, Message: %s", failure["status"], logs.lazy_json(failure["error"]))
+    return len(failures)
+
+
+def index_chunks(client: Any, chunks: List[Dict], embedding_config: Dict, endpoint: str, index: str, username: str, password: str, batch_size: int=BULK_BATCH_SIZE, metrics: StageMetrics=None) -> Dict:
+    # Embed each chunk with Bedrock and store it, including the vector representation, in OpenSearch
+    metrics = metrics or StageMetrics()
+    indexed = 0
+    failed = 0
+    batch = []
+    last_log = time.time()
+    for i, chunk in enumerate(chunks, start=1):
+        passage = chunk["passage"]
+        batch.append({
+            "vector_field": get_embedding(client=client, passage=passage, embedding_config=embedding_config, metrics=metrics),
+            "file_name": chunk["file_name"],
+            "page": chunk["page"],
+            "passage": passage,
+            "start": chunk["start"],
+            "end": chunk["end"],
+            "parent_id": chunk["parent_id"],
+            **{field: chunk[field] for field in METADATA_FIELDS if field in chunk}
+        })
+        if len(batch) == batch_size or i == len(chunks):
+            errors = bulk_index(endpoint=endpoint, index=index, username=username, password=password, documents=batch, metrics=metrics)
+            indexed += len(batch) - errors
+            failed += errors
+            batch = []
+            if time.time() - last_log >= PROGRESS_LOG_SECONDS or i == len(chunks):
+                logger.info(f"Indexed {indexed}/{len(chunks)} chunks ({failed} failed)")
+                last_log = time.time()
+    metrics.count("IndexFailures", failed)
+    return {
+        "indexed": indexed,
+        "failed": failed
+    }
+
+
+def index_parents(parents: List[Dict], endpoint: str, index: str, username: str, password: str, batch_size: int=BULK_BATCH_SIZE, metrics: StageMetrics=None) -> Dict:
+    # Store the parent windows in the parent index, using the `parent_id` as the document id
+    metrics = metrics or StageMetrics()
+    failed = 0
+    for i in range(0, len(parents), batch_size):
+        batch = parents[i:i + batch_size]
+        failed += bulk_index(
+            endpoint=endpoint,
+            index=retrieval.parent_index_name(index),
+            username=username,
+            password=password,
+            documents=[{key: value for key, value in parent.items() if key != "parent_id"} for parent in batch],
+            ids=[parent["parent_id"] for parent in batch],
+            metrics=metrics,
+            stage="index_parents"
+        )
+    logger.info(f"Stored {len(parents) - failed}/{len(parents)} parent windows ({failed} failed)")
+    return {
+        "parents_indexed": len(parents) - failed,
+        "parents_failed": failed
+    }
@@ -0,0 +1,177 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Asynchronous jobs, for requests that can run longer than the API Gateway integration timeout. A job is
+stored, and queued, when it is submitted, a worker runs it, and stores its result, and clients poll the
+job (optionally waiting for it to complete) until the result is ready.
+"""
+
+import os
+import json
+import time
+import uuid
+import boto3
+import queue
+import logging
+import threading
+
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+COMPLETED = [SUCCEEDED, FAILED]
+
+JOB_TTL_SECONDS = 86400 # Jobs, and their results, are kept for a day
+MAX_WAIT_SECONDS = 20.0 # Longest wait of a poll for completion, within the API Gateway integration timeout
+POLL_SECONDS = 0.5
+
+
+class MemoryQueue:
+    # Stands in for the SQS queue, e.g. for local runs, and tests
+
+    def __init__(self) -> None:
+        self.messages = queue.Queue()
+
+    def send(self, message: Dict) -> None:
+        self.messages.put(json.dumps(message))
+
+    def receive(self, timeout: float=0.0) -> Optional[Dict]:
+        try:
+            return json.loads(self.messages.get(timeout=timeout) if timeout else self.messages.get_nowait())
+        except queue.Empty:
+            return None
+
+
+class SQSQueue:
+    # Messages are received by the worker's event source mapping, rather than by this class
+
+    def __init__(self, queue_url: str, client=None) -> None:
+        self.queue_url = queue_url
+        self.client = client or boto3.client("sqs")
+
+    def send(self, message: Dict) -> None:
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+
+
+class MemoryJobStore:
+    # Jobs of a single process, e.g. for local runs, and tests
+
+    def __init__(self) -> None:
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            return json.loads(self.jobs[job_id]) if job_id in self.jobs else None
+
+    def put(self, job: Dict) -> None:
+        with self.lock:
+            self.jobs[job["job_id"]] = json.dumps(job)
+
+
+class DynamoDBJobStore:
+    # Jobs shared by the API, and the worker, one item per job, expired by the table's TTL
+
+    def __init__(self, table_name: str, client=None) -> None:
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        item = self.client.get_item(TableName=self.table_name, Key={"job_id": {"S": job_id}}, ConsistentRead=True).get("Item")
+        return json.loads(item["job"]["S"]) if item else None
+
+    def put(self, job: Dict) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "job_id": {"S": job["job_id"]},
+                "status": {"S": job["status"]},
+                "job": {"S": json.dumps(job)},
+                "expires_at": {"N": str(int(job["created_at"]) + JOB_TTL_SECONDS)}
+            }
+        )
+
+
+class JobService:
+
+    def __init__(self, store=None, queue=None, clock: Callable[[], float]=time.time, sleep: Callable[[float], None]=time.sleep) -> None:
+        self.store = store or MemoryJobStore()
+        self.queue = queue or MemoryQueue()
+        self.clock = clock
+        self.sleep = sleep
+
+    def submit(self, request: Dict) -> Dict:
+        now = self.clock()
+        job = {"job_id": uuid.uuid4().hex, "status": QUEUED, "request": request, "created_at": now, "updated_at": now}
+        self.store.put(job)
+        self.queue.send({"job_id": job["job_id"]})
+        logger.info(f"Queued job {job['job_id']}")
+        return job
+
+    def get(self, job_id: str, wait: float=0.0) -> Optional[Dict]:
+        # The job, after waiting up to `wait` seconds for it to complete, none if it does not exist
+        start = self.clock()
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job["status"] in COMPLETED or self.clock() - start + POLL_SECONDS > min(wait, MAX_WAIT_SECONDS):
+                return job
+            self.sleep(POLL_SECONDS)
+
+    def update(self, job: Dict, status: str, **fields) -> Dict:
+        job = {**job, **fields, "status": status, "updated_at": self.clock()}
+        self.store.put(job)
+        return job
+
+    def run(self, job_id: str, fn: Callable[[Dict], Dict], retryable: Callable[[Exception], bool]=lambda error: False) -> Optional[Dict]:
+        # Run the job's request through `fn`, storing its result, or error. A retryable error (e.g. a
+        # throttled call) puts the job back in the queued state, and is raised, so that the queue
+        # delivers the job again. Queues deliver at least once, so a completed job is not run again
+        job = self.store.get(job_id)
+        if job is None or job["status"] in COMPLETED:
+            logger.info(f"Skipped job {job_id}: {job['status'] if job else 'not found'}")
+            return job
+        job = self.update(job, RUNNING)
+        try:
+            result = fn(job["request"])
+        except Exception as e:
+            if retryable(e):
+                self.update(job, QUEUED)
+                raise
+            logger.exception(f"Job {job_id} failed")
+            return self.update(job, FAILED, error=str(e))
+        logger.info(f"Job {job_id} succeeded in {self.clock() - job['created_at']:.2f}s")
+        return self.update(job, SUCCEEDED, result=result)
+
+
+def view(job: Dict) -> Dict:
+    # The job as returned to clients, without its request
+    return {name: value for name, value in job.items() if name != "request"}
+
+
+def from_env() -> Optional[JobService]:
+    # JOB_TABLE, and JOB_QUEUE_URL enable the jobs
+    table_name = os.getenv("JOB_TABLE")
+    queue_url = os.getenv("JOB_QUEUE_URL")
+    if not table_name or not queue_url:
+        return None
+    return JobService(store=DynamoDBJobStore(table_name), queue=SQSQueue(queue_url))
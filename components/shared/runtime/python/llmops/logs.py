@@ -0,0 +1,120 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Logging for the Lambda Functions, kept off the hot path: records are written as JSON lines, long
+messages are truncated, verbose records (e.g. full answers, and passages) are sampled, and expensive
+values (e.g. the event) are only serialized when their record is actually written.
+"""
+
+import os
+import json
+import random
+import logging
+
+from typing import Any, Callable, Optional
+
+MAX_MESSAGE_CHARS = 4000 # Longer messages are truncated
+MAX_FIELD_CHARS = 256 # Longer strings inside logged values, e.g. a base64 image in an event body, are truncated
+VERBOSE_SAMPLE_RATE = 0.1 # Share of the verbose records that are written
+VERBOSE = {"verbose": True} # `extra` of a verbose record, e.g. `logger.info("...", extra=logs.VERBOSE)`
+# Attributes of every record, anything else was added with `extra`, and is written as a field
+RECORD_ATTRIBUTES = set(logging.LogRecord("", logging.INFO, "", 0, "", (), None).__dict__) | {"message", "asctime", "verbose", "aws_request_id"}
+
+
+def truncate(text: str, limit: int=MAX_MESSAGE_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more characters]"
+
+
+def clip(value: Any, limit: int=MAX_FIELD_CHARS) -> Any:
+    # A copy of the value, with long strings truncated, so that it is cheap to serialize
+    if isinstance(value, str):
+        return truncate(value, limit)
+    if isinstance(value, dict):
+        return {key: clip(item, limit) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [clip(item, limit) for item in value]
+    return value
+
+
+class Lazy:
+    # A log argument that is formatted when its record is written, so never for a disabled level
+
+    def __init__(self, format: Callable[..., Any], *args: Any) -> None:
+        self.format = format
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.format(*self.args))
+
+
+def lazy_json(value: Any, limit: int=MAX_FIELD_CHARS) -> Lazy:
+    # e.g. `logger.debug("Received event: %s", logs.lazy_json(event))`
+    return Lazy(lambda: json.dumps(clip(value, limit), default=str))
+
+
+class SampleFilter(logging.Filter):
+
+    def __init__(self, rate: float=VERBOSE_SAMPLE_RATE, random: Callable[[], float]=random.random) -> None:
+        super().__init__()
+        self.rate = rate
+        self.random = random
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "verbose", False) or self.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, max_chars: int=MAX_MESSAGE_CHARS) -> None:
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.max_chars)
+        }
+        # Set by the Lambda runtime
+        if getattr(record, "aws_request_id", None):
+            entry["request_id"] = record.aws_request_id
+        entry.update({name: clip(value) for name, value in record.__dict__.items() if name not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = truncate(self.formatException(record.exc_info), self.max_chars)
+        return json.dumps(entry, default=str)
+
+
+def configure(level: Optional[str]=None, sample_rate: Optional[float]=None) -> logging.Logger:
+    # Configures the root logger, which the Lambda runtime writes to CloudWatch Logs, at LOG_LEVEL (INFO
+    # by default), sampling verbose records at LOG_SAMPLE_RATE
+    logger = logging.getLogger()
+    logger.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", VERBOSE_SAMPLE_RATE))
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    for handler in logger.handlers:
+        handler.setFormatter(JsonFormatter())
+        for existing in [f for f in handler.filters if isinstance(f, SampleFilter)]:
+            handler.removeFilter(existing)
+        handler.addFilter(SampleFilter(sample_rate))
+    return logger
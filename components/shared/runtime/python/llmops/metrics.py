@@ -0,0 +1,250 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Stage timing, and counters, reported as a JSON summary, and as CloudWatch Embedded Metric Format
+(EMF) records. EMF records are plain JSON log lines which CloudWatch Logs turns into metrics, without
+any PutMetricData calls.
+"""
+
+import math
+import time
+import json
+import threading
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Units of the per-request stage metrics
+STAGE_UNITS = {
+    "Latency": "Milliseconds",
+    "Bytes": "Bytes",
+    "InputTokens": "Count",
+    "OutputTokens": "Count",
+    "CacheHit": "Count"
+}
+cold = True # Until the first invocation of the container
+
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest-rank percentile, `q` in [0, 100]
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def emf_record(namespace: str, dimensions: Dict[str, str], values: Dict[str, float], units: Dict[str, str], properties: Dict=None, dimension_sets: Optional[List[List[str]]]=None) -> Dict:
+    # The metrics are published for each dimension set, by default the set of all the dimensions
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": dimension_sets or [list(dimensions.keys())],
+                    "Metrics": [{"Name": name, "Unit": units.get(name, "None")} for name in values]
+                }
+            ]
+        },
+        **dimensions,
+        **(properties or {}),
+        **values
+    }
+
+
+def emit(record: Dict) -> None:
+    # EMF records must be written as raw JSON lines, without a logging prefix
+    print(json.dumps(record), flush=True)
+
+
+def put_metrics(client: Any, records: List[Dict]) -> None:
+    # CloudWatch only extracts EMF from Lambda (and agent) logs, e.g. SageMaker jobs publish the same records explicitly
+    for record in records:
+        for directive in record["_aws"]["CloudWatchMetrics"]:
+            dimensions = [{"Name": name, "Value": str(record[name])} for name in directive["Dimensions"][0]]
+            client.put_metric_data(
+                Namespace=directive["Namespace"],
+                MetricData=[
+                    {
+                        "MetricName": metric["Name"],
+                        "Dimensions": dimensions,
+                        "Value": record[metric["Name"]],
+                        "Unit": metric["Unit"]
+                    } for metric in directive["Metrics"]
+                ]
+            )
+
+
+class StageMetrics:
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.latencies = {}
+        self.items = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def record(self, stage: str, seconds: float, items: int=1) -> None:
+        self.latencies.setdefault(stage, []).append(seconds)
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    @contextmanager
+    def time(self, stage: str, items: int=1) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, seconds=time.perf_counter() - start_time, items=items)
+
+    def count(self, name: str, value: int=1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge_max(self, name: str, value: float) -> None:
+        # Keep the high-water mark, e.g. the deepest a queue got during the run
+        self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def report(self) -> Dict:
+        stages = {}
+        for stage, latencies in self.latencies.items():
+            total_seconds = sum(latencies)
+            stages[stage] = {
+                "calls": len(latencies),
+                "items": self.items[stage],
+                "total_seconds": round(total_seconds, 3),
+                "items_per_second": round(self.items[stage] / total_seconds, 2) if total_seconds else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+            }
+        return {
+            "duration_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges)
+        }
+
+    def emf_records(self, namespace: str, dimensions: Dict[str, str]) -> List[Dict]:
+        # One record per stage (with a `Stage` dimension), and one record for the run-level counters
+        report = self.report()
+        records = [
+            emf_record(
+                namespace=namespace,
+                dimensions={**dimensions, "Stage": stage},
+                values={
+                    "Calls": values["calls"],
+                    "ItemsPerSecond": values["items_per_second"],
+                    "LatencyP50": values["p50_ms"],
+                    "LatencyP99": values["p99_ms"]
+                },
+                units={
+                    "Calls": "Count",
+                    "ItemsPerSecond": "Count/Second",
+                    "LatencyP50": "Milliseconds",
+                    "LatencyP99": "Milliseconds"
+                }
+            ) for stage, values in report["stages"].items()
+        ]
+        values = {**report["counters"], **report["gauges"], "Duration": report["duration_seconds"]}
+        records.append(
+            emf_record(
+                namespace=namespace,
+                dimensions=dimensions,
+                values=values,
+                units={name: "Seconds" if name == "Duration" else "Count" for name in values}
+            )
+        )
+        return records
+
+
+def cold_start() -> bool:
+    # True for the first invocation of a container, which also paid for the imports, and the clients
+    global cold
+    was_cold, cold = cold, False
+    return was_cold
+
+
+class Stage:
+
+    def __init__(self, name: str, model_id: Optional[str]=None) -> None:
+        self.name = name
+        self.model_id = model_id # May be set inside the stage, e.g. once the router chose the model
+        self.values = {}
+
+    def add(self, **values: float) -> None:
+        # e.g. `stage.add(InputTokens=..., OutputTokens=...)`, see STAGE_UNITS
+        self.values.update(values)
+
+
+class RequestMetrics:
+    # Per-stage latency, bytes, tokens, and cache hits, of a single request. Each stage is emitted as
+    # an EMF record, so that CloudWatch computes the latency percentiles of each stage across requests
+
+    def __init__(self, namespace: str, cold_start: bool=False, clock: Callable[[], float]=time.perf_counter) -> None:
+        self.namespace = namespace
+        self.cold_start = cold_start
+        self.clock = clock
+        self.stages = []
+        self.lock = threading.Lock() # Stages may run concurrently, e.g. the samples of an image request
+
+    @contextmanager
+    def stage(self, name: str, model_id: Optional[str]=None) -> Iterator[Stage]:
+        # Failed stages are recorded as well, the time was spent all the same
+        stage = Stage(name, model_id)
+        start_time = self.clock()
+        try:
+            yield stage
+        finally:
+            stage.add(Latency=(self.clock() - start_time) * 1000)
+            self.record(stage)
+
+    def record(self, stage: Stage) -> None:
+        with self.lock:
+            self.stages.append(stage)
+
+    def emf_records(self) -> List[Dict]:
+        records = []
+        for stage in self.stages:
+            dimensions = {"Stage": stage.name, "ColdStart": str(self.cold_start).lower()}
+            dimension_sets = [["Stage"], ["Stage", "ColdStart"]]
+            if stage.model_id:
+                dimensions["ModelId"] = stage.model_id
+                dimension_sets.append(["Stage", "ModelId"])
+            records.append(
+                emf_record(
+                    namespace=self.namespace,
+                    dimensions=dimensions,
+                    values=stage.values,
+                    units=STAGE_UNITS,
+                    dimension_sets=dimension_sets
+                )
+            )
+        return records
+
+    def emit(self) -> None:
+        for record in self.emf_records():
+            emit(record)
+
+
+@contextmanager
+def stage(request_metrics: Optional[RequestMetrics], name: str, model_id: Optional[str]=None) -> Iterator[Stage]:
+    # Times the stage of an instrumented request, otherwise the stage is discarded
+    if request_metrics is None:
+        yield Stage(name, model_id)
+        return
+    with request_metrics.stage(name, model_id) as timed:
+        yield timed
@@ -0,0 +1,286 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Bedrock text model adapters. Each model family declares how its request body is built, its default
+generation parameters, stop sequences, and how responses are parsed. A request template is
+compiled once per container, serializing the static part of the body, so that each request only
+serializes the prompt.
+"""
+
+import json
+
+from typing import Any, Callable, Dict, List, Optional
+
+# Claude models that support prompt caching on Bedrock, and the minimum tokens of a cached prefix.
+# Shorter prefixes are processed without caching, so they are not marked.
+PROMPT_CACHE_MODELS = {
+    "claude-3-5-haiku": 2048,
+    "claude-3-7-sonnet": 1024,
+    "claude-sonnet-4": 1024,
+    "claude-opus-4": 1024,
+    "claude-haiku-4": 2048
+}
+CHARS_PER_TOKEN = 4 # Rough estimate for English text
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant answering a human's questions. Provide a concise answer. Use a friendly tone. If the questions cannot be answered, say so. Do not make up answers. Answer the questions immediately without preamble."
+
+
+def anthropic_messages(system: Optional[str], prompt: str, continuation: Optional[str]=None) -> List[Dict]:
+    # A continuation is passed as the start of the assistant turn, which the model then completes
+    messages = [{"role": "user", "content": prompt}]
+    if continuation:
+        messages.append({"role": "assistant", "content": continuation.rstrip()})
+    return messages
+
+
+def anthropic_text(response_body: Dict) -> str:
+    return response_body.get("content")[0].get("text")
+
+
+def anthropic_truncated(response_body: Dict) -> bool:
+    return response_body.get("stop_reason") == "max_tokens"
+
+
+def anthropic_usage(response_body: Dict) -> Dict:
+    usage = response_body.get("usage", {})
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+        "cache_write_input_tokens": usage.get("cache_creation_input_tokens", 0)
+    }
+
+
+def llama2_prompt(system: Optional[str], prompt: str, continuation: Optional[str]=None) -> str:
+    text = f"[INST]{system}[/INST]\n\n{prompt}" if system else f"[INST]{prompt}[/INST]"
+    return f"{text}\n\n{continuation}" if continuation else text
+
+
+def llama3_prompt(system: Optional[str], prompt: str, continuation: Optional[str]=None) -> str:
+    system_turn = f"<|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>" if system else ""
+    return f"<|begin_of_text|>{system_turn}<|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n{continuation or ''}"
+
+
+def llama_text(response_body: Dict) -> str:
+    return response_body.get("generation")
+
+
+def llama_truncated(response_body: Dict) -> bool:
+    return response_body.get("stop_reason") == "length"
+
+
+def llama_usage(response_body: Dict) -> Dict:
+    return {
+        "input_tokens": response_body.get("prompt_token_count", 0),
+        "output_tokens": response_body.get("generation_token_count", 0),
+        "cache_read_input_tokens": 0,
+        "cache_write_input_tokens": 0
+    }
+
+
+def titan_prompt(system: Optional[str], prompt: str, continuation: Optional[str]=None) -> str:
+    text = f"{system}\n\nUser: {prompt}" if system else prompt
+    return f"{text}\nBot: {continuation}" if continuation else text
+
+
+def titan_text(response_body: Dict) -> str:
+    return response_body.get("results")[0].get("outputText")
+
+
+def titan_truncated(response_body: Dict) -> bool:
+    return response_body.get("results")[0].get("completionReason") == "LENGTH"
+
+
+def titan_usage(response_body: Dict) -> Dict:
+    return {
+        "input_tokens": response_body.get("inputTextTokenCount", 0),
+        "output_tokens": sum(result.get("tokenCount", 0) for result in response_body.get("results", [])),
+        "cache_read_input_tokens": 0,
+        "cache_write_input_tokens": 0
+    }
+
+
+# Model families, matched on the model id. The first family matching a model id is used, and Titan is
+# the fallback for other ids, such as the ARN of a (Titan based) custom model.
+ADAPTERS = {
+    "anthropic": {
+        "match": lambda model_id: "anthropic.claude" in model_id,
+        "prompt_field": "messages",
+        "format_prompt": anthropic_messages,
+        "system_field": "system",  # The system prompt is a request field, not part of the prompt
+        "defaults": {
+            "max_tokens": 4096,
+            "anthropic_version": "bedrock-2023-05-31",
+            "temperature": 0.5,
+            "top_k": 250,
+            "top_p": 1
+        },
+        "max_tokens_field": "max_tokens",
+        "max_output_tokens": 4096,  # Most output tokens the model generates for a request
+        "stop_sequences_field": "stop_sequences",
+        "stop_sequences": [],
+        "parse_response": anthropic_text,
+        "parse_truncated": anthropic_truncated,
+        "parse_usage": anthropic_usage,
+        "prompt_cache_min_tokens": lambda model_id: next((min_tokens for model, min_tokens in PROMPT_CACHE_MODELS.items() if model in model_id), None)
+    },
+    "llama2": {
+        "match": lambda model_id: "meta.llama2" in model_id,
+        "prompt_field": "prompt",
+        "format_prompt": llama2_prompt,
+        "system_field": None,
+        "defaults": {
+            "max_gen_len": 512,
+            "temperature": 0.5,
+            "top_p": 0.5
+        },
+        "max_tokens_field": "max_gen_len",
+        "max_output_tokens": 2048,
+        "stop_sequences_field": None,  # Not supported by the model
+        "stop_sequences": [],
+        "parse_response": llama_text,
+        "parse_truncated": llama_truncated,
+        "parse_usage": llama_usage,
+        "prompt_cache_min_tokens": lambda model_id: None
+    },
+    "llama3": {
+        "match": lambda model_id: "meta.llama3" in model_id,
+        "prompt_field": "prompt",
+        "format_prompt": llama3_prompt,
+        "system_field": None,
+        "defaults": {
+            "max_gen_len": 512,
+            "temperature": 0.5,
+            "top_p": 0.5
+        },
+        "max_tokens_field": "max_gen_len",
+        "max_output_tokens": 2048,
+        "stop_sequences_field": None,
+        "stop_sequences": [],
+        "parse_response": llama_text,
+        "parse_truncated": llama_truncated,
+        "parse_usage": llama_usage,
+        "prompt_cache_min_tokens": lambda model_id: None
+    },
+    "titan": {
+        "match": lambda model_id: True,
+        "prompt_field": "inputText",
+        "format_prompt": titan_prompt,
+        "system_field": None,
+        "defaults": {
+            "textGenerationConfig": {
+                "maxTokenCount": 512,
+                "stopSequences": [],
+                "temperature": 0,
+                "topP": 0.9
+            }
+        },
+        "max_tokens_field": "textGenerationConfig.maxTokenCount",
+        "max_output_tokens": 3072,  # The lowest limit of the Titan Text models (Premier)
+        "stop_sequences_field": "textGenerationConfig.stopSequences",
+        "stop_sequences": ["User:"],  # Stop the model from writing the next turn of the conversation
+        "parse_response": titan_text,
+        "parse_truncated": titan_truncated,
+        "parse_usage": titan_usage,
+        "prompt_cache_min_tokens": lambda model_id: None
+    }
+}
+
+
+def get_family(model_id: str) -> str:
+    return next(family for family, adapter in ADAPTERS.items() if adapter["match"](model_id))
+
+
+def set_field(body: Dict, path: str, value: Any) -> None:
+    # Set a (dot separated) nested field, e.g. `textGenerationConfig.stopSequences`
+    *parents, field = path.split(".")
+    for parent in parents:
+        body = body.setdefault(parent, {})
+    body[field] = value
+
+
+def prompt_cacheable(model_id: str, system: str) -> bool:
+    min_tokens = ADAPTERS[get_family(model_id)]["prompt_cache_min_tokens"](model_id)
+    return min_tokens is not None and len(system) / CHARS_PER_TOKEN >= min_tokens
+
+
+def compile_template(model_id: str, system: Optional[str]=None, params: Optional[Dict]=None, stop_sequences: Optional[List[str]]=None, cache_system: bool=False) -> Dict:
+    # Serialize the static part of the request body once. The prompt field is placed last, so that a
+    # body is the static prefix, the serialized prompt, and a closing brace. With `cache_system`, the
+    # system prompt is marked as a cacheable prefix, for models that support prompt caching, once it is
+    # long enough to be cached.
+    family = get_family(model_id)
+    adapter = ADAPTERS[family]
+    static = json.loads(json.dumps(adapter["defaults"]))
+    for path, value in (params or {}).items():
+        set_field(static, path, value)
+    if stop_sequences and adapter["stop_sequences_field"]:
+        set_field(static, adapter["stop_sequences_field"], stop_sequences)
+    prompt_cache = bool(system and cache_system and adapter["system_field"] and prompt_cacheable(model_id, system))
+    if system and adapter["system_field"]:
+        if prompt_cache:
+            static[adapter["system_field"]] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        else:
+            static[adapter["system_field"]] = system
+    return {
+        "model_id": model_id,
+        "family": family,
+        "system": None if adapter["system_field"] else system,  # Formatted into each prompt instead
+        "params": static,
+        "prefix": body_prefix(static, adapter["prompt_field"]),
+        "format_prompt": adapter["format_prompt"],
+        "prompt_cache": prompt_cache,
+        "parse_response": adapter["parse_response"],
+        "parse_truncated": adapter["parse_truncated"],
+        "parse_usage": adapter["parse_usage"]
+    }
+
+
+def body_prefix(static: Dict, prompt_field: str) -> str:
+    prefix = json.dumps(static)[:-1]
+    return (prefix + ", " if static else prefix) + json.dumps(prompt_field) + ": "
+
+
+def with_max_tokens(template: Dict, max_tokens: int) -> Dict:
+    # A copy of a compiled template, with a lower output token limit
+    adapter = ADAPTERS[template["family"]]
+    static = json.loads(json.dumps(template["params"]))
+    set_field(static, adapter["max_tokens_field"], max_tokens)
+    return {**template, "params": static, "prefix": body_prefix(static, adapter["prompt_field"]), "max_tokens": max_tokens}
+
+
+def build_body(template: Dict, prompt: str, continuation: Optional[str]=None) -> str:
+    return template["prefix"] + json.dumps(template["format_prompt"](template["system"], prompt, continuation)) + "}"
+
+
+def generate(client: Any, template: Dict, prompt: str, continuation: Optional[str]=None) -> Dict:
+    # Return the generated text, whether it was cut off by the output token limit, and the token usage,
+    # including prompt cache reads and writes. With a `continuation`, the model continues that text.
+    response = client.invoke_model(
+        body=build_body(template, prompt, continuation),
+        modelId=template["model_id"],
+        accept="application/json",
+        contentType="application/json"
+    )
+    response_body = json.loads(response.get("body").read())
+    return {
+        "text": template["parse_response"](response_body),
+        "truncated": template["parse_truncated"](response_body),
+        "usage": template["parse_usage"](response_body)
+    }
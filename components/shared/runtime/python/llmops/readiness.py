@@ -0,0 +1,78 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+k-NN index readiness. After a domain restart, or a re-ingest, the HNSW graphs are loaded from disk into
+native memory by the first queries, which pay for it with multi-second latency. Warming up the index
+loads the graphs ahead of traffic, and the k-NN stats show whether they are (still) in memory.
+"""
+
+import logging
+import requests
+
+from requests.auth import HTTPBasicAuth
+from typing import Dict, Optional
+from llmops import logs
+
+logger = logging.getLogger(__name__)
+
+
+def warmup(endpoint: str, index: str, username: str, password: str, timeout: Optional[float]=None) -> bool:
+    # Load the graphs of every shard of the index into native memory, this blocks until they are loaded
+    response = requests.get(f"{endpoint}/_plugins/_knn/warmup/{index}", auth=HTTPBasicAuth(username, password), timeout=timeout)
+    if response.status_code != 200:
+        logger.info("k-NN warmup failed: %s, Message: %s", response.status_code, logs.truncate(response.text, 1000))
+        return False
+    shards = response.json().get("_shards", {})
+    logger.info(f"k-NN warmup of {index}: {shards.get('successful', 0)}/{shards.get('total', 0)} shards loaded")
+    return not shards.get("failed")
+
+
+def check(endpoint: str, index: str, username: str, password: str, timeout: Optional[float]=None) -> Dict:
+    # The index is ready for traffic when it exists, and its graphs are loaded on the data nodes
+    auth = HTTPBasicAuth(username, password)
+    index_exists = requests.head(f"{endpoint}/{index}", auth=auth, timeout=timeout).status_code == 200
+    response = requests.get(f"{endpoint}/_plugins/_knn/stats", auth=auth, timeout=timeout)
+    if response.status_code != 200:
+        logger.info("k-NN stats unavailable: %s, Message: %s", response.status_code, logs.truncate(response.text, 1000))
+        return {"ready": False, "index_exists": index_exists}
+    stats = response.json()
+    nodes = stats.get("nodes", {}).values()
+    graph_count = sum(node.get("indices_in_cache", {}).get(index, {}).get("graph_count", 0) for node in nodes)
+    hit_count = sum(node.get("hit_count", 0) for node in nodes)
+    miss_count = sum(node.get("miss_count", 0) for node in nodes)
+    circuit_breaker_triggered = bool(stats.get("circuit_breaker_triggered"))
+    return {
+        "ready": index_exists and graph_count > 0 and not circuit_breaker_triggered,
+        "index_exists": index_exists,
+        "graph_count": graph_count,
+        "graph_memory_usage_kb": sum(node.get("indices_in_cache", {}).get(index, {}).get("graph_memory_usage", 0) for node in nodes),
+        "graph_memory_usage_percentage": max((node.get("graph_memory_usage_percentage", 0.0) for node in nodes), default=0.0),
+        "cache_hit_rate": round(hit_count / (hit_count + miss_count), 4) if hit_count + miss_count else None,
+        "circuit_breaker_triggered": circuit_breaker_triggered
+    }
+
+
+def generation(endpoint: str, index: str, username: str, password: str, timeout: Optional[float]=None) -> Optional[str]:
+    # Changes whenever the index content changes: ingest recreates the index (a new uuid), and adds
+    # documents to it (a new document count). None when the index does not exist
+    response = requests.get(f"{endpoint}/_cat/indices/{index}", params={"format": "json", "h": "uuid,docs.count"}, auth=HTTPBasicAuth(username, password), timeout=timeout)
+    if response.status_code != 200 or not response.json():
+        return None
+    stats = response.json()[0]
+    return f"{stats['uuid']}:{stats['docs.count']}"
@@ -0,0 +1,159 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Small-to-big retrieval. Search runs against small child passages, which embed precisely, and the
+matching passages are expanded to their (larger) parent windows to give the model enough context.
+Search can be restricted to documents with matching metadata, filtered during the k-NN search, and
+the candidate passages are cut off adaptively, so that weak matches are not sent to the model.
+"""
+
+import os
+import math
+import logging
+import requests
+
+from requests.auth import HTTPBasicAuth
+from typing import Any, Dict, List, Optional
+from llmops import logs
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4 # Rough estimate for English text
+CANDIDATE_K = 10 # No. of child passages retrieved from the k-NN index
+CONTEXT_TOKEN_BUDGET = 750 # Upper bound of the context (parent windows) sent to the model
+
+# Adaptive cut-off of the candidate passages, on cosine similarity, zero disables a cut-off. Calibrated
+# with `benchmarks/adaptive_k.py`: half of the off-topic questions short-circuit to the prompt without
+# context, and the context is about half as large, for a recall of 0.59 (0.68 without a cut-off).
+MIN_SIMILARITY = 0.32 # Absolute lower bound, candidates below it are never relevant
+RELATIVE_SIMILARITY = 0.7 # Fraction of the best candidate's similarity that a candidate must reach
+ELBOW_GAP = 0.1 # Cut at the largest drop in similarity between consecutive candidates, if it is at least this large
+
+# Metadata fields that a search can be restricted to, with their mapping type
+FILTER_FIELDS = {
+    "file_name": "keyword",
+    "page": "keyword",
+    "collection": "keyword",
+    "ingest_version": "keyword",
+    "ingested_at": "date"
+}
+RANGE_OPERATORS = ["gt", "gte", "lt", "lte"]
+
+
+def parent_index_name(index: str) -> str:
+    return f"{index}-parents"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def build_filter(filters: Optional[Dict[str, Any]]) -> Optional[Dict]:
+    # Translate the `filters` of a RAG request into an OpenSearch filter, applied inside the k-NN query.
+    # Keyword fields match a value, or any of a list of values, and dates match a range (epoch millis).
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object of field names and values")
+    clauses = []
+    for field, value in filters.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unsupported filter field: {field}, use one of: {list(FILTER_FIELDS)}")
+        if FILTER_FIELDS[field] == "date":
+            if not isinstance(value, dict) or not value or any(operator not in RANGE_OPERATORS for operator in value):
+                raise ValueError(f"{field} filter must be a range, using: {RANGE_OPERATORS}")
+            clauses.append({"range": {field: value}})
+        elif isinstance(value, list):
+            clauses.append({"terms": {field: [str(item) for item in value]}})
+        else:
+            clauses.append({"term": {field: str(value)}})
+    return {"bool": {"filter": clauses}}
+
+
+def cutoff_from_env() -> Dict[str, float]:
+    return {
+        "min_similarity": float(os.getenv("RETRIEVAL_MIN_SIMILARITY", MIN_SIMILARITY)),
+        "relative_similarity": float(os.getenv("RETRIEVAL_RELATIVE_SIMILARITY", RELATIVE_SIMILARITY)),
+        "elbow_gap": float(os.getenv("RETRIEVAL_ELBOW_GAP", ELBOW_GAP))
+    }
+
+
+def similarity(score: float) -> float:
+    # Invert the OpenSearch inner product score (1 + dot for positive, 1 / (1 - dot) for negative products)
+    return score - 1 if score >= 1 else 1 - 1 / score
+
+
+def cut_hits(hits: List[Dict], min_similarity: float=MIN_SIMILARITY, relative_similarity: float=RELATIVE_SIMILARITY, elbow_gap: float=ELBOW_GAP) -> List[Dict]:
+    # Keep the leading hits (in score order) that pass the thresholds, and stop at the elbow. This can
+    # return any number of hits, including none, when even the best candidate is a weak match.
+    similarities = [similarity(hit["_score"]) for hit in hits]
+    k = 0
+    for value in similarities:
+        if (min_similarity and value < min_similarity) or (relative_similarity and value < relative_similarity * similarities[0]):
+            break
+        k += 1
+    if elbow_gap and k > 1:
+        gaps = [similarities[i - 1] - similarities[i] for i in range(1, k)]
+        elbow = max(range(len(gaps)), key=gaps.__getitem__)
+        if gaps[elbow] >= elbow_gap:
+            k = elbow + 1
+    return hits[:k]
+
+
+def fetch_parents(endpoint: str, index: str, parent_ids: List[str], username: str, password: str, timeout: Optional[float]=None) -> Dict[str, Dict]:
+    if not parent_ids:
+        return {}
+    response = requests.post(
+        url=f"{endpoint}/{parent_index_name(index)}/_mget",
+        auth=HTTPBasicAuth(username, password),
+        json={"ids": parent_ids},
+        timeout=timeout
+    )
+    if response.status_code != 200:
+        logger.info("Parent windows unavailable: %s, Message: %s", response.status_code, logs.truncate(response.text, 1000))
+        return {}
+    return {doc["_id"]: doc["_source"] for doc in response.json()["docs"] if doc.get("found")}
+
+
+def expand_to_parents(hits: List[Dict], parents: Dict[str, Dict], token_budget: int) -> List[Dict]:
+    # Replace each hit with its parent window, in score order, skipping windows that have already been
+    # used, until the token budget is spent. A hit without a (stored) parent contributes its own passage,
+    # as does a hit whose parent window alone would not fit the budget.
+    context = []
+    used = set()
+    tokens = 0
+    for hit in hits:
+        source = hit["_source"]
+        parent = parents.get(source.get("parent_id"))
+        if parent and tokens + estimate_tokens(parent["passage"]) <= token_budget:
+            key, passage = source["parent_id"], parent["passage"]
+        else:
+            key, passage = hit["_id"], source["passage"]
+        if key in used or source.get("parent_id") in used:
+            continue
+        if tokens + estimate_tokens(passage) > token_budget:
+            break
+        used.add(key)
+        tokens += estimate_tokens(passage)
+        context.append({
+            "file_name": source["file_name"],
+            "score": hit["_score"],
+            "passage": passage
+        })
+    return context
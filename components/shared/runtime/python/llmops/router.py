@@ -0,0 +1,176 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Latency-aware model routing. Each question is sent to the fastest model that meets its quality tier
+(decided by the shape of the question), and escalated to a stronger model when the cheap model cannot
+answer it. Per-model latency is tracked as an EWMA, so that a degraded model is avoided until it recovers.
+"""
+
+import os
+import re
+import math
+import time
+import random
+import logging
+
+from typing import Any, Dict, List, Optional
+
+from llmops import admission, clients, deadline, hedging, models
+
+logger = logging.getLogger(__name__)
+
+# Quality tier (a higher tier answers harder questions), and the expected latency (seconds) of each
+# known model, matched by prefix. The expected latency seeds the EWMA, and is the degradation baseline.
+MODEL_CATALOG = {
+    "anthropic.claude-3-haiku": {"tier": 1, "latency": 1.5},
+    "anthropic.claude-instant": {"tier": 1, "latency": 2.0},
+    "anthropic.claude-3-sonnet": {"tier": 2, "latency": 4.5},
+    "anthropic.claude-3-5-sonnet": {"tier": 2, "latency": 4.0},
+    "anthropic.claude-v2": {"tier": 2, "latency": 6.0}
+}
+DEFAULT_MODEL = {"tier": 2, "latency": 5.0} # Unknown (e.g. custom tuned) models are trusted with any question
+
+EWMA_ALPHA = 0.2 # Weight of the latest latency sample
+DEGRADED_FACTOR = 2.0 # A model is degraded while its EWMA exceeds its expected latency by this factor
+PROBE_RATE = 0.05 # Share of requests sent to another eligible model, so that a slow model's EWMA can recover
+
+COMPLEX_QUESTION = re.compile(r"\b(why|compare|contrast|analy[sz]e|evaluate|reason(ing)?|trade-?offs?|pros and cons|implications?|step by step|prove|calculate|design|recommend)\b", re.IGNORECASE)
+COMPLEX_QUESTION_WORDS = 40
+CHARS_PER_TOKEN = 4 # Rough estimate for English text
+CANNOT_ANSWER = re.compile(r"\b(cannot|can't|can not|unable to|not able to) (answer|be answered|determine)|\bI (don't|do not) know\b", re.IGNORECASE)
+# The RAG answer when the retrieved document does not hold the answer, which a stronger model cannot fix
+MISSING_CONTEXT = re.compile(r"\bno relevant quotes\b", re.IGNORECASE)
+
+
+def model_info(model_id: str) -> Dict:
+    for prefix, info in MODEL_CATALOG.items():
+        if model_id.startswith(prefix):
+            return info
+    return DEFAULT_MODEL
+
+
+def required_tier(question: str, response_length: str="standard") -> int:
+    # Reasoning, long answers, and long questions need a strong model, simple factual questions do not
+    if response_length == "long" or COMPLEX_QUESTION.search(question) or len(question.split()) > COMPLEX_QUESTION_WORDS:
+        return 2
+    return 1
+
+
+def needs_escalation(answer: str) -> bool:
+    return bool(CANNOT_ANSWER.search(answer)) and not MISSING_CONTEXT.search(answer)
+
+
+class LatencyRouter:
+
+    def __init__(self, model_ids: List[str], escalate: bool=True, alpha: float=EWMA_ALPHA, degraded_factor: float=DEGRADED_FACTOR, probe_rate: float=PROBE_RATE, rng: Optional[random.Random]=None) -> None:
+        self.model_ids = list(dict.fromkeys(model_ids))
+        self.escalate = escalate
+        self.alpha = alpha
+        self.degraded_factor = degraded_factor
+        self.probe_rate = probe_rate
+        self.rng = rng or random.Random()
+        self.ewma = {model_id: model_info(model_id)["latency"] for model_id in self.model_ids}
+        self.samples = {model_id: 0 for model_id in self.model_ids}
+
+    def record(self, model_id: str, seconds: float) -> None:
+        self.ewma[model_id] = self.alpha * seconds + (1 - self.alpha) * self.ewma[model_id]
+        self.samples[model_id] += 1
+
+    def degraded(self, model_id: str) -> bool:
+        return self.ewma[model_id] > self.degraded_factor * model_info(model_id)["latency"]
+
+    def ranked(self, model_ids: List[str]) -> List[str]:
+        # Healthy models first, fastest first
+        return sorted(model_ids, key=lambda model_id: (self.degraded(model_id), self.ewma[model_id]))
+
+    def route(self, question: str, response_length: str="standard", escalate: Optional[bool]=None) -> List[str]:
+        # The models to try in order: the fastest model that meets the required tier, then (optionally)
+        # the fastest model of a higher tier, if the first one cannot answer
+        tier = min(required_tier(question, response_length), max(model_info(model_id)["tier"] for model_id in self.model_ids))
+        eligible = self.ranked([model_id for model_id in self.model_ids if model_info(model_id)["tier"] >= tier])
+        if len(eligible) > 1 and self.rng.random() < self.probe_rate:
+            # Probe another model, as a model that is no longer chosen gets no samples to recover with
+            eligible.insert(0, eligible.pop(self.rng.randrange(1, len(eligible))))
+        route = eligible[:1]
+        if self.escalate if escalate is None else escalate:
+            stronger = self.ranked([model_id for model_id in self.model_ids if model_info(model_id)["tier"] > model_info(route[0])["tier"]])
+            route += stronger[:1]
+        return route
+
+    def report(self) -> Dict[str, Dict]:
+        return {
+            model_id: {
+                "ewma_seconds": round(self.ewma[model_id], 3),
+                "samples": self.samples[model_id],
+                "degraded": self.degraded(model_id)
+            } for model_id in self.model_ids
+        }
+
+
+def from_env(default_model_id: str) -> LatencyRouter:
+    # The configured text model is always a candidate, routing is enabled by adding models to route to
+    model_ids = [default_model_id, *[model_id.strip() for model_id in os.getenv("ROUTER_MODEL_IDS", "").split(",") if model_id.strip()]]
+    return LatencyRouter(model_ids, escalate=os.getenv("ROUTER_ESCALATE", "true").lower() == "true")
+
+
+def generate(client: Any, router: LatencyRouter, templates: Dict[str, Dict], question: str, prompt: str, response_length: str="standard", continuation: Optional[str]=None, hedger: Optional[hedging.Hedger]=None, admission_controller: Optional[admission.AdmissionController]=None, request_deadline: Optional[deadline.Deadline]=None) -> Dict:
+    # Generate along the route, recording each model's latency. `templates` holds the precompiled
+    # templates of each model, per response length. A continuation is not escalated, as the stronger
+    # model would continue another model's answer. Slow calls are hedged, if a `hedger` is given, and
+    # each call is admitted against the model's quotas, if an `admission_controller` is given. With a
+    # deadline, the output token limit is lowered to what can be generated in time, and the answer is
+    # not escalated when there is no time left for it. An answer cut off at the lowered limit, or left
+    # unescalated, is `deadline_limited`.
+    route = router.route(question, response_length, escalate=False if continuation else None)
+    route_start = time.perf_counter()
+    result = None
+    for model_id in route:
+        template = templates[model_id][response_length]
+        lowered = False
+        if request_deadline:
+            try:
+                fitted = request_deadline.fit_template(template)
+            except deadline.DeadlineExceeded:
+                if result is None:
+                    raise
+                logger.info(f"{model_id} could not answer, and there is no time left to escalate")
+                result["deadline_limited"] = True
+                break
+            lowered = fitted is not template
+            template = fitted
+        # Quotas count the input tokens, and the output token budget
+        tokens = math.ceil((len(template["prefix"]) + len(prompt) + len(continuation or "")) / CHARS_PER_TOKEN) + template.get("max_tokens", 0)
+        admission.admit(admission_controller, model_id, tokens)
+        read_timeout = deadline.timeout(request_deadline)
+        start = time.perf_counter()
+        result = hedging.call(
+            hedger,
+            client,
+            f"generate:{model_id}",
+            lambda hedge_client: models.generate(client=clients.with_timeout(hedge_client, read_timeout), template=template, prompt=prompt, continuation=continuation)
+        )
+        router.record(model_id, time.perf_counter() - start)
+        result["latency"] = time.perf_counter() - route_start  # Including any escalation
+        result["model_id"] = model_id
+        result["escalated"] = model_id != route[0]
+        result["deadline_limited"] = lowered and result["truncated"]
+        if model_id == route[-1] or not needs_escalation(result["text"]):
+            break
+        logger.info(f"{model_id} could not answer, escalating to {route[-1]}")
+    return result
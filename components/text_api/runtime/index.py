@@ -19,45 +19,93 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
 import json
 import boto3
-import logging
 
-from typing import Dict
+from typing import Dict, Optional
 from botocore.config import Config
+from botocore.exceptions import ClientError
+from llmops import admission, budget, cache, clients, deadline, hedging, logs, metrics, models, router
 
 # Environmental parameters
 TEXT_MODEL_ID = os.environ["TEXT_MODEL_ID"]
 EMBEDDING_MODEL_ID = os.environ["EMBEDDING_MODEL_ID"]
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "Text-API")
+MODEL_ROUTER = router.from_env(TEXT_MODEL_ID) # Latency EWMAs are kept per container
+TEXT_TEMPLATES = {model_id: budget.compile_templates(model_id, system=models.DEFAULT_SYSTEM_PROMPT) for model_id in MODEL_ROUTER.model_ids}
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
-bedrock_client = boto3.client("bedrock-runtime")
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
+bedrock_client = clients.from_env() # Spreads calls across the configured regions
+hedger = hedging.from_env(bedrock_client) # Hedges slow Bedrock calls, when enabled
+admission_controller = admission.from_env() # Limits Bedrock calls to the model quotas, when configured
+response_cache = cache.from_env() # Answers identical questions from the shared cache, when enabled
 
 def lambda_handler(event, context): 
-    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    request_metrics = metrics.RequestMetrics(METRICS_NAMESPACE, cold_start=metrics.cold_start())
     body = json.loads(event["body"])
     validate_response = validate_inputs(body)
     if validate_response:
         return validate_response
     question = body["question"]
-    logger.info(f"Question: {question}")
-    response = get_prediction(question=question)
-    return build_response(
-        {
-            "response": response
-        }
-    )
+    response_length = budget.classify(question, hint=body.get("response_length"))
+    logger.info(f"Question: {question} (response length: {response_length})")
+    try:
+        prediction = get_prediction(
+            question=question,
+            response_length=response_length,
+            continuation=(body.get("continue_from") or "").rstrip() or None,
+            request_deadline=deadline.Deadline.from_context(context),
+            request_metrics=request_metrics
+        )
+    except deadline.DeadlineExceeded as e:
+        return build_deadline_response(e)
+    except (admission.Throttled, ClientError) as e:
+        throttled_response = build_throttled_response(e)
+        if throttled_response is None:
+            raise
+        return throttled_response
+    finally:
+        request_metrics.emit()
+    return build_response(prediction)
 
 
-def build_response(body: Dict) -> Dict:
+def build_response(body: Dict, status_code: int=200, headers: Optional[Dict]=None) -> Dict:
     return {
-        "statusCode": 200,
+        "statusCode": status_code,
         "headers": {
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            **(headers or {})
         },
         "body": json.dumps(body)
     }
 
+def build_deadline_response(error: deadline.DeadlineExceeded) -> Dict:
+    # Answer before API Gateway times out, instead of running on with no one waiting for the response
+    logger.warning(str(error))
+    return build_response(
+        {
+            "status": "error",
+            "message": "The question could not be answered in time, please try again"
+        },
+        status_code=504
+    )
+
+
+def build_throttled_response(error: Exception) -> Optional[Dict]:
+    # A fast 429 for a shed, or throttled request, rather than holding it until the client gives up
+    seconds = admission.retry_after(error)
+    if seconds is None:
+        return None
+    logger.warning(str(error))
+    return build_response(
+        {
+            "status": "error",
+            "message": f"Too many requests, please retry after {seconds} seconds"
+        },
+        status_code=429,
+        headers={"Retry-After": str(seconds)}
+    )
+
 
 def validate_inputs(body: Dict):
     for input_name in ["question"]:
@@ -68,67 +116,83 @@ def validate_inputs(body: Dict):
                     "message": f"{input_name} missing in payload"
                 }
             )
+    if body.get("response_length") not in [None, *budget.RESPONSE_LENGTHS]:
+        return build_response(
+            {
+                "status": "error",
+                "message": f"response_length must be one of: {list(budget.RESPONSE_LENGTHS)}"
+            }
+        )
 
 
-def get_prediction(question: str) -> str:
-    logger.info(f"Bedrock model Id: {TEXT_MODEL_ID}")
+def get_prediction(question: str, response_length: str="standard", continuation: Optional[str]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    # Identical questions are answered from the shared cache. Truncated answers, and answers limited by
+    # the time left, are not cached, as the next request may well have the budget for a full answer
+    key = cache.request_key(
+        MODEL_ROUTER.model_ids,
+        {
+            "question": question,
+            "response_length": response_length,
+            "continue_from": continuation
+        }
+    )
+    return cache.get_or_compute(
+        response_cache,
+        key,
+        lambda: answer_question(question=question, response_length=response_length, continuation=continuation, request_deadline=request_deadline, request_metrics=request_metrics),
+        cacheable=lambda prediction: not prediction["truncated"] and not prediction["deadline_limited"],
+        request_deadline=request_deadline,
+        request_metrics=request_metrics
+    )
+
+
+def answer_question(question: str, response_length: str="standard", continuation: Optional[str]=None, request_deadline: Optional[deadline.Deadline]=None, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
     logger.info(f"Sending prompt to Bedrock (RAG disabled) ... ")
-    if TEXT_MODEL_ID == "anthropic.claude-3-sonnet-20240229-v1:0" or TEXT_MODEL_ID == "anthropic.claude-3-haiku-20240307-v1:0" or TEXT_MODEL_ID == "anthropic.claude-instant-v1":
-        response = bedrock_client.invoke_model(
-            body=json.dumps(
-                {
-                    "max_tokens": 4096,
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "temperature": 0.5,
-	                "top_k": 250,
-	                "top_p": 1,
-                    "system": "You are a helpful assistant answering a human's questions. Provide a concise answer. Use a friendly tone. If the questions cannot be answered, say so. Do not make up answers. Answer the questions immediately without preamble.",
-                    "messages": [{"role": "user", "content": question}],
-                }
-            ),
-            modelId=TEXT_MODEL_ID,
-            accept="*/*",
-            contentType="application/json"
+    with metrics.stage(request_metrics, "generation") as stage:
+        result = router.generate(
+            client=bedrock_client,
+            router=MODEL_ROUTER,
+            templates=TEXT_TEMPLATES,
+            question=question,
+            prompt=question,
+            response_length=response_length,
+            continuation=continuation,
+            hedger=hedger,
+            admission_controller=admission_controller,
+            request_deadline=request_deadline
         )
-        response_body = json.loads(response.get("body").read())
-        answer = response_body.get("content")[0].get("text")
-    elif TEXT_MODEL_ID == "meta.llama2-13b-chat-v1" or TEXT_MODEL_ID == "meta.llama2-70b-chat-v1":
-        prompt_template = f"""[INST]You are a helpful assistant answering a human's questions. Provide a concise answer. Use a friendly tone. If the questions cannot be answered, say so. Do not make up answers. Answer the questions immediately without preamble.[/INST]\n\n{question}"""
-        response = bedrock_client.invoke_model(
-            body=json.dumps(
-                {
-                    "prompt": prompt_template,
-                    "max_gen_len": 512,
-                    "temperature": 0.5,
-                    "top_p": 0.5
-                }
-            ),
-            modelId=TEXT_MODEL_ID,
-            accept="*/*",
-            contentType="application/json"
-        )
-        response_body = json.loads(response.get("body").read())
-        answer = response_body.get("generation")      
-    else:
-        # Invoke fine-tuned model
-        prompt_template = f"""You are a helpful assistant answering a human's questions. Provide a concise answer. Use a friendly tone. If the questions cannot be answered, say so. Do not make up answers. Answer the questions immediately without preamble.\n\nUser: {question}"""
-        response = bedrock_client.invoke_model(
-            body=json.dumps(
-                {
-                    "inputText": prompt_template,
-                    "textGenerationConfig": {
-                        "maxTokenCount":512,
-                        "stopSequences":[],
-                        "temperature":0,
-                        "topP":0.9
-                    }
-                }
-            ),
-            modelId=TEXT_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
+        # The model is chosen by the router
+        stage.model_id = result["model_id"]
+        stage.add(InputTokens=result["usage"]["input_tokens"], OutputTokens=result["usage"]["output_tokens"])
+    answer = (continuation or "") + result["text"]
+    logger.info(
+        "Bedrock model Id: %s (escalated: %s), model latency: %s, hedging: %s",
+        result["model_id"],
+        result["escalated"],
+        logs.lazy_json(MODEL_ROUTER.report()),
+        logs.lazy_json(hedger.report() if hedger else None)
+    )
+    values = {
+        **budget.budget_metrics(result["model_id"], response_length, extra_tokens=0, truncated=result["truncated"]),
+        "InputTokens": result["usage"]["input_tokens"],
+        "OutputTokens": result["usage"]["output_tokens"],
+        "Escalated": int(result["escalated"]),
+        "DeadlineLimited": int(result["deadline_limited"]),
+        "ModelLatency": result["latency"]
+    }
+    metrics.emit(
+        metrics.emf_record(
+            namespace=METRICS_NAMESPACE,
+            dimensions={"Api": "text", "ModelId": result["model_id"]},
+            values=values,
+            units={name: "Seconds" if name in ["WorstCaseLatencySaved", "ModelLatency"] else "Count" for name in values}
         )
-        response_body = json.loads(response.get("body").read())
-        answer = response_body.get("results")[0].get("outputText")
-    logger.info(f"Bedrock returned the following answer: {answer}")
-    return answer
\ No newline at end of file
+    )
+    # Full answers are verbose, only a sample of them is logged
+    logger.info("Bedrock returned the following answer: %s", answer, extra=logs.VERBOSE)
+    return {
+        "response": answer,
+        "truncated": result["truncated"],  # The client can continue a truncated answer, with `continue_from`
+        "response_length": response_length,
+        "deadline_limited": result["deadline_limited"]
+    }
@@ -29,6 +29,7 @@ from aws_cdk import (
     aws_lambda_event_sources as _event_source
 )
 from constructs import Construct
+from components.shared import SharedLayer
 
 class FineTuningWorkflow(Construct):
 
@@ -167,6 +168,7 @@ class FineTuningWorkflow(Construct):
                 path=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve())
             ),
             handler="index.lambda_handler",
+            layers=[SharedLayer.of(self)],
             role=callback_role,
             timeout=cdk.Duration.seconds(60)
         )
@@ -20,19 +20,18 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
 import boto3
 import json
-import logging
 
 from botocore.exceptions import ClientError
+from llmops import logs
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 sm_client = boto3.client("sagemaker")
 sfn_client = boto3.client("stepfunctions")
 
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event, indent=2)}")
+    logger.info("Received event: %s", logs.lazy_json(event))
     for record in event["Records"]:
         payload = json.loads(record["body"])
         if payload.get("status") != "Stopping":
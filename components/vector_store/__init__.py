@@ -34,6 +34,8 @@ from aws_cdk import (
     aws_s3_notifications as _notification
 )
 from constructs import Construct
+from components.shared import SharedLayer, LIBRARY_PATH
+from components.index_readiness import IndexReadiness
 
 class VectorStore(Construct):
 
@@ -76,7 +78,8 @@ class VectorStore(Construct):
             self.search_domain = _opensearch.Domain(
                 self,
                 "OpenSearchDomain",
-                version=_opensearch.EngineVersion.OPENSEARCH_2_5,
+                version=_opensearch.EngineVersion.OPENSEARCH_2_11,  # Efficient filtered k-NN search requires 2.9+
+                enable_version_upgrade=True,
                 ebs=_opensearch.EbsOptions(
                     volume_size=20,
                     volume_type=_ec2.EbsDeviceVolumeType.GP3
@@ -143,8 +146,9 @@ class VectorStore(Construct):
                             ],
                             effect=_iam.Effect.ALLOW,
                             resources=[
-                                f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{context.get('bedrock-text-model-id')}",
-                                f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{context.get('bedrock-embedding-model-id')}"
+                                # Any region, as calls are spread across the configured regions
+                                f"arn:aws:bedrock:*::foundation-model/{context.get('bedrock-text-model-id')}",
+                                f"arn:aws:bedrock:*::foundation-model/{context.get('bedrock-embedding-model-id')}"
                             ]
                         )
                     ]
@@ -155,24 +159,37 @@ class VectorStore(Construct):
         processing_image.repository.grant_pull(processing_role)
         self.opensearch_secret.grant_read(processing_role)
 
-        # Create a Lambda function to start the SageMaker Processing Job from S3 notification
+        # Create a Lambda function to ingest small uploads directly, or start a right-sized SageMaker Processing Job
         self.notification_function = _lambda.Function(
             self,
             "NotificationFunction",
             runtime=_lambda.Runtime.PYTHON_3_12,
-            code=_lambda.Code.from_asset(str(pathlib.Path(__file__).parent.joinpath("s3_notification_lambda").resolve())),
+            code=_lambda.Code.from_asset(
+                path=str(pathlib.Path(__file__).parent.joinpath("s3_notification_lambda").resolve()),
+                bundling=cdk.BundlingOptions(
+                    image=_lambda.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash", "-c", "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
             handler="index.lambda_handler",
-            timeout=cdk.Duration.seconds(60),
+            layers=[SharedLayer.of(self)],
+            memory_size=1024,
+            timeout=cdk.Duration.seconds(300),
             environment={
                 "JOB_NAME": f"{constants.WORKLOAD_NAME}-RAG-Ingest",
                 "IMAGE_URI": processing_image.image_uri,
                 "ROLE": processing_role.role_arn,
-                "SCRIPT_URI": f"s3://{data_bucket.bucket_name}/scripts/data_ingest.py",
+                "CODE_URI": f"s3://{data_bucket.bucket_name}/scripts/",
                 "TEXT_MODEL_ID": context.get("bedrock-text-model-id"),
                 "EMBEDDING_MODEL_ID": context.get("bedrock-embedding-model-id"),
+                "EMBEDDING_DIMENSION": context.get("bedrock-embedding-dimension"),
                 "OPENSEARCH_ENDPOINT": self.search_domain.domain_endpoint,
                 "OPENSEARCH_SECRET": self.opensearch_secret.secret_name,
-                "OPENSEARCH_INDEX": context.get("embedding-index-name")
+                "OPENSEARCH_INDEX": context.get("embedding-index-name"),
+                "BEDROCK_REGIONS": context.get("bedrock-regions"),
+                "METRICS_NAMESPACE": f"{constants.WORKLOAD_NAME}/RAG-Ingest"
             }
         )
         self.notification_function.add_to_role_policy(
@@ -187,14 +204,31 @@ class VectorStore(Construct):
                 resources=["*"]
             )
         )
+        self.notification_function.add_to_role_policy(
+            _iam.PolicyStatement(
+                sid="FastPathEmbeddingPermission",
+                actions=[
+                    "bedrock:InvokeModel"
+                ],
+                effect=_iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:bedrock:*::foundation-model/{context.get('bedrock-embedding-model-id')}"
+                ]
+            )
+        )
+        data_bucket.grant_read_write(self.notification_function)
+        self.opensearch_secret.grant_read(self.notification_function)
 
-        # Deploy data ingest script to S3
+        # Deploy data ingest script, and the shared `llmops` library it imports, to S3
         _deployment.BucketDeployment(
             self,
             "ScriptsDeployment",
             sources=[
                 _deployment.Source.asset(
                     path=str(pathlib.Path(__file__).parent.joinpath("scripts").resolve())
+                ),
+                _deployment.Source.asset(
+                    path=LIBRARY_PATH
                 )
             ],
             destination_bucket=data_bucket,
@@ -212,6 +246,16 @@ class VectorStore(Construct):
             )
         )
 
+        # Keep the k-NN graphs loaded in memory, after ingest, and on a schedule
+        self.index_readiness = IndexReadiness(
+            self,
+            "IndexReadiness",
+            endpoint=self.search_domain.domain_endpoint,
+            secret=self.opensearch_secret,
+            index=context.get("embedding-index-name"),
+            ingest_job_name=f"{constants.WORKLOAD_NAME}-RAG-Ingest"
+        )
+
     @property
     def endpoint_name(self) -> str:
         return self.search_domain.domain_endpoint
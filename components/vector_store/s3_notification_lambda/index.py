@@ -20,113 +20,244 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
 import json
 import boto3
-import logging
+import shutil
+import tempfile
 import time
+import sizing
 
+from typing import Dict, List, Optional
+from urllib.parse import unquote_plus
 from botocore.exceptions import ClientError
+from llmops import clients, embeddings, ingest, logs, metrics, readiness
 
 # Global parameters
-logger = logging.getLogger()
-logger.setLevel(level=logging.INFO)
+logger = logs.configure() # JSON lines, at LOG_LEVEL, with verbose records sampled
 sm_client = boto3.client("sagemaker")
+s3_client = boto3.client("s3")
+bedrock_client = clients.from_env() # Spreads calls across the configured regions
 
 # Environmental parameters
 job_name = os.environ["JOB_NAME"]
 region = os.environ["AWS_DEFAULT_REGION"]
 image_uri = os.environ["IMAGE_URI"]
 job_role_arn = os.environ["ROLE"]
-script_path = os.environ["SCRIPT_URI"]
+code_path = os.environ["CODE_URI"]
 text_model = os.environ["TEXT_MODEL_ID"]
-embedding_model = os.environ["EMBEDDING_MODEL_ID"]
 opensearch_endpoint = os.environ["OPENSEARCH_ENDPOINT"]
 opensearch_secret = os.environ["OPENSEARCH_SECRET"]
 opensearch_index = os.environ["OPENSEARCH_INDEX"]
+metrics_namespace = os.environ["METRICS_NAMESPACE"]
+bedrock_regions = os.getenv("BEDROCK_REGIONS", "")
+embedding_config = embeddings.config_from_env()
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {json.dumps(event, indent=2)}")
-    bucket = event["Records"][0]["s3"]["bucket"]["name"]
-    key = event["Records"][0]["s3"]["object"]["key"]
-    version_id = event["Records"][0]["s3"]["object"]["versionId"]
-    current_time = time.strftime("%m-%d-%H-%M-%S", time.localtime())
+    logger.debug("Received event: %s", logs.lazy_json(event))
+    records = [record["s3"] for record in event["Records"]]
+    bucket = records[0]["bucket"]["name"]
+    keys = [unquote_plus(record["object"]["key"]) for record in records]
+    version_id = records[0]["object"]["versionId"]
+    plan = sizing.plan_ingest(
+        total_bytes=sum(record["object"].get("size", 0) for record in records),
+        key_count=len(keys),
+        remaining_ms=context.get_remaining_time_in_millis(),
+        chunk_size=ingest.CHUNK_SIZE
+    )
+    logger.info("Ingest plan: %s", logs.lazy_json(plan))
+    request_metrics = metrics.RequestMetrics(metrics_namespace, cold_start=metrics.cold_start())
     try:
-        print("Starting SageMaker processing job ...")
-        response = sm_client.create_processing_job(
-            ProcessingInputs=[
-                {
-                    'InputName': 'code',
-                    'S3Input': {
-                        'S3Uri': script_path,
-                        'LocalPath': '/opt/ml/processing/input/code',
-                        'S3DataType': 'S3Prefix',
-                        'S3InputMode': 'File',
-                        'S3DataDistributionType': 'FullyReplicated',
-                        'S3CompressionType': 'None'
-                    }
+        # The index is (re)created once per upload, so that job instances only need to add their shard
+        with metrics.stage(request_metrics, "secret"):
+            username, password = ingest.get_credentials(opensearch_secret, region)
+        with metrics.stage(request_metrics, "index"):
+            ingest.verify_index(
+                endpoint=ingest.get_domain_url(opensearch_endpoint),
+                index=opensearch_index,
+                username=username,
+                password=password,
+                embedding_config=embedding_config
+            )
+        if plan["mode"] == sizing.FAST_PATH:
+            return ingest_in_lambda(bucket=bucket, keys=keys, version_id=version_id, plan=plan, username=username, password=password, request_metrics=request_metrics)
+        return start_processing_job(bucket=bucket, keys=keys, version_id=version_id, plan=plan)
+
+    except ClientError as e:
+        message = e.response["Error"]["Message"]
+        raise Exception(message)
+    finally:
+        request_metrics.emit()
+
+
+def ingest_in_lambda(bucket: str, keys: List[str], version_id: str, plan: Dict, username: str, password: str, request_metrics: Optional[metrics.RequestMetrics]=None) -> Dict:
+    logger.info("Ingesting upload in the notification function ...")
+    start_time = time.time()
+    stage_metrics = metrics.StageMetrics()
+    data_path = tempfile.mkdtemp()
+    try:
+        # Keys are downloaded with their prefix, which is stored as the collection of the document
+        with metrics.stage(request_metrics, "download") as stage:
+            file_paths = [os.path.join(data_path, *key.split("/")) for key in keys]
+            for key, file_path in zip(keys, file_paths):
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                s3_client.download_file(bucket, key, file_path)
+            stage.add(Bytes=sum(os.path.getsize(file_path) for file_path in file_paths))
+        with metrics.stage(request_metrics, "chunking"):
+            chunks, parents = ingest.create_chunks(
+                data_path=data_path,
+                chunk_size=ingest.CHUNK_SIZE,
+                chunk_overlap=0,
+                embedding_dimension=embedding_config["dimension"],
+                metadata={
+                    "ingest_version": version_id,
+                    "ingested_at": int(time.time() * 1000)
                 },
-                {
-                    'InputName': 'data',
-                    'S3Input': {
-                        'S3Uri': f"s3://{bucket}/{key}",
-                        'LocalPath': '/opt/ml/processing/input/data',
-                        'S3DataType': 'S3Prefix',
-                        'S3InputMode': 'File',
-                        'S3DataDistributionType': 'FullyReplicated',
-                        'S3CompressionType': 'None'
-                    }
+                metrics=stage_metrics
+            )
+        # Embedding the chunks takes most of the indexing time
+        with metrics.stage(request_metrics, "indexing", model_id=embedding_config["model_id"]):
+            result = ingest.index_chunks(
+                client=bedrock_client,
+                chunks=chunks,
+                embedding_config=embedding_config,
+                endpoint=ingest.get_domain_url(opensearch_endpoint),
+                index=opensearch_index,
+                username=username,
+                password=password,
+                metrics=stage_metrics
+            )
+        with metrics.stage(request_metrics, "parents"):
+            result.update(
+                ingest.index_parents(
+                    parents=parents,
+                    endpoint=ingest.get_domain_url(opensearch_endpoint),
+                    index=opensearch_index,
+                    username=username,
+                    password=password,
+                    metrics=stage_metrics
+                )
+            )
+        # Load the new graphs into memory, so that the first queries do not have to
+        with stage_metrics.time("warmup"), metrics.stage(request_metrics, "warmup"):
+            readiness.warmup(endpoint=ingest.get_domain_url(opensearch_endpoint), index=opensearch_index, username=username, password=password)
+    finally:
+        shutil.rmtree(data_path, ignore_errors=True)
+    logger.info(
+        "Ingest duration: %s",
+        logs.lazy_json(
+            {
+                "mode": plan["mode"],
+                "estimated_seconds": plan["estimated_seconds"],
+                "actual_seconds": round(time.time() - start_time, 2),
+                **result,
+                **stage_metrics.report()
+            }
+        )
+    )
+    for record in stage_metrics.emf_records(namespace=metrics_namespace, dimensions={"Mode": plan["mode"]}):
+        metrics.emit(record)
+    return {
+        "statusCode": 200,
+        "body": json.dumps(result)
+    }
+
+
+def start_processing_job(bucket: str, keys: List[str], version_id: str, plan: Dict) -> Dict:
+    current_time = time.strftime("%m-%d-%H-%M-%S", time.localtime())
+    # The changed keys are listed in a manifest, which SageMaker can shard across instances, and which
+    # keeps the key prefix (the collection of the document) in the local path
+    manifest_key = f"processing-manifests/{job_name}-{current_time}.manifest"
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=manifest_key,
+        Body=json.dumps([{"prefix": f"s3://{bucket}/"}] + keys)
+    )
+    data_input = {
+        'S3Uri': f"s3://{bucket}/{manifest_key}",
+        'S3DataType': 'ManifestFile'
+    }
+
+    logger.info("Starting SageMaker processing job ...")
+    response = sm_client.create_processing_job(
+        ProcessingInputs=[
+            {
+                'InputName': 'code',
+                'S3Input': {
+                    'S3Uri': code_path,
+                    'LocalPath': '/opt/ml/processing/input/code',
+                    'S3DataType': 'S3Prefix',
+                    'S3InputMode': 'File',
+                    'S3DataDistributionType': 'FullyReplicated',
+                    'S3CompressionType': 'None'
                 }
-            ],
-            ProcessingOutputConfig={
-                'Outputs': [
-                    {
-                        'OutputName': 'logs',
-                        'S3Output': {
-                            'S3Uri': f"s3://{bucket}/processing-logs/{job_name}-{current_time}",
-                            'LocalPath': '/opt/ml/processing/output',
-                            'S3UploadMode': 'EndOfJob'
-                        }
-                    }
-                ]
             },
-            ProcessingJobName=f"{job_name}-{current_time}",
-            ProcessingResources={
-                'ClusterConfig': {
-                    'InstanceCount': 1,
-                    'InstanceType': 'ml.m5.xlarge',
-                    'VolumeSizeInGB': 20,
+            {
+                'InputName': 'data',
+                'S3Input': {
+                    **data_input,
+                    'LocalPath': '/opt/ml/processing/input/data',
+                    'S3InputMode': 'File',
+                    'S3DataDistributionType': 'ShardedByS3Key' if plan["instance_count"] > 1 else 'FullyReplicated',
+                    'S3CompressionType': 'None'
                 }
-            },
-            StoppingCondition={
-                'MaxRuntimeInSeconds': 1800
-            },
-            AppSpecification={
-                'ImageUri': image_uri,
-                'ContainerEntrypoint': [
-                    'python',
-                    '/opt/ml/processing/input/code/data_ingest.py'
-                ],
-                'ContainerArguments': [
-                    '--text-model', text_model,
-                    '--embedding-model', embedding_model,
-                    '--opensearch-domain', opensearch_endpoint,
-                    '--opensearch-secret', opensearch_secret,
-                    '--opensearch-index', opensearch_index,
-                    '--region', region
-                ]
-            },
-            RoleArn=job_role_arn,
-            Tags=[
+            }
+        ],
+        ProcessingOutputConfig={
+            'Outputs': [
                 {
-                    'Key': 'DataVersionId',
-                    'Value': version_id
+                    'OutputName': 'logs',
+                    'S3Output': {
+                        'S3Uri': f"s3://{bucket}/processing-logs/{job_name}-{current_time}",
+                        'LocalPath': '/opt/ml/processing/output',
+                        'S3UploadMode': 'EndOfJob'
+                    }
                 }
             ]
-        )
-
-        return {
-            "statusCode": 200,
-            "body": response["ProcessingJobArn"]
-        }
+        },
+        ProcessingJobName=f"{job_name}-{current_time}",
+        ProcessingResources={
+            'ClusterConfig': {
+                'InstanceCount': plan["instance_count"],
+                'InstanceType': plan["instance_type"],
+                'VolumeSizeInGB': plan["volume_size_gb"],
+            }
+        },
+        StoppingCondition={
+            'MaxRuntimeInSeconds': plan["max_runtime_seconds"]
+        },
+        AppSpecification={
+            'ImageUri': image_uri,
+            'ContainerEntrypoint': [
+                'python',
+                '/opt/ml/processing/input/code/data_ingest.py'
+            ],
+            'ContainerArguments': [
+                '--text-model', text_model,
+                '--embedding-model', embedding_config["model_id"],
+                '--embedding-dimension', str(embedding_config["dimension"]),
+                '--opensearch-domain', opensearch_endpoint,
+                '--opensearch-secret', opensearch_secret,
+                '--opensearch-index', opensearch_index,
+                '--region', region,
+                # The script can only measure its own runtime, so it is given the estimate excluding instance startup
+                '--estimated-duration', str(plan["estimated_seconds"] - sizing.JOB_STARTUP_SECONDS),
+                '--ingest-version', version_id,
+                '--skip-index-setup',
+                '--metrics-namespace', metrics_namespace
+            ] + (['--bedrock-regions', bedrock_regions] if bedrock_regions else [])
+        },
+        RoleArn=job_role_arn,
+        Tags=[
+            {
+                'Key': 'DataVersionId',
+                'Value': version_id
+            },
+            {
+                'Key': 'EstimatedDurationSeconds',
+                'Value': str(plan["estimated_seconds"])
+            }
+        ]
+    )
 
-    except ClientError as e:
-        message = e.response["Error"]["Message"]
-        raise Exception(message)
+    return {
+        "statusCode": 200,
+        "body": response["ProcessingJobArn"]
+    }
@@ -0,0 +1,87 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+Sizing policy for RAG data ingest. Chooses between ingesting small uploads directly in the
+notification Lambda (fast path), or right-sizing a SageMaker Processing job for larger uploads.
+"""
+
+import math
+
+from typing import Dict
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+FAST_PATH = "lambda"
+PROCESSING_JOB = "processing"
+
+SECONDS_PER_CHUNK = 0.15 # Observed cost of embedding, and indexing a single chunk
+FAST_PATH_SETUP_SECONDS = 5 # Index setup and S3 download in the Lambda Function
+JOB_STARTUP_SECONDS = 300 # Provisioning the processing instance(s), and pulling the container image
+
+# Uploads small enough to ingest in the notification Lambda, within half of its remaining time
+FAST_PATH_MAX_BYTES = 256 * KB
+FAST_PATH_MAX_KEYS = 10
+
+# Processing job tiers, ordered by the largest total upload size each tier handles. Ingest is bound
+# by Bedrock, and OpenSearch round trips, so larger uploads scale out across instances (one S3 key
+# shard per instance), while the instance type only grows to hold larger documents in memory.
+PROCESSING_TIERS = [
+    {"max_bytes": 64 * MB, "instance_type": "ml.t3.medium", "max_instances": 1},
+    {"max_bytes": 512 * MB, "instance_type": "ml.m5.large", "max_instances": 2},
+    {"max_bytes": 4 * GB, "instance_type": "ml.m5.xlarge", "max_instances": 4},
+    {"max_bytes": None, "instance_type": "ml.m5.2xlarge", "max_instances": 8}
+]
+MIN_VOLUME_GB = 5
+MIN_RUNTIME_SECONDS = 900
+MAX_RUNTIME_SECONDS = 5 * 24 * 60 * 60
+
+
+def estimate_chunks(total_bytes: int, chunk_size: int) -> int:
+    return max(1, math.ceil(total_bytes / chunk_size))
+
+
+def plan_ingest(total_bytes: int, key_count: int, remaining_ms: int, chunk_size: int) -> Dict:
+    # `chunk_size` is the size of the ingested passages, passed in so that the policy does not depend on
+    # the ingest module (and its text splitting dependencies)
+    chunk_seconds = estimate_chunks(total_bytes, chunk_size) * SECONDS_PER_CHUNK
+    fast_path_seconds = FAST_PATH_SETUP_SECONDS + chunk_seconds
+    if total_bytes <= FAST_PATH_MAX_BYTES and key_count <= FAST_PATH_MAX_KEYS and fast_path_seconds * 1000 < remaining_ms / 2:
+        return {
+            "mode": FAST_PATH,
+            "total_bytes": total_bytes,
+            "key_count": key_count,
+            "estimated_seconds": round(fast_path_seconds)
+        }
+
+    tier = next(tier for tier in PROCESSING_TIERS if tier["max_bytes"] is None or total_bytes <= tier["max_bytes"])
+    instance_count = max(1, min(tier["max_instances"], key_count))
+    estimated_seconds = JOB_STARTUP_SECONDS + chunk_seconds / instance_count
+    return {
+        "mode": PROCESSING_JOB,
+        "total_bytes": total_bytes,
+        "key_count": key_count,
+        "instance_type": tier["instance_type"],
+        "instance_count": instance_count,
+        # Room for the input data, and the container's working files on each instance
+        "volume_size_gb": max(MIN_VOLUME_GB, math.ceil(3 * total_bytes / instance_count / GB)),
+        "max_runtime_seconds": min(MAX_RUNTIME_SECONDS, max(MIN_RUNTIME_SECONDS, math.ceil(2 * estimated_seconds))),
+        "estimated_seconds": round(estimated_seconds)
+    }
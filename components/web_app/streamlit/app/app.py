@@ -18,13 +18,9 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import os
-import io
-import base64
 import requests
 import streamlit as st
 
-from PIL import Image
-
 # Initialization
 HTTP_OK = 200
 text_api = os.getenv("TEXT_API", "") # Enter api url for integration testing
@@ -54,22 +50,26 @@ if "zero" not in st.session_state:
     st.session_state["zero"] = ""
 if "db" not in st.session_state:
     st.session_state["db"] = ""
+if "truncated" not in st.session_state:
+    st.session_state["truncated"] = False
 
 # Bedrock standard request
-def zero_shot(query: str) -> str:
+def zero_shot(query: str, continue_from: str=None) -> str:
     with st.spinner("Thinking ..."):
-        data = {"question": query}
+        data = {"question": query, "continue_from": continue_from} if continue_from else {"question": query}
         response = requests.post(text_api, headers=headers, json=data, timeout=120)
         if response.status_code != HTTP_OK:
             st.session_state["zero"] = response.text
+            st.session_state["truncated"] = False
 
         else:
             st.session_state["zero"] = response.json()["response"]
+            st.session_state["truncated"] = response.json().get("truncated", False)
 
 # RAG request
-def use_db(query: str) -> str:
+def use_db(query: str, continue_from: str=None) -> str:
     with st.spinner("Thinking ..."):
-        data = {"question": query}
+        data = {"question": query, "continue_from": continue_from} if continue_from else {"question": query}
         if not rag_api:
             st.session_state["db"] = ":red[Retrieval Augmented Generation (RAG) has not been enabled!]"
             return
@@ -77,9 +77,11 @@ def use_db(query: str) -> str:
         response = requests.post(rag_api, headers=headers, json=data, timeout=120)
         if response.status_code != HTTP_OK:
             st.session_state["db"] = response.text
+            st.session_state["truncated"] = False
         
         else:
             st.session_state["db"] = response.json()["response"]
+            st.session_state["truncated"] = response.json().get("truncated", False)
 
 st.set_page_config(layout="wide", page_icon=":robot:", page_title="Generative AI Demo")
 st.header("Generative AI Demo Application - Image and Text Generation")
@@ -117,6 +119,10 @@ with tab1:
     st.subheader("Generate Image")
     prompt = st.text_area("Input Image description:")
     style = st.selectbox(label="Select the image style preset:", options=style_presets)
+    # A draft is generated in a fraction of the time, and refined by generating the same prompt at a higher quality
+    quality = st.radio(label="Select the image quality:", options=["draft", "standard", "final"], index=2, horizontal=True)
+    # Variations are generated in a single request, with different seeds
+    samples = st.slider(label="Number of images:", min_value=1, max_value=4, value=1)
 
     if st.button("Generate image"):
         if prompt == "":
@@ -125,10 +131,19 @@ with tab1:
         else:
             with st.spinner("Generating something nice ..."):
                 try:
-                    response = requests.post(image_api, json={"prompt": prompt, "style": style}, timeout=180)
-                    response_body = response.json()["response"]
-                    image = Image.open(io.BytesIO(base64.decodebytes(bytes(response_body, "utf-8"))))
-                    st.image(image)
+                    # The image is loaded by the browser from a presigned S3 URL, rather than decoded from base64
+                    response = requests.post(image_api, json={"prompt": prompt, "style": style, "quality": quality, "samples": samples, "output": "url", "format": "webp"}, timeout=180)
+                    if response.status_code != HTTP_OK:
+                        st.error(response.text)
+
+                    elif response.json().get("status") == "error":
+                        # Invalid requests are answered with a message, rather than an image
+                        st.error(response.json()["message"])
+
+                    else:
+                        response_body = response.json()
+                        for column, sample in zip(st.columns(samples), response_body.get("samples", [response_body])):
+                            column.image(sample["response"], caption=f"Seed {sample['seed']}")
 
                 except requests.exceptions.ConnectionError as errc:
                     st.error("Error Connecting:",errc)
@@ -151,6 +166,8 @@ with tab2:
         db = st.checkbox("Use database for additional context (RAG)")
         submit_button = form.form_submit_button("Submit")
         if submit_button:
+            st.session_state["question"] = prompt
+            st.session_state["mode"] = "db" if db else "zero"
             if prompt != "" and not db:
                 zero_shot(query=prompt)
                 st.write(st.session_state.zero)
@@ -161,3 +178,10 @@ with tab2:
 
             else:
                 st.error("Question field cannot be empty!")
+
+    # Answers cut off by their output length budget are continued on demand
+    if st.session_state["truncated"] and st.button("Continue answer"):
+        mode = st.session_state["mode"]
+        generate = use_db if mode == "db" else zero_shot
+        generate(query=st.session_state["question"], continue_from=st.session_state[mode])
+        st.write(st.session_state[mode])
@@ -33,6 +33,7 @@ from components.rag_api import RagApi
 from components.image_api import ImageApi
 from components.web_app import WebApp
 from components.vector_store import VectorStore
+from components.dashboard import Dashboard
 
 class InfrastructureStack(cdk.Stack):
 
@@ -76,6 +77,10 @@ class InfrastructureStack(cdk.Stack):
 
 
 
+        # Create the CloudWatch dashboard, charting the latency percentiles of each stage of the APIs
+
+
+
     @staticmethod
     def _get_model(parameter_name: str, region: str, context: Dict) -> str:
         # Return the model context if deploying the infrastructure in DEV/TEST
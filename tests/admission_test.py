@@ -0,0 +1,167 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import json
+import pathlib
+import threading
+import pytest
+
+from botocore.exceptions import ClientError
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import admission
+from tests import runtime
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+LIMITS = {"rpm": 60, "tpm": 6000} # One request, and 100 tokens, per second
+
+class FakeClock:
+    # Clock that moves only when the controller sleeps
+
+    def __init__(self, now: float=1000.0) -> None:
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeDynamoDB:
+    # Stands in for the DynamoDB client, with the conditional write of the buckets. `interleave` runs
+    # between a read and the following write, as a concurrent instance would
+
+    def __init__(self, interleave=None) -> None:
+        self.items = {}
+        self.interleave = interleave
+        self.writes = 0
+        self.conflicts = 0
+        self.lock = threading.Lock()
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get(Key["bucket"]["S"])
+        return {"Item": json.loads(json.dumps(item))} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeValues):
+        if self.interleave:
+            interleave, self.interleave = self.interleave, None
+            interleave()
+        with self.lock:
+            current = self.items.get(Item["bucket"]["S"])
+            if current and current["updated_at"]["N"] != ExpressionAttributeValues[":updated_at"]["N"]:
+                self.conflicts += 1
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}}, "PutItem")
+            self.items[Item["bucket"]["S"]] = Item
+            self.writes += 1
+
+
+def controller(backend, clock: FakeClock, max_wait: float=admission.MAX_WAIT_SECONDS) -> admission.AdmissionController:
+    return admission.AdmissionController({MODEL_ID: LIMITS}, backend=backend, max_wait=max_wait, clock=clock, sleep=clock.sleep)
+
+
+def test_buckets_refill_at_the_quota_rate():
+    assert admission.refill(None, LIMITS, now=0) == {"rpm": 60.0, "tpm": 6000.0}
+    state = {"rpm": 0.0, "tpm": 1000.0, "updated_at": 0.0}
+    assert admission.refill(state, LIMITS, now=2.0) == {"rpm": 2.0, "tpm": 1200.0}
+    # Never beyond the quota
+    assert admission.refill(state, LIMITS, now=3600.0) == {"rpm": 60.0, "tpm": 6000.0}
+    assert admission.wait_time({"rpm": 0.5, "tpm": 6000.0}, LIMITS, {"rpm": 1, "tpm": 100}) == pytest.approx(0.5)
+
+
+def test_call_waits_for_its_tokens():
+    clock = FakeClock()
+    client = FakeDynamoDB()
+    control = controller(admission.DynamoDBBuckets("buckets", client=client), clock)
+    # The token bucket is drained by the first call, the next one waits for it to refill
+    assert control.admit(MODEL_ID, tokens=6000) == 0.0
+    waited = control.admit(MODEL_ID, tokens=100)
+    assert waited == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+    assert control.counters == {"Admitted": 2, "Shed": 0}
+    assert float(client.items[MODEL_ID]["tpm"]["N"]) == pytest.approx(0.0)
+
+
+def test_unlimited_models_are_admitted_at_once():
+    clock = FakeClock()
+    control = controller(admission.MemoryBuckets(), clock)
+    for _ in range(100):
+        assert control.admit("amazon.titan-text-express-v1", tokens=10000) == 0.0
+    assert clock.slept == []
+
+
+def test_concurrent_write_is_retried_on_fresh_state():
+    clock = FakeClock()
+    client = FakeDynamoDB()
+    buckets = admission.DynamoDBBuckets("buckets", client=client)
+    assert buckets.take(MODEL_ID, LIMITS, {"rpm": 1, "tpm": 1000}, clock()) == 0.0
+    # Another instance takes tokens between this instance's read, and its write
+    now = clock()
+    client.interleave = lambda: admission.DynamoDBBuckets("buckets", client=client).take(MODEL_ID, LIMITS, {"rpm": 1, "tpm": 1000}, now + 0.001)
+    assert buckets.take(MODEL_ID, LIMITS, {"rpm": 1, "tpm": 1000}, now) == 0.0
+    assert client.conflicts == 1
+    # Both takes are counted, neither overwrote the other
+    assert float(client.items[MODEL_ID]["tpm"]["N"]) == pytest.approx(3000.0, abs=1)
+    assert float(client.items[MODEL_ID]["rpm"]["N"]) == pytest.approx(57.0, abs=0.01)
+
+
+def test_heavily_contended_bucket_is_retried_shortly():
+    clock = FakeClock()
+
+    class ContendedDynamoDB(FakeDynamoDB):
+        # Every write loses to another instance
+        def put_item(self, **kwargs):
+            self.conflicts += 1
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}}, "PutItem")
+
+    client = ContendedDynamoDB()
+    assert admission.DynamoDBBuckets("buckets", client=client).take(MODEL_ID, LIMITS, {"rpm": 1, "tpm": 100}, clock()) == pytest.approx(0.1)
+    assert client.conflicts == admission.WRITE_ATTEMPTS
+
+
+def test_call_is_shed_beyond_max_wait():
+    clock = FakeClock()
+    control = controller(admission.DynamoDBBuckets("buckets", client=FakeDynamoDB()), clock, max_wait=2.0)
+    control.admit(MODEL_ID, tokens=6000)
+    with pytest.raises(admission.Throttled) as shed:
+        control.admit(MODEL_ID, tokens=500)  # Five seconds of tokens
+    assert shed.value.retry_after == 5
+    assert clock.slept == []
+    assert control.counters == {"Admitted": 1, "Shed": 1}
+
+
+def test_shed_request_gets_429_with_retry_after(monkeypatch):
+    text_api = runtime.load("text_api", monkeypatch, TEXT_MODEL_ID=MODEL_ID, EMBEDDING_MODEL_ID="amazon.titan-embed-text-v1")
+    clock = FakeClock()
+    text_api.admission_controller = controller(admission.MemoryBuckets(), clock, max_wait=0.0)
+    text_api.admission_controller.backend.take(MODEL_ID, LIMITS, {"rpm": 60, "tpm": 6000}, clock())  # Drained
+    response = text_api.lambda_handler({"body": json.dumps({"question": "What is S3?", "response_length": "short"})}, None)
+    assert response["statusCode"] == 429
+    retry_after = int(response["headers"]["Retry-After"])
+    assert retry_after >= 1
+    assert f"retry after {retry_after} seconds" in json.loads(response["body"])["message"]
+    # Bedrock throttling, despite retries, is answered the same way
+    throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+    assert admission.retry_after(throttled) == admission.RETRY_AFTER_SECONDS
+    assert admission.retry_after(RuntimeError("Bedrock failed")) is None
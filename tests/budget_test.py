@@ -0,0 +1,75 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import json
+import pathlib
+import pytest
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import budget, models
+
+# A model id of each adapter family
+MODEL_IDS = {
+    "anthropic": "anthropic.claude-3-haiku-20240307-v1:0",
+    "llama2": "meta.llama2-13b-chat-v1",
+    "llama3": "meta.llama3-8b-instruct-v1:0",
+    "titan": "amazon.titan-text-express-v1"
+}
+QUOTE_TOKENS = 512
+
+def request_max_tokens(template: dict) -> int:
+    # The output token limit of the request body, which the model enforces
+    body = json.loads(models.build_body(template, "What is S3?"))
+    *parents, field = models.ADAPTERS[template["family"]]["max_tokens_field"].split(".")
+    for parent in parents:
+        body = body[parent]
+    return body[field]
+
+
+@pytest.mark.parametrize("family", MODEL_IDS)
+def test_budgets_are_within_the_output_limit_of_every_family(family):
+    model_id = MODEL_IDS[family]
+    assert models.get_family(model_id) == family
+    max_output_tokens = models.ADAPTERS[family]["max_output_tokens"]
+    for extra_tokens in [0, QUOTE_TOKENS]:
+        templates = budget.compile_templates(model_id, system=models.DEFAULT_SYSTEM_PROMPT, extra_tokens=extra_tokens)
+        for length, template in templates.items():
+            assert template["max_tokens"] == min(budget.RESPONSE_LENGTHS[length] + extra_tokens, max_output_tokens)
+            assert request_max_tokens(template) == template["max_tokens"]
+
+
+def test_budget_metrics_report_the_clamped_budget():
+    values = budget.budget_metrics(MODEL_IDS["llama3"], "long", extra_tokens=QUOTE_TOKENS, truncated=True)
+    assert values["MaxTokens"] == models.ADAPTERS["llama3"]["max_output_tokens"]
+    assert values["Truncated"] == 1
+
+
+def test_latency_saved_against_the_old_default_of_each_family():
+    # Claude requests used to be given 4,096 output tokens, Llama and Titan requests 512
+    assert budget.budget_metrics(MODEL_IDS["anthropic"], "short", extra_tokens=0, truncated=False)["WorstCaseLatencySaved"] == (4096 - 256) / budget.OUTPUT_TOKENS_PER_SECOND
+    for family in ["llama2", "llama3", "titan"]:
+        assert budget.legacy_max_tokens(MODEL_IDS[family]) == 512
+        assert budget.budget_metrics(MODEL_IDS[family], "short", extra_tokens=0, truncated=False)["WorstCaseLatencySaved"] == (512 - 256) / budget.OUTPUT_TOKENS_PER_SECOND
+        assert budget.budget_metrics(MODEL_IDS[family], "long", extra_tokens=0, truncated=False)["WorstCaseLatencySaved"] == 0
+    # An API can override the old budget of a family
+    values = budget.budget_metrics(MODEL_IDS["anthropic"], "short", extra_tokens=0, truncated=False, legacy_max_tokens_by_family={"anthropic": 8192})
+    assert values["WorstCaseLatencySaved"] == (8192 - 256) / budget.OUTPUT_TOKENS_PER_SECOND
@@ -0,0 +1,146 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import json
+import boto3
+import pytest
+import pathlib
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import clients
+
+REGIONS = ["us-east-1", "us-west-2", "eu-central-1"]
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    # A local Bedrock runtime endpoint, that answers, or throttles, as its server's `throttle` flag says
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.hits += 1
+        if self.server.throttle:
+            body, status, headers = {"message": "Too many requests, please wait before trying again."}, 429, {"x-amzn-ErrorType": "ThrottlingException"}
+        else:
+            body, status, headers = {"region": self.server.region}, 200, {}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in {"Content-Type": "application/json", "Content-Length": str(len(payload)), **headers}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def servers():
+    servers = {}
+    for region in REGIONS:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBedrockHandler)
+        server.region, server.throttle, server.hits = region, False, 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[region] = server
+    yield servers
+    for server in servers.values():
+        server.shutdown()
+
+
+def make_pool(servers, clock):
+    def factory(region, config):
+        return boto3.client(
+            "bedrock-runtime",
+            region_name=region,
+            endpoint_url=f"http://127.0.0.1:{servers[region].server_address[1]}",
+            aws_access_key_id="test",
+            aws_secret_access_key="test",
+            config=config
+        )
+    return clients.BedrockPool(REGIONS, factory=factory, config=Config(retries={"total_max_attempts": 1}), clock=clock)
+
+
+def invoke(pool) -> str:
+    response = pool.invoke_model(body=b"{}", modelId="anthropic.claude-instant-v1", accept="application/json", contentType="application/json")
+    return json.loads(response["body"].read())["region"]
+
+
+def test_throttled_region_falls_back_and_sticks(servers):
+    pool = make_pool(servers, FakeClock())
+    assert invoke(pool) == "us-east-1"
+    servers["us-east-1"].throttle = True
+    fallback = invoke(pool)
+    assert fallback != "us-east-1"
+    # The fallback region sticks, without trying the throttled region first
+    hits = servers["us-east-1"].hits
+    servers["us-east-1"].throttle = False
+    assert [invoke(pool) for _ in range(5)] == [fallback] * 5
+    assert servers["us-east-1"].hits == hits
+    assert pool.report()["us-east-1"]["throttles"] == 1
+
+
+def test_circuit_breaker_opens_and_recovers(servers):
+    clock = FakeClock()
+    pool = make_pool(servers, clock)
+    for server in servers.values():
+        server.throttle = True
+    for _ in range(clients.BREAKER_FAILURES):
+        with pytest.raises(ClientError):
+            invoke(pool)
+    assert all(state["breaker_open"] for state in pool.report().values())
+    # With every breaker open, all regions are still tried, rather than failing without a call
+    servers["eu-central-1"].throttle = False
+    assert invoke(pool) == "eu-central-1"
+    assert not pool.report()["eu-central-1"]["breaker_open"]
+    # The other breakers stay open until their cool-down, then let a trial call through
+    servers["eu-central-1"].throttle = True
+    servers["us-west-2"].throttle = False
+    hits = servers["us-west-2"].hits
+    with pytest.raises(ClientError):
+        invoke(pool)
+    assert servers["us-west-2"].hits == hits
+    clock.now += clients.BREAKER_COOLDOWN + clients.THROTTLE_COOLDOWN
+    assert invoke(pool) == "us-west-2"
+
+
+def test_validation_errors_are_not_retried_in_other_regions():
+    calls = []
+    class Invalid:
+        def invoke_model(self, **kwargs):
+            calls.append(kwargs)
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "Malformed input request"}}, "InvokeModel")
+    pool = clients.BedrockPool(REGIONS, factory=lambda region, config: Invalid())
+    with pytest.raises(ClientError):
+        pool.invoke_model(body=b"{}", modelId="anthropic.claude-instant-v1")
+    assert len(calls) == 1
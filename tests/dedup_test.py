@@ -0,0 +1,65 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import dedup
+
+PASSAGE = "Amazon S3 is an object storage service that offers industry-leading scalability, data availability, security, and performance for data lakes, websites, mobile applications, backup and restore, archive, enterprise applications, IoT devices, and big data analytics."
+NEAR_DUPLICATE = PASSAGE.replace("mobile applications", "mobile apps")
+UNRELATED = "Amazon SageMaker Processing runs data processing workloads, such as feature engineering, data validation, model evaluation, and model interpretation, on fully managed infrastructure."
+
+
+def chunks(*passages):
+    return [{"passage": passage, "rank": rank} for rank, passage in enumerate(passages)]
+
+
+def test_signature_is_deterministic():
+    assert dedup.signature(PASSAGE) == dedup.signature(PASSAGE.upper())
+    assert dedup.similarity(dedup.signature(PASSAGE), dedup.signature(PASSAGE)) == 1.0
+    assert dedup.similarity(dedup.signature(PASSAGE), dedup.signature(UNRELATED)) < 0.1
+
+
+def test_exact_duplicates_are_dropped_keeping_the_first():
+    kept, dropped = dedup.drop_near_duplicates(chunks(PASSAGE, UNRELATED, PASSAGE), threshold=1.0)
+    assert [chunk["rank"] for chunk in kept] == [0, 1]
+    assert [chunk["rank"] for chunk in dropped] == [2]
+
+
+def test_near_duplicates_are_dropped_at_the_threshold():
+    estimate = dedup.similarity(dedup.signature(PASSAGE), dedup.signature(NEAR_DUPLICATE))
+    assert 0.5 < estimate < 1.0
+    # Dropped at, or above the threshold, kept above it
+    kept, dropped = dedup.drop_near_duplicates(chunks(PASSAGE, NEAR_DUPLICATE), threshold=estimate)
+    assert len(kept) == 1 and len(dropped) == 1
+    kept, dropped = dedup.drop_near_duplicates(chunks(PASSAGE, NEAR_DUPLICATE), threshold=estimate + 1 / dedup.NUM_PERMUTATIONS)
+    assert len(kept) == 2 and not dropped
+
+
+def test_unrelated_passages_are_kept():
+    # Dissimilar passages share no LSH band, so they are not even compared, whatever the threshold
+    kept, dropped = dedup.drop_near_duplicates(chunks(PASSAGE, UNRELATED), threshold=0.0)
+    assert len(kept) == 2 and not dropped
+    # Short passages are a single shingle, so they only match when they are the same
+    kept, dropped = dedup.drop_near_duplicates(chunks("Page 1", "Page 2", "Page 1"), threshold=0.9)
+    assert [chunk["passage"] for chunk in kept] == ["Page 1", "Page 2"]
@@ -0,0 +1,93 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import io
+import sys
+import json
+import time
+import random
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import clients, hedging, metrics, models
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+FAST_SECONDS = 0.005
+SLOW_SECONDS = 0.25
+SLOW_RATE = 0.02 # Slow tail, beyond the hedging percentile
+CALLS = 400
+
+class FakeBedrock:
+    # Stands in for the Bedrock runtime client, with a slow tail of independently slow calls
+
+    def __init__(self, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        time.sleep(SLOW_SECONDS if self.rng.random() < SLOW_RATE else FAST_SECONDS)
+        body = {"content": [{"type": "text", "text": "Answer"}], "stop_reason": "end_turn", "usage": {"input_tokens": 1, "output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+
+def latencies(client, hedger):
+    template = models.compile_template(MODEL_ID, params={"max_tokens": 16})
+    samples = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        result = hedging.call(hedger, client, "generate", lambda hedge_client: models.generate(client=hedge_client, template=template, prompt="Question"))
+        samples.append(time.perf_counter() - start)
+        assert result["text"] == "Answer"
+    return samples
+
+
+def test_hedging_cuts_tail_latency():
+    baseline = latencies(FakeBedrock(seed=1), hedger=None)
+    client = FakeBedrock(seed=1)
+    hedger = hedging.Hedger(client=client, percentile=97, budget_percent=10)
+    hedged = latencies(client, hedger)
+    report = hedger.report()
+    assert metrics.percentile(hedged, 99) < metrics.percentile(baseline, 99) / 2
+    # The extra load stays within the budget
+    assert 0 < report["Hedged"] <= CALLS * 0.1
+    assert report["HedgeWins"] > 0
+
+
+def test_hedging_disabled_without_budget():
+    client = FakeBedrock(seed=2)
+    hedger = hedging.Hedger(client=client, budget_percent=0)
+    latencies(client, hedger)
+    assert hedger.report()["Hedged"] == 0
+    assert client.calls == CALLS
+
+
+def test_hedge_region_client_is_a_pool(monkeypatch):
+    # Hedged calls to another region get the retries, circuit breaker, and timeouts of the primary calls
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("HEDGE_BUDGET_PERCENT", "5")
+    monkeypatch.setenv("HEDGE_REGION", "us-west-2")
+    hedger = hedging.from_env(FakeBedrock(seed=3))
+    assert isinstance(hedger.hedge_client, clients.BedrockPool)
+    assert hedger.hedge_client.regions == ["us-west-2"]
+    monkeypatch.delenv("HEDGE_REGION")
+    hedger = hedging.from_env(FakeBedrock(seed=3))
+    assert hedger.hedge_client is hedger.client
@@ -0,0 +1,212 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import io
+import sys
+import json
+import time
+import base64
+import pathlib
+import threading
+import pytest
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from botocore.exceptions import ClientError
+from llmops import deadline, image_cache
+from tests import runtime
+
+GENERATION_SECONDS = 0.1
+
+def image_of(image_seed: int) -> str:
+    return base64.b64encode(f"png-{image_seed}".encode("utf-8")).decode("utf-8")
+
+
+class FakeBedrock:
+    # Stands in for the Bedrock runtime client, recording the generation request of each image, and
+    # how many were generated at the same time
+
+    def __init__(self, seconds: float=0.0) -> None:
+        self.seconds = seconds
+        self.requests = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def invoke_model(self, **kwargs):
+        request = json.loads(kwargs["body"])
+        with self.lock:
+            self.requests.append(request)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+        body = {"artifacts": [{"base64": image_of(request["seed"]), "seed": request["seed"], "finishReason": "SUCCESS"}]}
+        return {"body": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+
+class FakeOutputs:
+    # Stands in for the S3 image outputs, returning a URL per image
+
+    def store(self, image: str, output_format: str="png", thumbnail: bool=False):
+        key = f"outputs/{base64.b64decode(image).decode('utf-8')}.{output_format}"
+        return {"image": {"url": f"https://outputs.s3.amazonaws.com/{key}", "key": key, "bytes": len(image)}}
+
+
+class FakeS3:
+    # Stands in for the S3 client of the image cache, with objects kept in memory
+
+    def __init__(self) -> None:
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+class LambdaContext:
+
+    def __init__(self, remaining_seconds: float) -> None:
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(self.remaining_seconds * 1000)
+
+
+@pytest.fixture
+def image_api(monkeypatch):
+    module = runtime.load("image_api", monkeypatch, IMAGE_MODEL_ID="stability.stable-diffusion-xl-v1", IMAGE_OUTPUT_BUCKET="outputs")
+    module.bedrock_client = FakeBedrock()
+    return module
+
+
+def post(image_api, context=None, **body):
+    response = image_api.lambda_handler({"body": json.dumps({"prompt": "A lighthouse", "style": "photographic", **body})}, context)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_steps_fit_the_time_left(image_api):
+    final_steps = image_api.quality_tiers["final"]["steps"]
+    assert image_api.fit_steps(final_steps, None) == final_steps
+    assert image_api.fit_steps(final_steps, deadline.Deadline(60.0)) == final_steps
+    # Fewer steps when the time runs short, down to the minimum
+    fitted = image_api.fit_steps(final_steps, deadline.Deadline(10.0))
+    assert image_api.min_steps <= fitted < final_steps
+    with pytest.raises(deadline.DeadlineExceeded):
+        image_api.fit_steps(final_steps, deadline.Deadline(5.0))
+
+
+def test_draft_tier_needs_only_its_own_steps(image_api):
+    draft_steps = image_api.quality_tiers["draft"]["steps"]
+    assert draft_steps < image_api.min_steps
+    seconds = deadline.FIRST_TOKEN_SECONDS + draft_steps * image_api.seconds_per_step + 0.5
+    assert image_api.fit_steps(draft_steps, deadline.Deadline(seconds)) == draft_steps
+    with pytest.raises(deadline.DeadlineExceeded):
+        image_api.fit_steps(draft_steps, deadline.Deadline(seconds - 1.0))
+
+
+def test_quality_tier_sets_the_steps(image_api):
+    for quality, tier in image_api.quality_tiers.items():
+        status, body = post(image_api, quality=quality)
+        assert status == 200 and body["quality"] == quality and body["response"] == image_of(image_api.seed)
+        request = image_api.bedrock_client.requests[-1]
+        assert (request["steps"], request["width"], request["height"], request["sampler"]) == (tier["steps"], tier["width"], tier["height"], tier["sampler"])
+    status, body = post(image_api)
+    assert body["quality"] == image_api.default_quality
+    assert image_api.bedrock_client.requests[-1]["steps"] == image_api.quality_tiers[image_api.default_quality]["steps"]
+
+
+def test_image_with_lowered_steps_is_not_cached(image_api):
+    image_api.images = image_cache.ImageCache(bucket="cache", model_id=image_api.IMAGE_MODEL_ID, defaults={}, client=FakeS3())
+    final_steps = image_api.quality_tiers["final"]["steps"]
+    image_api.get_prediction("A lighthouse", "photographic", quality="final", request_deadline=deadline.Deadline(10.0))
+    assert image_api.bedrock_client.requests[-1]["steps"] < final_steps
+    assert not image_api.images.client.objects
+    # A request with the time for all the steps generates, and caches, the full quality image
+    image_api.get_prediction("A lighthouse", "photographic", quality="final", request_deadline=deadline.Deadline(60.0))
+    assert image_api.bedrock_client.requests[-1]["steps"] == final_steps
+    assert len(image_api.images.client.objects) == 1
+    image_api.get_prediction("A lighthouse", "photographic", quality="final", request_deadline=deadline.Deadline(10.0))
+    assert len(image_api.bedrock_client.requests) == 2
+
+
+def test_unknown_quality_is_rejected(image_api):
+    status, body = post(image_api, quality="ultra")
+    assert status == 200 and body["status"] == "error" and "quality must be one of" in body["message"]
+    assert not image_api.bedrock_client.requests
+
+
+def test_request_without_time_for_the_minimum_steps_fails_fast(image_api):
+    status, body = post(image_api, context=LambdaContext(remaining_seconds=4.0))
+    assert status == 504
+    assert not image_api.bedrock_client.requests
+
+
+def test_sequential_seeds_follow_the_request_seed(image_api):
+    assert image_api.sample_seeds(7, 1) == [7]
+    assert image_api.sample_seeds(7, 4) == [7, 8, 9, 10]
+    # Wrapping around at the largest seed
+    assert image_api.sample_seeds(image_api.max_seed, 2) == [image_api.max_seed, 0]
+
+
+def test_random_seeds_are_within_range(image_api):
+    seeds = image_api.sample_seeds(0, image_api.max_samples, strategy="random")
+    assert len(seeds) == image_api.max_samples
+    assert all(0 <= image_seed <= image_api.max_seed for image_seed in seeds)
+
+
+def test_samples_are_generated_concurrently(image_api):
+    image_api.bedrock_client = FakeBedrock(seconds=GENERATION_SECONDS)
+    image_api.outputs = FakeOutputs()
+    start = time.perf_counter()
+    status, body = post(image_api, output="url", seed=41, samples=3)
+    assert status == 200
+    assert image_api.bedrock_client.max_running == 3
+    assert time.perf_counter() - start < 3 * GENERATION_SECONDS
+    # One generation request per sample, each with its own seed, in the order of the seeds
+    assert sorted(request["seed"] for request in image_api.bedrock_client.requests) == [41, 42, 43]
+    assert [sample["seed"] for sample in body["samples"]] == [41, 42, 43]
+    assert len({sample["image"]["key"] for sample in body["samples"]}) == 3
+    assert body["response"] == body["samples"][0]["response"]
+
+
+def test_random_samples_return_their_seeds(image_api):
+    image_api.outputs = FakeOutputs()
+    status, body = post(image_api, output="url", samples=2, seed_strategy="random")
+    assert status == 200
+    assert sorted(sample["seed"] for sample in body["samples"]) == sorted(request["seed"] for request in image_api.bedrock_client.requests)
+
+
+@pytest.mark.parametrize("fields, message", [
+    ({"output": "url", "samples": 5}, "samples must be an integer"),
+    ({"output": "url", "samples": 0}, "samples must be an integer"),
+    ({"samples": 2}, "samples above 1 require url output"),
+    ({"output": "url", "samples": 2, "seed_strategy": "random", "seed": 1}, "seed requires the sequential seed_strategy")
+])
+def test_invalid_samples_are_rejected(image_api, fields, message):
+    image_api.outputs = FakeOutputs()
+    status, body = post(image_api, **fields)
+    assert body["status"] == "error" and message in body["message"]
+    assert not image_api.bedrock_client.requests
@@ -0,0 +1,100 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import io
+import sys
+import base64
+import pathlib
+import datetime
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from botocore.exceptions import ClientError
+from llmops import image_cache
+
+MODEL_ID = "stability.stable-diffusion-xl-v1"
+DEFAULTS = {"cfg_scale": 5, "seed": 0, "steps": 70}
+REQUEST = {"text_prompts": [{"text": "A lighthouse", "weight": 1.0}], "cfg_scale": 5, "seed": 0, "steps": 70, "style_preset": "photographic"}
+IMAGE = base64.b64encode(b"\x89PNG image").decode("utf-8")
+
+class FakeS3:
+    # Stands in for the S3 client, with objects kept in memory
+
+    def __init__(self) -> None:
+        self.objects = {}
+        self.clock = datetime.datetime(2024, 1, 1)
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.clock += datetime.timedelta(minutes=1)
+        self.objects[Key] = {"Body": Body, "LastModified": self.clock}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key]["Body"])}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {"Contents": [{"Key": key, "Size": len(item["Body"]), "LastModified": item["LastModified"]} for key, item in self.objects.items() if key.startswith(Prefix)]}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            del self.objects[item["Key"]]
+
+
+def test_cached_image_is_returned():
+    cache = image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults=DEFAULTS, client=FakeS3())
+    assert cache.get(REQUEST) is None
+    cache.put(REQUEST, IMAGE)
+    assert cache.get(REQUEST) == IMAGE
+    assert cache.get({**REQUEST, "style_preset": "anime"}) is None
+    assert cache.report() == {"Hits": 1, "Misses": 2}
+
+
+def test_image_is_loaded_by_its_key():
+    # Identical requests in flight share the key of the stored image, rather than the image itself
+    cache = image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults=DEFAULTS, client=FakeS3())
+    key = cache.put(REQUEST, IMAGE)
+    assert key == cache.object_key(REQUEST)
+    assert cache.load(key) == IMAGE
+    assert cache.load(cache.object_key({**REQUEST, "seed": 1})) is None
+
+
+def test_key_version_changes_with_model_and_defaults():
+    client = FakeS3()
+    cache = image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults=DEFAULTS, client=client)
+    cache.put(REQUEST, IMAGE)
+    assert image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults=dict(DEFAULTS), client=client).get(REQUEST) == IMAGE
+    assert image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults={**DEFAULTS, "cfg_scale": 7}, client=client).get(REQUEST) is None
+    assert image_cache.ImageCache(bucket="bucket", model_id="stability.sd3-large-v1:0", defaults=DEFAULTS, client=client).get(REQUEST) is None
+
+
+def test_eviction_deletes_oldest_images_beyond_max_size():
+    client = FakeS3()
+    cache = image_cache.ImageCache(bucket="bucket", model_id=MODEL_ID, defaults=DEFAULTS, client=client)
+    requests = [{**REQUEST, "style_preset": style} for style in ["anime", "cinematic", "photographic", "pixel-art"]]
+    for request in requests:
+        cache.put(request, IMAGE)
+    size = len(base64.b64decode(IMAGE))
+    result = image_cache.evict(client, bucket="bucket", max_bytes=2 * size)
+    assert result == {"objects": 2, "bytes": 2 * size, "evicted_objects": 2, "evicted_bytes": 2 * size}
+    assert [cache.get(request) is not None for request in requests] == [False, False, True, True]
@@ -0,0 +1,100 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import time
+import pathlib
+import threading
+import pytest
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import jobs
+
+REQUEST = {"prompt": "A lighthouse", "style": "photographic", "output": "url"}
+RESULT = {"response": "https://bucket.s3.amazonaws.com/outputs/image.png"}
+
+class Generator:
+    # Stands in for the image generation of the worker, counting its calls
+
+    def __init__(self, seconds: float=0.0, error: Exception=None) -> None:
+        self.seconds = seconds
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        time.sleep(self.seconds)
+        if self.error:
+            raise self.error
+        return RESULT
+
+
+def work(service: jobs.JobService, generate, **kwargs) -> None:
+    # Stands in for the worker, and its queue event source mapping, running each queued job
+    while True:
+        message = service.queue.receive()
+        if message is None:
+            return
+        service.run(message["job_id"], generate, **kwargs)
+
+
+def test_job_runs_on_the_worker():
+    service = jobs.JobService()
+    job = service.submit(REQUEST)
+    assert job["status"] == jobs.QUEUED
+    assert "request" not in jobs.view(job)
+    assert service.get(job["job_id"])["status"] == jobs.QUEUED
+    generate = Generator()
+    work(service, generate)
+    job = service.get(job["job_id"])
+    assert job["status"] == jobs.SUCCEEDED
+    assert job["result"] == RESULT
+    # Queues deliver at least once, a completed job is not generated again
+    service.run(job["job_id"], generate)
+    assert generate.calls == 1
+
+
+def test_poll_waits_for_completion():
+    service = jobs.JobService()
+    job = service.submit(REQUEST)
+    worker = threading.Thread(target=work, args=(service, Generator(seconds=1.0)))
+    worker.start()
+    start = time.perf_counter()
+    job = service.get(job["job_id"], wait=10)
+    worker.join()
+    assert job["status"] == jobs.SUCCEEDED
+    assert time.perf_counter() - start < 5
+    assert service.get("0" * 32, wait=10) is None
+
+
+def test_failed_and_retried_jobs():
+    service = jobs.JobService()
+    failed = service.submit(REQUEST)
+    work(service, Generator(error=ValueError("Invalid prompt")))
+    assert service.get(failed["job_id"])["status"] == jobs.FAILED
+    assert service.get(failed["job_id"])["error"] == "Invalid prompt"
+    throttled = service.submit(REQUEST)
+    with pytest.raises(RuntimeError):
+        work(service, Generator(error=RuntimeError("Throttled")), retryable=lambda error: isinstance(error, RuntimeError))
+    # The queue delivers the job again, to a worker that is no longer throttled
+    assert service.get(throttled["job_id"])["status"] == jobs.QUEUED
+    service.run(throttled["job_id"], Generator())
+    assert service.get(throttled["job_id"])["status"] == jobs.SUCCEEDED
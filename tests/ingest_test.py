@@ -0,0 +1,46 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import ingest
+
+DOCUMENT = " ".join(f"Sentence {i} of a document that is split into several parent windows." for i in range(100))
+
+
+def test_same_file_name_in_different_collections_gets_distinct_parents(tmp_path):
+    for collection in ["finance", "legal"]:
+        tmp_path.joinpath(collection).mkdir()
+        tmp_path.joinpath(collection, "report_1.txt").write_text(f"{collection.title()}. {DOCUMENT}", encoding="utf-8")
+    chunks, parents = ingest.create_chunks(str(tmp_path), chunk_size=200, chunk_overlap=20, dedup_threshold=0, parent_chunk_size=1000)
+    assert len({parent["parent_id"] for parent in parents}) == len(parents)
+    # Each passage still points at a window of its own document
+    windows = {parent["parent_id"]: parent["passage"] for parent in parents}
+    for chunk in chunks:
+        assert chunk["passage"] in windows[chunk["parent_id"]]
+
+
+def test_parent_ids_are_stable_across_runs():
+    assert ingest.parent_id_of("finance/report_1.txt", 0) == ingest.parent_id_of("finance/report_1.txt", 0)
+    assert ingest.parent_id_of("finance/report_1.txt", 0) != ingest.parent_id_of("legal/report_1.txt", 0)
+    assert ingest.parent_id_of("finance/report_1.txt", 0) != ingest.parent_id_of("finance/report_1.txt", 1)
@@ -0,0 +1,70 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import io
+import sys
+import json
+import logging
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import logs
+
+
+def capture(level: int=logging.INFO, sample_rate: float=1.0, name: str="logs_test"):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logs.JsonFormatter())
+    handler.addFilter(logs.SampleFilter(sample_rate, random=lambda: 0.5))
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger, stream
+
+
+def test_lazy_values_are_not_formatted_at_a_disabled_level():
+    calls = []
+    logger, stream = capture(level=logging.INFO)
+    logger.debug("Received event: %s", logs.Lazy(lambda: calls.append(1)))
+    assert calls == []
+    assert stream.getvalue() == ""
+
+
+def test_records_are_json_lines_with_truncated_values():
+    logger, stream = capture()
+    event = {"body": "x" * 100000, "path": "/"}
+    logger.info("Received event: %s", logs.lazy_json(event), extra={"stage": "handler"})
+    logger.info("y" * 10000)
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["level"] == "INFO" and first["stage"] == "handler"
+    assert len(first["message"]) < 1000
+    assert json.loads(first["message"].split(": ", 1)[1])["path"] == "/"
+    assert second["message"].endswith(f"[{10000 - logs.MAX_MESSAGE_CHARS} more characters]")
+
+
+def test_verbose_records_are_sampled():
+    logger, stream = capture(sample_rate=0.1, name="logs_test_sampled")
+    logger.info("Answer: %s", "verbose", extra=logs.VERBOSE)
+    logger.info("Question: %s", "kept")
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["Question: kept"]
+    assert "verbose" not in lines[0]
@@ -0,0 +1,56 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import models
+from tests import runtime
+
+def load_rag_api(monkeypatch, text_model_id: str):
+    return runtime.load(
+        "rag_api",
+        monkeypatch,
+        TEXT_MODEL_ID=text_model_id,
+        EMBEDDING_MODEL_ID="amazon.titan-embed-text-v1",
+        OPENSEARCH_ENDPOINT="localhost",
+        OPENSEARCH_SECRET="secret",
+        OPENSEARCH_INDEX="index"
+    )
+
+
+def test_instructions_reach_the_minimum_cached_prefix(monkeypatch):
+    model_id = "anthropic.claude-3-7-sonnet-20250219-v1:0"
+    rag_api = load_rag_api(monkeypatch, model_id)
+    system = f"{rag_api.RAG_INSTRUCTIONS}\n\n{rag_api.RAG_EXAMPLES}"
+    assert len(system) / models.CHARS_PER_TOKEN >= models.PROMPT_CACHE_MODELS["claude-3-7-sonnet"]
+    for template in rag_api.RAG_TEMPLATES[model_id].values():
+        assert template["prompt_cache"]
+        assert "cache_control" in template["prefix"]
+
+
+def test_instructions_are_not_marked_for_models_without_prompt_caching(monkeypatch):
+    model_id = "anthropic.claude-instant-v1"
+    rag_api = load_rag_api(monkeypatch, model_id)
+    for template in rag_api.RAG_TEMPLATES[model_id].values():
+        assert not template["prompt_cache"]
+        assert "cache_control" not in template["prefix"]
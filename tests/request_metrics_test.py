@@ -0,0 +1,82 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import cache, metrics
+
+NAMESPACE = "Test/RAG-API"
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_stages_are_emf_records_with_stage_cold_start_and_model_dimensions():
+    clock = FakeClock()
+    request_metrics = metrics.RequestMetrics(NAMESPACE, cold_start=True, clock=clock)
+    with metrics.stage(request_metrics, "search") as stage:
+        clock.now += 0.05
+        stage.add(Bytes=2048)
+    with metrics.stage(request_metrics, "generation") as stage:
+        clock.now += 1.5
+        stage.model_id = MODEL_ID
+        stage.add(InputTokens=900, OutputTokens=120)
+    search, generation = request_metrics.emf_records()
+    assert search["Stage"] == "search" and search["ColdStart"] == "true"
+    assert search["Latency"] == 50.0 and search["Bytes"] == 2048
+    assert search["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Stage"], ["Stage", "ColdStart"]]
+    assert generation["ModelId"] == MODEL_ID and generation["Latency"] == 1500.0
+    assert ["Stage", "ModelId"] in generation["_aws"]["CloudWatchMetrics"][0]["Dimensions"]
+    units = {metric["Name"]: metric["Unit"] for metric in generation["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert units == {"InputTokens": "Count", "OutputTokens": "Count", "Latency": "Milliseconds"}
+
+
+def test_failed_stages_are_recorded_and_uninstrumented_stages_are_not():
+    request_metrics = metrics.RequestMetrics(NAMESPACE)
+    try:
+        with metrics.stage(request_metrics, "secret"):
+            raise TimeoutError()
+    except TimeoutError:
+        pass
+    with metrics.stage(None, "secret") as stage:
+        stage.add(Bytes=1)
+    assert [record["Stage"] for record in request_metrics.emf_records()] == ["secret"]
+
+
+def test_cache_stage_records_hits_and_misses():
+    response_cache = cache.ResponseCache(cache.MemoryCache())
+    hits = []
+    for _ in range(2):
+        request_metrics = metrics.RequestMetrics(NAMESPACE)
+        cache.get_or_compute(response_cache, "key", lambda: {"response": "Answer"}, request_metrics=request_metrics)
+        record, = request_metrics.emf_records()
+        assert record["Stage"] == "cache"
+        hits.append(record["CacheHit"])
+    assert hits == [0, 1]
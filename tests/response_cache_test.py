@@ -0,0 +1,108 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import time
+import pathlib
+import threading
+import pytest
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import cache
+
+MODEL_IDS = ["anthropic.claude-3-haiku-20240307-v1:0"]
+CONCURRENT_REQUESTS = 10
+COMPUTE_SECONDS = 0.2
+
+class Counter:
+    # Stands in for the Bedrock call behind a response, counting how often it is made
+
+    def __init__(self, seconds: float=0.0) -> None:
+        self.seconds = seconds
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.seconds)
+        return {"response": "Answer"}
+
+
+def test_request_key_is_canonical():
+    key = cache.request_key(MODEL_IDS, {"question": "Why?", "response_length": "short"}, generation="uuid:10")
+    assert key == cache.request_key(MODEL_IDS, {"response_length": "short", "question": "Why?"}, generation="uuid:10")
+    assert key != cache.request_key(MODEL_IDS, {"question": "Why?", "response_length": "short"}, generation="uuid:11")
+    assert key != cache.request_key(["anthropic.claude-instant-v1"], {"question": "Why?", "response_length": "short"}, generation="uuid:10")
+
+
+def test_hit_after_miss_until_expired():
+    now = [1000.0]
+    response_cache = cache.ResponseCache(ttl=60, clock=lambda: now[0])
+    compute = Counter()
+    assert response_cache.get_or_compute("key", compute) == {"response": "Answer"}
+    assert response_cache.get_or_compute("key", compute) == {"response": "Answer"}
+    assert compute.calls == 1
+    now[0] += 61
+    response_cache.get_or_compute("key", compute)
+    assert compute.calls == 2
+    assert response_cache.report()["HitRate"] == round(1 / 3, 4)
+
+
+def test_concurrent_misses_are_coalesced():
+    response_cache = cache.ResponseCache(poll=0.01)
+    compute = Counter(seconds=COMPUTE_SECONDS)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(response_cache.get_or_compute("key", compute))) for _ in range(CONCURRENT_REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert compute.calls == 1
+    assert results == [{"response": "Answer"}] * CONCURRENT_REQUESTS
+    report = response_cache.report()
+    assert report["Misses"] == 1
+    assert report["Hits"] == report["Coalesced"] == CONCURRENT_REQUESTS - 1
+
+
+def test_waiting_is_bounded():
+    response_cache = cache.ResponseCache(poll=0.01)
+    assert response_cache.backend.claim("key", lease=60, now=time.time())  # Held by a request that never finishes
+    compute = Counter()
+    start = time.perf_counter()
+    response_cache.get_or_compute("key", compute, max_wait=0.1)
+    assert compute.calls == 1
+    assert time.perf_counter() - start < 1
+
+
+def test_rejected_and_failed_responses_are_not_cached():
+    response_cache = cache.ResponseCache()
+    compute = Counter()
+    response_cache.get_or_compute("key", compute, cacheable=lambda response: False)
+    response_cache.get_or_compute("key", compute, cacheable=lambda response: False)
+    assert compute.calls == 2
+    def fail():
+        raise RuntimeError("Bedrock failed")
+    with pytest.raises(RuntimeError):
+        response_cache.get_or_compute("other", fail)
+    # The failed request released its claim, so the next request computes without waiting
+    assert response_cache.get_or_compute("other", compute) == {"response": "Answer"}
+    assert compute.calls == 3
@@ -0,0 +1,102 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+import pytest
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from benchmarks import harness
+from llmops import ingest, retrieval
+
+
+def hits(*similarities):
+    # OpenSearch inner product scores of the given cosine similarities
+    return [{"_score": value + 1 if value >= 0 else 1 / (1 - value), "_source": {"rank": rank}} for rank, value in enumerate(similarities)]
+
+
+@pytest.fixture(scope="module")
+def corpus_index():
+    # The benchmark corpus, embedded with the benchmark's embedder, that the defaults are calibrated on
+    chunks, _ = ingest.create_chunks(harness.CORPUS_PATH, chunk_size=ingest.CHUNK_SIZE, chunk_overlap=0)
+    index = harness.LocalIndex(harness.FakeEmbedder())
+    index.add(chunks)
+    return index
+
+
+def test_default_cutoff_drops_off_topic_questions(corpus_index):
+    for question in ["What is the boiling point of nitrogen at sea level?", "Who won the football world cup in 2014?"]:
+        assert retrieval.cut_hits(corpus_index.search(question, retrieval.CANDIDATE_K)) == []
+    # An answerable question keeps its best matches, rather than all candidates
+    hits_kept = retrieval.cut_hits(corpus_index.search("What old sea-song did the captain sing?", retrieval.CANDIDATE_K))
+    assert 0 < len(hits_kept) < retrieval.CANDIDATE_K
+
+
+def test_zero_thresholds_disable_the_cutoff():
+    candidates = hits(0.9, 0.5, 0.1, -0.2)
+    assert retrieval.cut_hits(candidates, min_similarity=0.0, relative_similarity=0.0, elbow_gap=0.0) == candidates
+
+
+def test_cutoff_thresholds():
+    candidates = hits(0.8, 0.7, 0.45, 0.4, 0.1)
+    disabled = {"min_similarity": 0.0, "relative_similarity": 0.0, "elbow_gap": 0.0}
+    assert len(retrieval.cut_hits(candidates, **{**disabled, "min_similarity": 0.3})) == 4
+    assert len(retrieval.cut_hits(candidates, **{**disabled, "relative_similarity": 0.7})) == 2
+    # The elbow is the largest drop, between the fourth and fifth candidate
+    assert len(retrieval.cut_hits(candidates, **{**disabled, "elbow_gap": 0.2})) == 4
+    assert len(retrieval.cut_hits(candidates, **{**disabled, "elbow_gap": 0.35})) == 5
+    assert retrieval.cut_hits(candidates, **{**disabled, "min_similarity": 0.9}) == []
+
+
+def test_collection_filter():
+    assert retrieval.build_filter({"collection": "finance"}) == {"bool": {"filter": [{"term": {"collection": "finance"}}]}}
+    assert retrieval.build_filter({"collection": ["finance", "legal"]}) == {"bool": {"filter": [{"terms": {"collection": ["finance", "legal"]}}]}}
+    # Keywords are matched as strings
+    assert retrieval.build_filter({"page": 3}) == {"bool": {"filter": [{"term": {"page": "3"}}]}}
+
+
+def test_time_filter_combined_with_collection():
+    ingested_at = {"gte": 1704067200000, "lt": 1706745600000}
+    assert retrieval.build_filter({"collection": "finance", "ingested_at": ingested_at}) == {
+        "bool": {
+            "filter": [
+                {"term": {"collection": "finance"}},
+                {"range": {"ingested_at": ingested_at}}
+            ]
+        }
+    }
+
+
+def test_no_filters():
+    assert retrieval.build_filter(None) is None
+    assert retrieval.build_filter({}) is None
+
+
+@pytest.mark.parametrize("filters", [
+    ["collection", "finance"],
+    {"passage": "S3"},
+    {"ingested_at": 1704067200000},
+    {"ingested_at": {}},
+    {"ingested_at": {"after": 1704067200000}}
+])
+def test_invalid_filters_are_rejected(filters):
+    with pytest.raises(ValueError):
+        retrieval.build_filter(filters)
@@ -0,0 +1,152 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import io
+import sys
+import json
+import random
+import pathlib
+
+# Make the shared `llmops` runtime library importable, as it is inside the Lambda Layer
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("components", "shared", "runtime", "python")))
+
+from llmops import budget, deadline, router
+
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+SONNET = "anthropic.claude-3-sonnet-20240229-v1:0"
+INSTANT = "anthropic.claude-instant-v1"
+
+class FakeBedrock:
+    # Stands in for the Bedrock runtime client, answering each model with its scripted answer, and stop reason
+
+    def __init__(self, answers: dict, stop_reason: str="end_turn") -> None:
+        self.answers = answers
+        self.stop_reason = stop_reason
+        self.max_tokens = []
+
+    def invoke_model(self, **kwargs):
+        self.max_tokens.append(json.loads(kwargs["body"])["max_tokens"])
+        body = {"content": [{"type": "text", "text": self.answers[kwargs["modelId"]]}], "stop_reason": self.stop_reason, "usage": {"input_tokens": 1, "output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+
+class StepClock:
+    # Monotonic clock that only moves when told to
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ewma_tracks_latency():
+    latency_router = router.LatencyRouter([HAIKU], alpha=0.5)
+    assert latency_router.ewma[HAIKU] == router.model_info(HAIKU)["latency"]
+    latency_router.record(HAIKU, 0.5)
+    latency_router.record(HAIKU, 0.5)
+    assert latency_router.ewma[HAIKU] == 0.5 * 0.5 + 0.5 * (0.5 * 0.5 + 0.5 * 1.5)
+    assert latency_router.report() == {HAIKU: {"ewma_seconds": 0.75, "samples": 2, "degraded": False}}
+
+
+def test_fastest_model_of_the_required_tier_is_chosen():
+    latency_router = router.LatencyRouter([INSTANT, HAIKU, SONNET], probe_rate=0.0)
+    assert latency_router.route("What is S3?", "short") == [HAIKU, SONNET]
+    # Complex questions, and long answers, need the stronger tier
+    assert latency_router.route("Compare S3 and EFS", "standard") == [SONNET]
+    assert latency_router.route("What is S3?", "long") == [SONNET]
+    assert latency_router.route("What is S3?", "short", escalate=False) == [HAIKU]
+
+
+def test_degraded_model_is_avoided_until_it_recovers():
+    latency_router = router.LatencyRouter([INSTANT, HAIKU], alpha=0.5, probe_rate=0.0)
+    for _ in range(3):
+        latency_router.record(HAIKU, 10.0)
+    assert latency_router.degraded(HAIKU)
+    assert latency_router.route("What is S3?", "short") == [INSTANT]
+    for _ in range(5):
+        latency_router.record(HAIKU, 1.0)
+    assert not latency_router.degraded(HAIKU)
+    assert latency_router.route("What is S3?", "short") == [HAIKU]
+
+
+def test_exploration_probes_other_models_at_the_probe_rate():
+    latency_router = router.LatencyRouter([INSTANT, HAIKU], escalate=False, probe_rate=0.1, rng=random.Random(7))
+    routes = [latency_router.route("What is S3?", "short")[0] for _ in range(2000)]
+    assert 0.07 < routes.count(INSTANT) / len(routes) < 0.13
+    # A single eligible model is never probed away from
+    single = router.LatencyRouter([HAIKU], probe_rate=1.0, rng=random.Random(7))
+    assert single.route("What is S3?", "short") == [HAIKU]
+
+
+def generate(client, model_ids, request_deadline, response_length="long"):
+    return router.generate(
+        client=client,
+        router=router.LatencyRouter(model_ids),
+        templates={model_id: budget.compile_templates(model_id) for model_id in model_ids},
+        question="What is S3?",
+        prompt="What is S3?",
+        response_length=response_length,
+        request_deadline=request_deadline
+    )
+
+
+def test_answer_cut_at_lowered_limit_is_deadline_limited():
+    client = FakeBedrock({HAIKU: "S3 is"}, stop_reason="max_tokens")
+    result = generate(client, [HAIKU], deadline.Deadline(10.0))
+    assert client.max_tokens[0] < budget.RESPONSE_LENGTHS["long"]
+    assert result["truncated"] and result["deadline_limited"]
+
+
+def test_complete_answer_within_lowered_limit_is_not_deadline_limited():
+    client = FakeBedrock({HAIKU: "S3 is object storage."})
+    result = generate(client, [HAIKU], deadline.Deadline(10.0))
+    assert client.max_tokens[0] < budget.RESPONSE_LENGTHS["long"]
+    assert not result["truncated"] and not result["deadline_limited"]
+
+
+def test_answer_not_escalated_for_lack_of_time_is_deadline_limited():
+    clock = StepClock()
+    request_deadline = deadline.Deadline(10.0, clock=clock)
+    client = FakeBedrock({HAIKU: "I don't know", SONNET: "S3 is object storage."})
+
+    class SlowBedrock:
+        # The first answer uses up the time left
+        def invoke_model(self, **kwargs):
+            clock.now += 9.5
+            return client.invoke_model(**kwargs)
+
+    result = generate(SlowBedrock(), [HAIKU, SONNET], request_deadline, response_length="short")
+    assert result["model_id"] == HAIKU and result["deadline_limited"]
+    assert len(client.max_tokens) == 1
+
+
+def test_answer_without_relevant_context_is_not_escalated():
+    # A stronger model cannot answer from a document that does not hold the answer either
+    client = FakeBedrock({
+        HAIKU: "Relevant quotes:\nNo relevant quotes\n\nAnswer:\nThe question cannot be answered from the document.",
+        SONNET: "S3 is object storage."
+    })
+    result = generate(client, [HAIKU, SONNET], deadline.Deadline(60.0), response_length="short")
+    assert result["model_id"] == HAIKU and not result["escalated"]
+    assert len(client.max_tokens) == 1
+    # Without the missing context, the answer is escalated
+    client = FakeBedrock({HAIKU: "I don't know.", SONNET: "S3 is object storage."})
+    result = generate(client, [HAIKU, SONNET], deadline.Deadline(60.0), response_length="short")
+    assert result["model_id"] == SONNET and result["escalated"]
@@ -0,0 +1,65 @@
+""" 
+MIT No Attribution
+
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import pathlib
+
+# Make the notification function's modules importable, as they are in Lambda
+REPO_PATH = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_PATH.joinpath("components", "vector_store", "s3_notification_lambda")))
+
+import sizing
+
+REMAINING_MS = 15 * 60 * 1000 # A fresh notification function invocation
+CHUNK_SIZE = 256 # Size of the ingested passages
+
+
+def test_small_upload_takes_the_fast_path():
+    plan = sizing.plan_ingest(total_bytes=sizing.FAST_PATH_MAX_BYTES, key_count=sizing.FAST_PATH_MAX_KEYS, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)
+    assert plan["mode"] == sizing.FAST_PATH
+    assert plan["estimated_seconds"] < REMAINING_MS / 2000
+
+
+def test_fast_path_boundaries():
+    # One byte, or one key, too many for the fast path
+    assert sizing.plan_ingest(sizing.FAST_PATH_MAX_BYTES + 1, 1, REMAINING_MS, chunk_size=CHUNK_SIZE)["mode"] == sizing.PROCESSING_JOB
+    assert sizing.plan_ingest(1 * sizing.KB, sizing.FAST_PATH_MAX_KEYS + 1, REMAINING_MS, chunk_size=CHUNK_SIZE)["mode"] == sizing.PROCESSING_JOB
+    # Not enough time left to ingest within half of it
+    seconds = sizing.FAST_PATH_SETUP_SECONDS + sizing.estimate_chunks(sizing.FAST_PATH_MAX_BYTES, CHUNK_SIZE) * sizing.SECONDS_PER_CHUNK
+    assert sizing.plan_ingest(sizing.FAST_PATH_MAX_BYTES, 1, remaining_ms=int(2 * seconds * 1000) + 1, chunk_size=CHUNK_SIZE)["mode"] == sizing.FAST_PATH
+    assert sizing.plan_ingest(sizing.FAST_PATH_MAX_BYTES, 1, remaining_ms=int(2 * seconds * 1000), chunk_size=CHUNK_SIZE)["mode"] == sizing.PROCESSING_JOB
+
+
+def test_processing_tiers_by_upload_size():
+    for tier, next_tier in zip(sizing.PROCESSING_TIERS, sizing.PROCESSING_TIERS[1:]):
+        at_bound = sizing.plan_ingest(tier["max_bytes"], key_count=100, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)
+        beyond = sizing.plan_ingest(tier["max_bytes"] + 1, key_count=100, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)
+        assert (at_bound["instance_type"], at_bound["instance_count"]) == (tier["instance_type"], tier["max_instances"])
+        assert (beyond["instance_type"], beyond["instance_count"]) == (next_tier["instance_type"], next_tier["max_instances"])
+    assert sizing.plan_ingest(100 * sizing.GB, key_count=100, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)["instance_type"] == sizing.PROCESSING_TIERS[-1]["instance_type"]
+
+
+def test_instances_are_bounded_by_keys_and_runtime_by_limits():
+    single_key = sizing.plan_ingest(2 * sizing.GB, key_count=1, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)
+    assert single_key["instance_count"] == 1
+    assert single_key["volume_size_gb"] == 6
+    small = sizing.plan_ingest(64 * sizing.KB, key_count=20, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)
+    assert small["volume_size_gb"] == sizing.MIN_VOLUME_GB
+    assert small["max_runtime_seconds"] == sizing.MIN_RUNTIME_SECONDS
+    assert sizing.plan_ingest(10 * 1024 * sizing.GB, key_count=1, remaining_ms=REMAINING_MS, chunk_size=CHUNK_SIZE)["max_runtime_seconds"] == sizing.MAX_RUNTIME_SECONDS
@@ -18,6 +18,7 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import os
+import time
 import requests
 import pytest
 import constants
@@ -42,6 +43,53 @@ def test_image_endpoint():
         assert response.status_code == 200
 
 
+def test_image_endpoint_url_output():
+    # System test for the image api, returning the image as a presigned S3 URL
+    with requests.post(
+        os.environ["IMAGE_ENDPOINT"],
+        json={"prompt": "Dog in a superhero outfit", "style": "digital-art", "output": "url", "format": "webp", "thumbnail": True},
+        timeout=180
+    ) as response:
+        assert response.status_code == 200
+        body = response.json()
+    with requests.get(body["response"], timeout=60) as image:
+        assert image.status_code == 200
+        assert image.headers["Content-Type"] == "image/webp"
+    assert body["thumbnail"]["width"] <= 256
+
+
+def test_image_endpoint_samples():
+    # System test for the image api, generating several images, with consecutive seeds, in one request
+    with requests.post(
+        os.environ["IMAGE_ENDPOINT"],
+        json={"prompt": "Dog in a superhero outfit", "style": "digital-art", "quality": "draft", "samples": 3, "seed": 10, "output": "url"},
+        timeout=180
+    ) as response:
+        assert response.status_code == 200
+        body = response.json()
+    assert [sample["seed"] for sample in body["samples"]] == [10, 11, 12]
+    assert len({sample["image"]["key"] for sample in body["samples"]}) == 3
+
+
+def test_image_endpoint_async_job():
+    # System test for the image api, generating the image with an asynchronous job
+    with requests.post(
+        os.environ["IMAGE_ENDPOINT"],
+        json={"prompt": "Dog in a superhero outfit", "style": "digital-art", "async": True},
+        timeout=60
+    ) as response:
+        assert response.status_code == 202
+        job = response.json()
+    job_url = f"{os.environ['IMAGE_ENDPOINT'].rstrip('/')}/jobs/{job['job_id']}"
+    deadline = time.time() + 300
+    while job["status"] not in ["succeeded", "failed"] and time.time() < deadline:
+        with requests.get(job_url, params={"wait": 20}, timeout=60) as response:
+            assert response.status_code == 200
+            job = response.json()
+    assert job["status"] == "succeeded"
+    assert job["result"]["response"].startswith("https://")
+
+
 def test_web_app():
     # System test for the web application, before deploying into production
     with requests.get(os.environ["APP_ENDPOINT"]) as response:
@@ -49,11 +97,31 @@ def test_web_app():
         assert response.headers["Content-Type"] == "text/html"
 
 
+def wait_for_rag_readiness(timeout: int=120) -> dict:
+    # Poll the RAG API readiness probe, until the k-NN index is loaded, or is found to be not hydrated
+    deadline = time.time() + timeout
+    while True:
+        with requests.get(f"{os.environ['RAG_ENDPOINT'].rstrip('/')}/ready", timeout=60) as response:
+            status = response.json()
+        if status.get("ready") or not status.get("index_exists") or time.time() > deadline:
+            return status
+        time.sleep(10)
+
+
+@pytest.mark.skipif(constants.ENABLE_RAG == False, reason="RAG is not enabled")
+def test_rag_readiness():
+    # System test for the RAG api readiness probe, which must report on the k-NN index
+    status = wait_for_rag_readiness()
+    assert "ready" in status
+    assert "index_exists" in status
+
+
 @pytest.mark.skipif(constants.ENABLE_RAG == False, reason="RAG is not enabled")
 def test_rag_endpoint():
     # System test for the text api (with RAG), before deploying into production
     # NOTE: This test does NOT test wether the OpenSearch INDEX is hydrated, but simply that the RAG API is functional.
     #       to be initialized, and hydrated
+    wait_for_rag_readiness()
     with requests.post(
         os.environ["RAG_ENDPOINT"],
         json={"question": "what is the address of the fiat customer center"},